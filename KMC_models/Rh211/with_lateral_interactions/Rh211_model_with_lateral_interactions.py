@@ -10,14 +10,18 @@ Standard settings:
 """
 
 import numpy as np
-from kmos.cli import main as cli_main
 from kmos.types import Action, Bystander, Condition, Project, Site, Species
 from sys import path
 path.append('../..')
 from tools.bep_processes import BEPProcessHolder
+from tools.elimination import eliminate_species
+from tools.structures import add_structure_parameters
+from tools.model_cache import export_model
 
 model_name = 'Rh211_model_with_lateral_interactions'
 COMPILE = False
+# species replaced by mean-field coverages like H, e.g. ['OH']
+ELIMINATED_SPECIES = []
 
 # Project
 pt = Project()
@@ -202,121 +206,8 @@ pt.add_parameter(name='sens_CH3CHO_H_t', value=0.00, adjustable=True, min=-0.4,
 pt.add_parameter(name='sens_CH3CHOH_H_t', value=0.00, adjustable=True, min=-0.4, max=0.4)
 pt.add_parameter(name='sens_O_H_t', value=0.00, adjustable=True, min=-0.4, max=0.4)
 
-# Formation energies
-pt.add_parameter(name='E_O_t', value='-0.19')
-pt.add_parameter(name='E_O_H_t', value='1.13')
-pt.add_parameter(name='E_CH_H_f', value='0.36')
-pt.add_parameter(name='E_CH_t', value=-0.56)
-pt.add_parameter(name='E_CH_CO_t', value=-0.86)
-pt.add_parameter(name='E_CH_H_t', value=0.15)
-pt.add_parameter(name='E_CH_OH_t', value=0.45)
-pt.add_parameter(name='E_CH2_t', value=-0.07)
-pt.add_parameter(name='E_CH2CO_t', value=-1.13)
-pt.add_parameter(name='E_CH3_t', value=-0.23)
-pt.add_parameter(name='E_CH3CH2OH_t', value=-1.13)
-pt.add_parameter(name='E_CH3CHO_t', value=-0.99)
-pt.add_parameter(name='E_CH3CHO_H_t', value=-0.03)
-pt.add_parameter(name='E_CH3CHOH_t', value=-0.86)
-pt.add_parameter(name='E_CH3CHOH_H_t', value=-0.18)
-pt.add_parameter(name='E_CH3CO_t', value=-1.67)
-pt.add_parameter(name='E_CHCO_t', value=-1.31)
-pt.add_parameter(name='E_CHO_t', value=-0.7)
-pt.add_parameter(name='E_CHOH_t', value=-0.22)
-pt.add_parameter(name='E_CO_t', value=-1.7)
-pt.add_parameter(name='E_H_t', value=0.02)
-pt.add_parameter(name='E_H_CH2_t', value=0.44)
-pt.add_parameter(name='E_H_CH2CO_t', value=-0.54)
-pt.add_parameter(name='E_H_CH3_t', value=0.44)
-pt.add_parameter(name='E_H_CH3CO_t', value=-0.77)
-pt.add_parameter(name='E_H_CHCO_t', value=-0.58)
-pt.add_parameter(name='E_H_CO_t', value=-0.29)
-pt.add_parameter(name='E_H_OH_t', value=0.81)
-pt.add_parameter(name='E_HCO_H_t', value=0.61)
-pt.add_parameter(name='E_OH_t', value=-0.14)
-pt.add_parameter(name='E_C_f', value=-0.48)
-pt.add_parameter(name='E_C_H_f', value=0.54)
-pt.add_parameter(name='E_C_OH_f', value=0.07)
-pt.add_parameter(name='E_CH_f', value=-0.47)
-pt.add_parameter(name='E_H_s', value=-0.02)
-pt.add_parameter(name='E_CH_CO_s', value=-0.34)
-pt.add_parameter(name='E_CH_H_s', value=0.21)
-pt.add_parameter(name='E_CH2_s', value=-0.35)
-pt.add_parameter(name='E_CH2_H_s', value=0.05)
-pt.add_parameter(name='E_CH2CO_s', value=-1.51)
-pt.add_parameter(name='E_CH3_s', value=-0.42)
-pt.add_parameter(name='E_CH3_H_s', value=0.11)
-pt.add_parameter(name='E_CH3CHO_s', value=-1.54)
-pt.add_parameter(name='E_CH3CHO_H_s', value=-0.06)
-pt.add_parameter(name='E_CH3CHOH_s', value=-1.07)
-pt.add_parameter(name='E_CH3CHOH_H_s', value=-0.26)
-pt.add_parameter(name='E_CH3CO_s', value=-1.94)
-pt.add_parameter(name='E_CHCO_s', value=-1.51)
-pt.add_parameter(name='E_CO_s', value=-1.85)
-pt.add_parameter(name='E_H_CH2CO_s', value=-0.72)
-pt.add_parameter(name='E_H_CH3CO_s', value=-1.05)
-pt.add_parameter(name='E_H_CHCO_s', value=-0.68)
-pt.add_parameter(name='E_H_OH_s', value=0.56)
-pt.add_parameter(name='E_O_s', value=-0.11)
-pt.add_parameter(name='E_O_H_s', value=1.06)
-pt.add_parameter(name='E_OH_s', value=-0.73)
-
-# Frequencies
-pt.add_parameter(name='f_O_t', value='[359.5, 393.3, 507.0]')
-pt.add_parameter(name='f_O_H_t', value='[130.2, 179.5, 293.7, 497.8, 975.7]')
-pt.add_parameter(name='f_CH_H_f', value='[247.4, 286.7, 460.4, 579.8, 794.5, 958.4, 1325.6, 2936.3]')
-pt.add_parameter(name='f_CH_t', value='[413.0, 437.0, 487.0, 710.0, 735.0, 3045.0]')
-pt.add_parameter(name='f_CH_CO_t', value='[56.0, 56.0, 150.0, 347.0, 373.0, 460.0, 580.0, 767.0, 961.0, 1607.0, 3001.0]')
-pt.add_parameter(name='f_CH_H_t', value='[270.0, 369.0, 382.0, 566.0, 681.0, 955.0, 1998.0, 3025.0]')
-pt.add_parameter(name='f_CH_OH_t', value='[194.0, 314.0, 411.0, 461.0, 643.0, 671.0, 723.0, 755.0, 849.0, 3162.0, 3676.0]')
-pt.add_parameter(name='f_CH2_t', value='[56.0, 306.0, 382.0, 468.0, 663.0, 790.0, 1356.0, 2737.0, 3004.0]')
-pt.add_parameter(name='f_CH2CO_t', value='[56.0, 142.0, 169.0, 291.0, 350.0, 435.0, 565.0, 621.0, 871.0, 930.0, 1035.0, 1295.0, 1674.0, 2998.0, 3071.0]')
-pt.add_parameter(name='f_CH3_t', value='[56.0, 114.0, 168.0, 622.0, 686.0, 703.0, 1382.0, 1417.0, 1576.0, 3026.0, 3093.0, 3099.0]')
-pt.add_parameter(name='f_CH3CH2OH_t', value='[56.0, 56.0, 56.0, 56.0, 56.0, 255.0, 324.0, 421.0, 479.0, 732.0, 867.0, 1009.0, 1087.0, 1136.0, 1254.0, 1264.0, 1394.0, 1419.0, 1432.0, 1462.0, 1491.0, 2887.0, 2966.0, 2984.0, 3029.0, 3146.0, 3726.0]')
-pt.add_parameter(name='f_CH3CHO_t', value='[56.0, 61.0, 93.0, 134.0, 227.0, 361.0, 430.0, 516.0, 737.0, 928.0, 1037.0, 1062.0, 1128.0, 1287.0, 1321.0, 1408.0, 1443.0, 2933.0, 2974.0, 3000.0, 3063.0]')
-pt.add_parameter(name='f_CH3CHO_H_t', value='[56.0, 56.0, 123.0, 183.0, 208.0, 232.0, 385.0, 511.0, 578.0, 810.0, 900.0, 999.0, 1054.0, 1084.0, 1129.0, 1316.0, 1335.0, 1424.0, 1453.0, 2906.0, 2945.0, 2984.0, 3054.0]')
-pt.add_parameter(name='f_CH3CHOH_t', value='[56.0, 71.0, 162.0, 228.0, 268.0, 318.0, 446.0, 541.0, 664.0, 773.0, 890.0, 1022.0, 1089.0, 1141.0, 1236.0, 1347.0, 1375.0, 1462.0, 1489.0, 2927.0, 2973.0, 3024.0, 3060.0, 3629.0]')
-pt.add_parameter(name='f_CH3CHOH_H_t', value='[56.0, 56.0, 108.0, 137.0, 183.0, 249.0, 400.0, 460.0, 516.0, 598.0, 820.0, 924.0, 1014.0, 1096.0, 1167.0, 1240.0, 1354.0, 1385.0, 1436.0, 1485.0, 1652.0, 2967.0, 3012.0, 3039.0, 3102.0, 3525.0]')
-pt.add_parameter(name='f_CH3CO_t', value='[56.0, 123.0, 156.0, 228.0, 286.0, 402.0, 469.0, 676.0, 945.0, 1012.0, 1091.0, 1407.0, 1435.0, 1454.0, 1575.0, 3053.0, 3076.0, 3126.0]')
-pt.add_parameter(name='f_CHCO_t', value='[56.0, 195.0, 261.0, 342.0, 401.0, 522.0, 572.0, 755.0, 933.0, 1090.0, 1712.0, 3004.0]')
-pt.add_parameter(name='f_CHO_t', value='[56.0, 72.0, 206.0, 336.0, 452.0, 660.0, 1238.0, 1262.0, 2832.0]')
-pt.add_parameter(name='f_CHOH_t', value='[56.0, 144.0, 202.0, 314.0, 367.0, 569.0, 761.0, 1044.0, 1203.0, 1426.0, 2983.0, 3650.0]')
-pt.add_parameter(name='f_CO_t', value='[60.0, 231.0, 256.0, 303.0, 470.0, 1747.0]')
-pt.add_parameter(name='f_H_t', value='[463.0, 716.0, 982.0]')
-pt.add_parameter(name='f_H_CH2_t', value='[56.0, 234.0, 339.0, 527.0, 615.0, 828.0, 969.0, 1378.0, 1913.0, 2972.0, 3028.0]')
-pt.add_parameter(name='f_H_CH2CO_t', value='[56.0, 123.0, 221.0, 245.0, 344.0, 383.0, 484.0, 602.0, 863.0, 994.0, 1030.0, 1088.0, 1332.0, 1433.0, 1684.0, 3026.0, 3087.0]')
-pt.add_parameter(name='f_H_CH3_t', value='[56.0, 56.0, 56.0, 143.0, 435.0, 740.0, 826.0, 1241.0, 1398.0, 1421.0, 1731.0, 2994.0, 3046.0, 3093.0]')
-pt.add_parameter(name='f_H_CH3CO_t', value='[56.0, 56.0, 56.0, 106.0, 310.0, 367.0, 484.0, 656.0, 750.0, 963.0, 996.0, 1071.0, 1311.0, 1390.0, 1424.0, 1434.0, 1597.0, 2970.0, 2997.0, 3104.0]')
-pt.add_parameter(name='f_H_CHCO_t', value='[104.0, 170.0, 250.0, 276.0, 322.0, 484.0, 565.0, 641.0, 863.0, 947.0, 1089.0, 1670.0, 1876.0, 3058.0]')
-pt.add_parameter(name='f_H_CO_t', value='[71.0, 197.0, 315.0, 376.0, 537.0, 1047.0, 1445.0, 2114.0]')
-pt.add_parameter(name='f_H_OH_t', value='[56.0, 273.0, 312.0, 399.0, 695.0, 831.0, 1111.0, 3615.0]')
-pt.add_parameter(name='f_HCO_H_t', value='[137.0, 231.0, 290.0, 327.0, 493.0, 594.0, 680.0, 911.0, 1105.0, 1166.0, 2929.0]')
-pt.add_parameter(name='f_OH_t', value='[56.0, 341.0, 396.0, 670.0, 718.0, 3682.0]')
-pt.add_parameter(name='f_C_f', value='[303.0, 508.0, 546.0]')
-pt.add_parameter(name='f_C_H_f', value='[157.0, 237.0, 505.0, 512.0, 1065.0]')
-pt.add_parameter(name='f_C_OH_f', value='[56.0, 56.0, 295.0, 464.0, 500.0, 507.0, 669.0, 3698.0]')
-pt.add_parameter(name='f_CH_f', value='[420.0, 428.0, 539.0, 654.0, 677.0, 2979.0]')
-pt.add_parameter(name='f_H_s', value='[292.0, 965.0, 1253.0]')
-pt.add_parameter(name='f_CH_CO_s', value='[56.0, 56.0, 150.0, 347.0, 373.0, 460.0, 580.0, 767.0, 961.0, 1607.0, 3001.0]')
-pt.add_parameter(name='f_CH_H_s', value='[56.0, 380.0, 438.0, 559.0, 657.0, 894.0, 1574.0, 3012.0]')
-pt.add_parameter(name='f_CH2_s', value='[56.0, 336.0, 522.0, 545.0, 577.0, 762.0, 1299.0, 2978.0, 3081.0]')
-pt.add_parameter(name='f_CH2_H_s', value='[62.1, 278.1, 322.8, 504.8, 588.7, 852.4, 953.2, 1338.6, 1815.2, 3008.8, 3082.0]')
-pt.add_parameter(name='f_CH2CO_s', value='[56.0, 56.0, 87.0, 180.0, 390.0, 505.0, 584.0, 644.0, 969.0, 1011.0, 1089.0, 1476.0, 1686.0, 3053.0, 3125.0]')
-pt.add_parameter(name='f_CH3_s', value='[56.0, 56.0, 85.0, 442.0, 594.0, 624.0, 1121.0, 1403.0, 1407.0, 2983.0, 3062.0, 3076.0]')
-pt.add_parameter(name='f_CH3_H_s', value='[56.0, 156.0, 193.0, 442.0, 648.0, 657.0, 1073.0, 1219.0, 1320.0, 1376.0, 1416.0, 2642.0, 3026.0, 3096.0]')
-pt.add_parameter(name='f_CH3CHO_s', value='[56.0, 56.0, 99.0, 183.0, 261.0, 319.0, 390.0, 502.0, 697.0, 928.0, 1030.0, 1109.0, 1210.0, 1375.0, 1404.0, 1451.0, 1519.0, 2972.0, 3014.0, 3062.0, 3113.0]')
-pt.add_parameter(name='f_CH3CHO_H_s', value='[56.0, 56.0, 123.0, 183.0, 208.0, 232.0, 385.0, 511.0, 578.0, 810.0, 900.0, 999.0, 1054.0, 1084.0, 1129.0, 1316.0, 1335.0, 1424.0, 1453.0, 2906.0, 2945.0, 2984.0, 3054.0]')
-pt.add_parameter(name='f_CH3CHOH_s', value='[56.0, 56.0, 65.0, 165.0, 209.0, 240.0, 374.0, 458.0, 587.0, 837.0, 904.0, 1061.0, 1072.0, 1140.0, 1243.0, 1363.0, 1417.0, 1449.0, 1532.0, 2883.0, 2956.0, 2987.0, 3098.0, 3678.0]')
-pt.add_parameter(name='f_CH3CHOH_H_s', value='[56.0, 56.0, 108.0, 137.0, 183.0, 249.0, 400.0, 460.0, 516.0, 598.0, 820.0, 924.0, 1014.0, 1096.0, 1167.0, 1240.0, 1354.0, 1385.0, 1436.0, 1485.0, 1652.0, 2967.0, 3012.0, 3039.0, 3102.0, 3525.0]')
-pt.add_parameter(name='f_CH3CO_s', value='[56.0, 56.0, 103.0, 161.0, 262.0, 378.0, 501.0, 593.0, 900.0, 1021.0, 1100.0, 1301.0, 1428.0, 1445.0, 1476.0, 3040.0, 3074.0, 3100.0]')
-pt.add_parameter(name='f_CHCO_s', value='[56.0, 203.0, 238.0, 327.0, 377.0, 528.0, 565.0, 669.0, 1000.0, 1134.0, 2086.0, 3128.0]')
-pt.add_parameter(name='f_CO_s', value='[56.0, 245.0, 305.0, 332.0, 383.0, 1842.0]')
-pt.add_parameter(name='f_H_CH2CO_s', value='[56.0, 123.0, 221.0, 245.0, 344.0, 383.0, 484.0, 602.0, 863.0, 994.0, 1030.0, 1088.0, 1332.0, 1433.0, 1684.0, 3026.0, 3087.0]')
-pt.add_parameter(name='f_H_CH3CO_s', value='[56.0, 56.0, 56.0, 106.0, 310.0, 367.0, 484.0, 656.0, 750.0, 963.0, 996.0, 1071.0, 1311.0, 1390.0, 1424.0, 1434.0, 1597.0, 2970.0, 2997.0, 3104.0]')
-pt.add_parameter(name='f_H_CHCO_s', value='[104.0, 170.0, 250.0, 276.0, 322.0, 484.0, 565.0, 641.0, 863.0, 947.0, 1089.0, 1670.0, 1876.0, 3058.0]')
-pt.add_parameter(name='f_H_OH_s', value='[56.0, 185.0, 356.0, 409.0, 464.0, 561.0, 1052.0, 3642.0]')
-pt.add_parameter(name='f_O_s', value='[288.0, 332.0, 441.0]')
-pt.add_parameter(name='f_O_H_s', value='[106.0, 218.0, 415.0, 429.0, 938.0]')
-pt.add_parameter(name='f_OH_s', value='[116.0, 214.0, 383.0, 621.0, 683.0, 3719.0]')
+# Formation energies and frequencies
+add_structure_parameters(pt, sources=['additional_structures', 'Yang_structures'], facets=['Rh111', 'Rh211'])
 
 # Interaction parameters
 pt.add_parameter(name='I_C_f_CO_s', value=0.46)
@@ -914,10 +805,20 @@ for (site1, name1), (site2, name2) in [
         action_list=[Action(coord=site1, species='empty'), Action(coord=site2, species='CH')]
     )
 
+if ELIMINATED_SPECIES:
+    report = eliminate_species(process_holder, pt, ELIMINATED_SPECIES)
+    print('Eliminated {} from the lattice, dropped processes: {}'.format(
+        ', '.join('{}_{}'.format(*item) for item in report['eliminated']), ', '.join(report['dropped'])))
+    if report['interactions']:
+        print('Interactions of eliminated species left in the otf rates: {}'.format(', '.join(report['interactions'])))
+    if report['speedup_lower_bound'] is not None:
+        print('Mean-field lower bound of the speed-up: {:.3g}'.format(report['speedup_lower_bound']))
+
 pt = process_holder.add_project_processes(pt)
 
 # Export
 pt.export_xml_file('{}.xml'.format(model_name))
 
 if COMPILE:
-    cli_main('export {}.xml {} -b otf -t'.format(model_name, model_name))
+    # reuses the compiled model of an unchanged xml file, see tools/model_cache.py
+    export_model('{}.xml'.format(model_name), model_name, '-b otf -t')
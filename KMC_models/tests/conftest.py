@@ -0,0 +1,16 @@
+"""
+The tests run from any directory, e.g. python -m pytest KMC_models/tests,
+and import the tools package like the model scripts.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+model_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+models = [
+    os.path.join(model_directory, 'Rh111', 'with_lateral_interactions', 'Rh111_model_with_lateral_interactions.xml'),
+    os.path.join(model_directory, 'Rh211', 'with_lateral_interactions', 'Rh211_model_with_lateral_interactions.xml'),
+    os.path.join(model_directory, 'Rh211', 'without_lateral_interactions',
+                 'Rh211_model_without_lateral_interactions.xml'),
+]
@@ -0,0 +1,65 @@
+import pytest
+
+from tools.acceleration import AcceleratedKMC
+from tools.numpy_kmc import NumpyKMC
+
+# A adsorbs and desorbs (counted), and is converted quickly into B and back
+isomerization_model = """<?xml version="1.0" ?>
+<kmc version="(0, 3)">
+    <meta author="" debug="0" email="" model_dimension="2" model_name="isomerization"/>
+    <species_list default_species="empty">
+        <species name="A" representation="" tags=""/>
+        <species name="B" representation="" tags=""/>
+        <species name="empty" representation="" tags=""/>
+    </species_list>
+    <parameter_list>
+        <parameter adjustable="False" max="0.0" min="0.0" name="k_ads" scale="linear" value="2."/>
+        <parameter adjustable="False" max="0.0" min="0.0" name="k_des" scale="linear" value="1."/>
+        <parameter adjustable="False" max="0.0" min="0.0" name="k_iso" scale="linear" value="10."/>
+    </parameter_list>
+    <lattice cell_size="1.0 0.0 0.0 0.0 1.0 0.0 0.0 0.0 1.0" default_layer="square" representation=""
+             substrate_layer="square">
+        <layer color="#ffffff" name="square">
+            <site default_species="empty" pos="0.5 0.5 0.5" tags="" type="t"/>
+        </layer>
+    </lattice>
+    <process_list>
+        <process enabled="True" name="A_adsorption" rate_constant="k_ads">
+            <condition coord_layer="square" coord_name="t" coord_offset="0 0 0" species="empty"/>
+            <action coord_layer="square" coord_name="t" coord_offset="0 0 0" species="A"/>
+        </process>
+        <process enabled="True" name="A_desorption" rate_constant="k_des" tof_count="{'A_desorption': 1}">
+            <condition coord_layer="square" coord_name="t" coord_offset="0 0 0" species="A"/>
+            <action coord_layer="square" coord_name="t" coord_offset="0 0 0" species="empty"/>
+        </process>
+        <process enabled="True" name="A_B" rate_constant="k_iso">
+            <condition coord_layer="square" coord_name="t" coord_offset="0 0 0" species="A"/>
+            <action coord_layer="square" coord_name="t" coord_offset="0 0 0" species="B"/>
+        </process>
+        <process enabled="True" name="B_A" rate_constant="k_iso">
+            <condition coord_layer="square" coord_name="t" coord_offset="0 0 0" species="B"/>
+            <action coord_layer="square" coord_name="t" coord_offset="0 0 0" species="A"/>
+        </process>
+    </process_list>
+    <output_list/>
+</kmc>
+"""
+
+
+def test_accelerated_tofs(tmp_path):
+    filename = tmp_path / 'isomerization.xml'
+    filename.write_text(isomerization_model)
+    # theta_A = theta_B and k_ads*(1 - 2*theta_A) = k_des*theta_A, tof = k_des*theta_A
+    expected = 2. / 5.
+
+    kmc = NumpyKMC(str(filename), size=(10, 10), seed=1)
+    tof = kmc.sample_tofs(2000, 20000)['A_desorption']
+    assert tof == pytest.approx(expected, rel=0.08)
+
+    accelerated = AcceleratedKMC(str(filename), size=(10, 10), seed=1, window=2000, ratio=2.)
+    # the counted adsorption/desorption pair is never scaled
+    assert accelerated.pairs == [(2, 3)]
+    accelerated_tof = accelerated.sample_tofs(2000, 20000)['A_desorption']
+    assert accelerated.scaling_factors()[('A_B', 'B_A')] < 0.5
+    assert accelerated_tof == pytest.approx(expected, rel=0.08)
+    assert accelerated_tof == pytest.approx(tof, rel=0.1)
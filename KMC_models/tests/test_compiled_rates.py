@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+from conftest import models
+from tools.compiled_rates import CompiledRateConstants
+from tools.rate_constants import RateConstantEvaluator
+from tools.xml_model import XMLModel
+
+conditions = [{}, {'T': 600., 'p_COgas': 1.}, {'T': 450., 'sens_H_CO_t': 0.1}]
+
+
+@pytest.mark.parametrize('filename', models)
+def test_compiled_rate_constants(filename):
+    model = XMLModel.from_file(filename)
+    compiled = CompiledRateConstants.from_model(model)
+    expected = []
+    for condition in conditions:
+        evaluator = RateConstantEvaluator(model.parameters)
+        evaluator.set_parameters(**condition)
+        expected.append([evaluator.evaluate(process.rate_constant) if process.enabled else 0.
+                         for process in model.processes])
+        # the scalar evaluation gives the same floats
+        assert np.array_equal(compiled.evaluate(condition), expected[-1])
+
+    compiled.cache.clear()
+    batch = compiled.evaluate_batch(conditions)
+    assert batch.shape == (len(conditions), len(model.processes))
+    assert np.allclose(batch, expected, rtol=1e-10, atol=0.)
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from tools.convergence import ConvergenceMonitor, confidence_factor, mser_truncation, ratio_estimate
+
+
+def test_mser_truncation():
+    random_state = np.random.RandomState(0)
+    noise = random_state.normal(0., 0.1, 400)
+    assert mser_truncation(noise) < 40
+    # exponential transient, which has decayed below the noise after about 50 values
+    transient = noise + 5. * np.exp(-np.arange(400) / 10.)
+    assert 20 <= mser_truncation(transient) < 100
+    # drift until the end, not stationary
+    assert mser_truncation(noise + np.linspace(0., 5., 400)) is None
+    assert mser_truncation([1., 2., 3.]) is None
+
+
+def test_ratio_estimate():
+    random_state = np.random.RandomState(1)
+    covered = 0
+    for _ in range(200):
+        denominators = random_state.uniform(1., 2., 20)
+        numerators = random_state.poisson(50. * denominators)
+        ratio, half_width, batches = ratio_estimate(numerators, denominators, 0.95, None, 2)
+        assert batches == 20
+        covered += abs(ratio - 50.) <= half_width
+    # coverage of the 95 % confidence intervals
+    assert 0.9 <= covered / 200. <= 0.99
+
+    assert ratio_estimate([1., 2.], [0., 0.], 0.95, None, 2) == (0., np.inf, 2)
+    assert ratio_estimate([3., 4., 5.], [1., 1., 1.], 0.95, 0.2, 10)[1] == np.inf
+
+
+def test_ratio_estimate_correlation():
+    # batches of an AR(1) series are merged until their correlation is small
+    random_state = np.random.RandomState(2)
+    values = np.zeros(1024)
+    for i in range(1, len(values)):
+        values[i] = 0.95 * values[i - 1] + random_state.normal()
+    ratio, half_width, batches = ratio_estimate(10. + values, np.ones(len(values)), 0.95, 0.2, 8)
+    assert batches < len(values)
+    assert ratio == pytest.approx(10. + values.mean())
+    independent = ratio_estimate(10. + values, np.ones(len(values)), 0.95, None, 8)[1]
+    assert half_width > 2. * independent
+
+
+def test_monitor_estimate():
+    random_state = np.random.RandomState(3)
+    monitor = ConvergenceMonitor(['A', 'B'], n_cells=100, batches=20, min_batches=10)
+    for block in range(400):
+        dt = random_state.uniform(0.9, 1.1)
+        coverage = 0.5 + 0.4 * np.exp(-block / 10.) + random_state.normal(0., 0.01)
+        monitor.add(dt, random_state.poisson([200. * dt, 20. * dt]), [coverage, 1. - coverage])
+    estimate = monitor.estimate(target=0.1)
+    assert 0 < estimate['transient'] < 200
+    assert estimate['tofs']['A'][0] == pytest.approx(2., rel=0.02)
+    assert estimate['selectivities']['B'][0] == pytest.approx(1. / 11., rel=0.05)
+    assert estimate['converged']
+
+
+def test_ratio_estimate_odd_merge():
+    """ an odd last batch is added to the last pair instead of being dropped """
+    numerators = np.array([1., 1., 2., 2., 3., 3., 4., 4., 100.])
+    # a max_correlation of -1 merges until fewer than 2*min_batches batches are left
+    ratio, half_width, batches = ratio_estimate(numerators, np.ones(9), 0.95, -1., 2)
+    assert batches == 2
+    assert ratio == pytest.approx(120. / 9.)
+    # merged batches (2, 4, 6, 108) and (6, 114) with times (2, 2, 2, 3) and (4, 5)
+    residuals = np.array([6., 114.]) - ratio * np.array([4., 5.])
+    assert residuals.sum() == pytest.approx(0., abs=1e-10)
+    expected = confidence_factor(0.95, 1) * np.sqrt(residuals.dot(residuals) / 2.) / 4.5
+    assert half_width == pytest.approx(expected)
+
+
+def test_monitor_batches():
+    """ the reported number of batches is the smallest of all tofs, not that of the last one """
+    random_state = np.random.RandomState(4)
+    monitor = ConvergenceMonitor(['A', 'B'], n_cells=1, batches=32, min_batches=4, max_correlation=0.2)
+    trend = 0.
+    for block in range(256):
+        trend = 0.99 * trend + random_state.normal()
+        monitor.add(1., [100. + 20. * trend, 100. + random_state.normal()], [0.5, 0.5])
+    # the AR(1) series of A is stationary, but too short for the transient detection
+    monitor.transient = lambda: 0
+    estimate = monitor.estimate()
+    assert estimate['batches'] < 32
@@ -0,0 +1,24 @@
+from conftest import models
+from tools.ensemble import Ensemble, replica_seeds
+
+
+def test_replica_seeds():
+    seeds = replica_seeds(7, 4)
+    assert len(set(tuple(seed) for seed in seeds)) == 4
+    # more replicas keep the streams of the first ones
+    assert replica_seeds(7, 6)[:4] == seeds
+    assert replica_seeds(8, 4) != seeds
+
+
+def test_worker_count():
+    """ the replicas give the same results with one and with two workers """
+    results = []
+    for workers in [1, 2]:
+        ensemble = Ensemble(models[0], replicas=3, size=(4, 4), parameters={'T': 600.}, relaxation_steps=500,
+                            sampling_steps=500, workers=workers, seed=5)
+        results.append(ensemble.run())
+    for key in ['counts', 'kmc_time', 'kmc_steps', 'coverages']:
+        assert [replica[key] for replica in results[0]['replicas']] == \
+            [replica[key] for replica in results[1]['replicas']]
+    assert len(set(replica['kmc_time'] for replica in results[0]['replicas'])) == 3
+    assert results[0]['tofs'] == results[1]['tofs']
@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+
+from conftest import models
+from tools.numpy_kmc import NumpyKMC, SumTree
+
+# one site per unit cell, A adsorbs with k_ads and desorbs with k_des
+langmuir_model = """<?xml version="1.0" ?>
+<kmc version="(0, 3)">
+    <meta author="" debug="0" email="" model_dimension="2" model_name="langmuir"/>
+    <species_list default_species="empty">
+        <species name="A" representation="" tags=""/>
+        <species name="empty" representation="" tags=""/>
+    </species_list>
+    <parameter_list>
+        <parameter adjustable="False" max="0.0" min="0.0" name="k_ads" scale="linear" value="2."/>
+        <parameter adjustable="False" max="0.0" min="0.0" name="k_des" scale="linear" value="1."/>
+    </parameter_list>
+    <lattice cell_size="1.0 0.0 0.0 0.0 1.0 0.0 0.0 0.0 1.0" default_layer="square" representation=""
+             substrate_layer="square">
+        <layer color="#ffffff" name="square">
+            <site default_species="empty" pos="0.5 0.5 0.5" tags="" type="t"/>
+        </layer>
+    </lattice>
+    <process_list>
+        <process enabled="True" name="A_adsorption" rate_constant="k_ads">
+            <condition coord_layer="square" coord_name="t" coord_offset="0 0 0" species="empty"/>
+            <action coord_layer="square" coord_name="t" coord_offset="0 0 0" species="A"/>
+        </process>
+        <process enabled="True" name="A_desorption" rate_constant="k_des" tof_count="{'A_desorption': 1}">
+            <condition coord_layer="square" coord_name="t" coord_offset="0 0 0" species="A"/>
+            <action coord_layer="square" coord_name="t" coord_offset="0 0 0" species="empty"/>
+        </process>
+    </process_list>
+    <output_list/>
+</kmc>
+"""
+
+
+def check_sums(tree):
+    nodes = np.arange(1, tree.size)
+    assert np.allclose(tree.tree[nodes], tree.tree[2 * nodes] + tree.tree[2 * nodes + 1])
+
+
+def test_sum_tree():
+    random_state = np.random.RandomState(0)
+    rates = random_state.random_sample(37)
+    rates[[3, 10, 11]] = 0.
+    tree = SumTree(len(rates))
+    tree.set_all(rates)
+    check_sums(tree)
+    assert tree.total == pytest.approx(rates.sum())
+
+    for _ in range(20):
+        indices = np.unique(random_state.randint(0, len(rates), 5))
+        rates[indices] = random_state.random_sample(len(indices)) * (random_state.random_sample() > 0.2)
+        tree.update(indices, rates[indices])
+        check_sums(tree)
+        assert np.array_equal(tree.rates(len(rates)), rates)
+
+    # find returns the event whose interval of the cumulative rates contains the value
+    edges = np.concatenate([[0.], np.cumsum(rates)])
+    for value in random_state.random_sample(200) * tree.total:
+        index = tree.find(value)
+        assert rates[index] > 0.
+        assert edges[index] - 1e-12 <= value < edges[index + 1] + 1e-12
+
+
+def test_langmuir_coverage(tmp_path):
+    filename = tmp_path / 'langmuir.xml'
+    filename.write_text(langmuir_model)
+    kmc = NumpyKMC(str(filename), size=(10, 10), seed=1)
+    kmc.do_steps(1000)
+    coverages = []
+    for _ in range(100):
+        kmc.do_steps(100)
+        coverages.append(kmc.get_coverages()['t']['A'])
+    # theta = k_ads/(k_ads + k_des), tof = k_des*theta per site
+    assert np.mean(coverages) == pytest.approx(2. / 3., abs=0.02)
+    assert kmc.sample_tofs(0, 10000)['A_desorption'] == pytest.approx(2. / 3., rel=0.05)
+
+
+def test_restart_with_expression_parameter():
+    """ restart and set_parameters accept values of parameters, which are expressions in the model """
+    kmc = NumpyKMC(models[1], size=(4, 4), seed=0)
+    prefactors = kmc.prefactors.copy()
+    kmc.restart({'H_s_cov': 0.1, 'T': 550.}, seed=1)
+    assert kmc.evaluator.value('H_s_cov') == 0.1
+    changed = kmc.prefactors.copy()
+    assert not np.array_equal(changed, prefactors)
+    assert kmc.do_steps(100) == 100
+
+    other = NumpyKMC(models[1], size=(4, 4), seed=0)
+    other.set_parameters(H_s_cov=0.1, T=550.)
+    assert np.array_equal(other.prefactors, changed)
+    kmc.restart({'H_s_cov': 0.2})
+    assert not np.array_equal(kmc.prefactors, changed)
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from conftest import models
+from tools.rate_constants import RateConstantEvaluator
+from tools.rate_tables import RateTableBuilder
+from tools.xml_model import XMLModel
+
+
+@pytest.mark.parametrize('filename', models[:2])
+def test_rate_tables(filename):
+    """ table factors agree with the otf rates for random bystander occupations """
+    model = XMLModel.from_file(filename)
+    builder = RateTableBuilder(model.parameters)
+    evaluator = RateConstantEvaluator(model.parameters)
+    random_state = np.random.RandomState(0)
+    processes = [process for process in model.processes if process.otf_rate]
+    assert processes
+    for process in processes:
+        table = builder.build(process.otf_rate, process.bystander_list)
+        exponent, energies = evaluator.otf_energies(process.otf_rate)
+        for _ in range(3):
+            counts = {}
+            for bystander in process.bystander_list:
+                if random_state.random_sample() < 0.7:
+                    count = 'nr_%s_%s' % (random_state.choice(bystander.allowed_species), bystander.flag)
+                    counts[count] = counts.get(count, 0) + 1
+            modification = sum(energy * (1 if count == '1' else counts.get(count, 0))
+                               for count, energy in energies.items())
+            assert table.factor(counts) == pytest.approx(np.exp(exponent * modification), rel=1e-12)
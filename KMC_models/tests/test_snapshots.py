@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from conftest import models
+from tools.acceleration import AcceleratedKMC
+from tools.numpy_kmc import NumpyKMC
+from tools.snapshots import pack_lattice, read_lattice, restore_snapshot, save_snapshot, unpack_lattice
+
+
+@pytest.mark.parametrize('n_species', [14, 20])
+def test_pack_lattice(n_species):
+    occupation = np.random.RandomState(0).randint(0, n_species, 101).astype(np.uint8)
+    packed, bits = pack_lattice(occupation, n_species)
+    assert bits == (4 if n_species <= 16 else 8)
+    assert np.array_equal(unpack_lattice(packed, bits, len(occupation)), occupation)
+
+
+@pytest.mark.parametrize('kmc_class', [NumpyKMC, AcceleratedKMC])
+def test_snapshot_round_trip(kmc_class, tmp_path):
+    filename = str(tmp_path / 'run.npz')
+    parameters = {'T': 600.}
+    kmc = kmc_class(models[0], size=(6, 6), parameters=parameters, seed=3)
+    kmc.do_steps(3000)
+    save_snapshot(kmc, filename)
+    lattice = read_lattice(filename)
+    assert lattice.shape == (6, 6, 1)
+    assert np.array_equal(lattice.ravel(), kmc.occupation)
+    kmc.do_steps(2000)
+
+    # a new instance with other parameters and seed continues the run exactly
+    restored = kmc_class(models[0], size=(6, 6), seed=4)
+    restore_snapshot(restored, filename)
+    restored.do_steps(2000)
+    assert np.array_equal(restored.occupation, kmc.occupation)
+    assert np.array_equal(restored.procstat, kmc.procstat)
+    assert restored.kmc_step == kmc.kmc_step
+    assert restored.kmc_time == kmc.kmc_time
+    for attribute in kmc_class.checkpoint_attributes:
+        assert np.array_equal(getattr(restored, attribute), getattr(kmc, attribute))
@@ -0,0 +1,67 @@
+import re
+
+import numpy as np
+import pytest
+
+from conftest import models
+from tools import thermochemistry
+from tools.rate_constants import RateConstantEvaluator
+from tools.xml_model import XMLModel
+
+# standard entropies S(298.15 K, 1 bar) in J/mol/K, NIST Chemistry WebBook
+standard_entropies = {
+    'CO': 197.66,
+    'H2': 130.68,
+    'H2O': 188.84,
+    'CH4': 186.25,
+    'CH3CHO': 263.84,
+    'CH3CH2OH': 281.6,
+}
+avogadro = 6.02214076e23
+
+
+@pytest.mark.parametrize('formula', sorted(standard_entropies))
+def test_gas_entropy(formula):
+    T, dT = 298.15, 1e-3
+    free_energies = [thermochemistry.ideal_gas_free_energy(formula, T + sign * dT, 1.) for sign in [1, -1]]
+    entropy = -(free_energies[0] - free_energies[1]) / (2 * dT) * thermochemistry.eV * avogadro
+    assert entropy == pytest.approx(standard_entropies[formula], rel=0.01)
+
+
+def gas_parameters(model):
+    names = set()
+    for process in model.processes:
+        names.update(re.findall(r'GibbsGas_[A-Za-z0-9]+', process.rate_constant))
+    for value in model.parameters.values():
+        names.update(re.findall(r'GibbsGas_[A-Za-z0-9]+', str(value)))
+    return sorted(names)
+
+
+@pytest.mark.parametrize('filename', models)
+def test_gas_data_of_all_products(filename, capsys):
+    model = XMLModel.from_file(filename)
+    thermochemistry.warned.clear()
+    evaluator = RateConstantEvaluator(model.parameters)
+    for name in gas_parameters(model):
+        evaluator.value(name)
+    assert 'Warning' not in capsys.readouterr().out
+
+
+@pytest.mark.parametrize('filename', models[1:2])
+def test_kmos_rate_constants(filename):
+    """ GibbsGas_ and the rate constants of processes with gas species agree with kmos at 500 K """
+    kmos_utils = pytest.importorskip('kmos.utils')
+    model = XMLModel.from_file(filename)
+    parameters = dict(model.parameters, T=500.)
+    kmos_parameters = dict((name, {'value': value}) for name, value in parameters.items())
+    evaluator = RateConstantEvaluator(parameters)
+
+    for name in gas_parameters(model):
+        assert evaluator.value(name) == pytest.approx(kmos_utils.evaluate_rate_expression(name, kmos_parameters),
+                                                      abs=0.01)
+    processes = [process for process in model.processes if 'GibbsGas_' in process.rate_constant][:10]
+    assert processes
+    for process in processes:
+        expected = kmos_utils.evaluate_rate_expression(process.rate_constant, kmos_parameters)
+        assert evaluator.evaluate(process.rate_constant) == pytest.approx(expected, rel=0.3)
+        assert np.isfinite(expected)
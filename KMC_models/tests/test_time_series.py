@@ -0,0 +1,59 @@
+import os
+
+import numpy as np
+import pytest
+
+from tools.time_series import TimeSeriesReader, TimeSeriesWriter
+
+columns = ['step', 'value']
+
+
+def rows(start, stop):
+    return [[float(i), 0.5 * i] for i in range(start, stop)]
+
+
+@pytest.mark.parametrize('compress', [True, False])
+def test_round_trip(tmp_path, compress):
+    directory = str(tmp_path / 'series')
+    writer = TimeSeriesWriter(directory, columns, chunk_size=10, compress=compress, meta_interval=4)
+    for row in rows(0, 23):
+        writer.append(row)
+
+    # reading during the write: all rows up to the last update of meta.json
+    reader = TimeSeriesReader(directory)
+    assert len(reader) == 20
+    assert isinstance(reader.chunk(1)['value'], np.memmap)
+    assert np.array_equal(reader.column('step'), np.arange(20.))
+    writer.append(rows(23, 24)[0])
+    assert np.array_equal(reader.column('step'), np.arange(24.))
+
+    writer.close()
+    reader.refresh()
+    assert len(reader) == 24
+    assert np.array_equal(reader.read()['value'], 0.5 * np.arange(24.))
+    assert not os.path.isfile(os.path.join(directory, 'tail.npy'))
+    assert os.path.isfile(os.path.join(directory, 'chunk_00000.npz')) == compress
+    assert os.path.isfile(os.path.join(directory, 'chunk_00000.npy')) != compress
+
+
+def test_continue(tmp_path):
+    directory = str(tmp_path / 'series')
+    with TimeSeriesWriter(directory, columns, chunk_size=10) as writer:
+        for row in rows(0, 15):
+            writer.append(row)
+
+    # a continued series keeps the compressed chunks and adds npy chunks until it is closed
+    writer = TimeSeriesWriter(directory, columns, meta_interval=1)
+    assert len(writer) == 15
+    for row in rows(15, 27):
+        writer.append(row)
+    reader = TimeSeriesReader(directory)
+    assert np.array_equal(reader.column('step'), np.arange(27.))
+    assert isinstance(reader.chunk(2)['step'], np.memmap)
+    writer.close()
+    reader.refresh()
+    assert reader.meta['chunk_rows'] == [10, 5, 10, 2]
+    assert np.array_equal(reader.column('value'), 0.5 * np.arange(27.))
+
+    with pytest.raises(ValueError):
+        TimeSeriesWriter(directory, ['step'])
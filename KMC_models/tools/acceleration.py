@@ -0,0 +1,200 @@
+"""
+Temporal acceleration of NumpyKMC by scaling down the rates of fast,
+quasi-equilibrated process pairs, similar to the scheme of Dybeck, Plaisance
+and Neurock, J. Chem. Theory Comput. 13, 1525 (2017).
+
+Process pairs are found from the model, e.g. CO_diff_t_t_E/CO_diff_t_E_t
+or H_CO_t_react/CHO_t_dis: the conditions of one process are the actions of
+the other, up to a translation. Both processes of a pair are scaled by the
+same factor, so the ratio of their rates (detailed balance) is kept. Pairs
+with a tof count, e.g. CH3CHO_ads_t/CH3CHO_des_t, are never scaled, because
+the tofs count their executions per unscaled kmc time.
+
+The run is divided into windows of executed steps. At the end of a window a
+pair is quasi-equilibrated if it was executed at least min_events times and
+its forward and reverse executions differ by at most tolerance times their
+sum, or by at most three standard deviations of a balanced pair. The scaling
+factor of such a pair is changed such that it would have been executed about
+ratio times as often as all other processes together (at least min_events
+times). Pairs, which are executed often but not in equilibrium, are reset to
+a scaling factor of 1. The kmc time advances with the scaled rates, while
+the tofs of the not scaled processes stay unbiased as long as the scaled
+pairs remain quasi-equilibrated.
+
+Usage:
+    kmc = AcceleratedKMC('Rh111_model_with_lateral_interactions.xml', size=(20, 20))
+    tofs = kmc.sample_tofs(100000, 100000)
+    kmc.scaling_factors()
+"""
+from collections import defaultdict
+
+import numpy as np
+
+from .numpy_kmc import NumpyKMC
+
+
+def process_signature(process):
+    """
+    Parameters:
+    -----------
+    process: XMLProcess
+
+    Returns:
+    --------
+    conditions, actions: frozenset of ((offset, site), species)
+        with offsets relative to the smallest offset of the process
+    """
+    coords = [condition.coord for condition in process.condition_list + process.action_list]
+    origin = min(coord.offset for coord in coords)
+
+    def shifted(items):
+        return frozenset(((tuple(np.subtract(item.coord.offset, origin).tolist()), item.coord.name), item.species)
+                         for item in items)
+    return shifted(process.condition_list), shifted(process.action_list)
+
+
+def reversible_pairs(processes):
+    """
+    Parameters:
+    -----------
+    processes: 1-D list of XMLProcess
+
+    Returns:
+    --------
+    pairs: 1-D list of 2-tuples of int
+        (forward, reverse) process numbers, where the reverse process undoes
+        the forward process
+    """
+    signatures = defaultdict(list)
+    for p, process in enumerate(processes):
+        if process.enabled:
+            signatures[process_signature(process)].append(p)
+
+    pairs, paired = [], set()
+    for p, process in enumerate(processes):
+        if p in paired or not process.enabled:
+            continue
+        conditions, actions = process_signature(process)
+        if conditions == actions:
+            continue
+        for q in signatures.get((actions, conditions), []):
+            if q not in paired and q != p:
+                pairs.append((p, q))
+                paired.update([p, q])
+                break
+    return pairs
+
+
+class AcceleratedKMC(NumpyKMC):
+    """
+    NumpyKMC with adaptive scaling of quasi-equilibrated process pairs.
+    The scaling factor of each process is scaling[p], with
+    prefactors = unscaled_prefactors * scaling.
+    """
+    checkpoint_attributes = ['scaling', 'window_procstat', 'window_step']
+
+    def __init__(self, model, size=(20, 20), parameters=None, seed=None, gas_data=None, window=10000,
+                 min_events=20, tolerance=0.3, ratio=10.):
+        """
+        Parameters:
+        -----------
+        model, size, parameters, seed, gas_data: see NumpyKMC
+        window: int
+            number of executed steps between updates of the scaling factors
+        min_events: int
+            executions of a pair in a window to test its equilibrium, and the
+            lowest number of executions a scaled pair is adjusted to
+        tolerance: float
+            largest |forward - reverse|/(forward + reverse) of a
+            quasi-equilibrated pair, beyond the statistical noise
+        ratio: float
+            executions of a scaled pair relative to all executions of the
+            not scaled processes in a window
+        """
+        self.window = window
+        self.min_events = min_events
+        self.tolerance = tolerance
+        self.ratio = ratio
+        NumpyKMC.__init__(self, model, size=size, parameters=parameters, seed=seed, gas_data=gas_data)
+
+    def compile_processes(self):
+        NumpyKMC.compile_processes(self)
+        self.pairs = [pair for pair in reversible_pairs(self.model.processes) if not self.tof_matrix[list(pair)].any()]
+        self.pair_processes = np.array(self.pairs, dtype=int).reshape(-1, 2)
+        self.scaling = np.ones(len(self.model.processes))
+
+    def update_rate_constants(self):
+        NumpyKMC.update_rate_constants(self)
+        self.unscaled_prefactors = self.prefactors
+        self.prefactors = self.unscaled_prefactors * self.scaling
+
+    def reset(self):
+        """ empty lattice, zero time and counters and no scaling """
+        self.scaling = np.ones(len(self.model.processes))
+        self.prefactors = self.unscaled_prefactors.copy()
+        self.window_procstat = np.zeros(len(self.model.processes), dtype=np.int64)
+        self.window_step = 0
+        NumpyKMC.reset(self)
+
+    def do_steps(self, n=1):
+        """
+        Parameters:
+        -----------
+        n: int
+            number of kmc steps
+
+        Returns:
+        --------
+        n: int
+            number of executed steps, smaller than n if no process is possible
+        """
+        executed = 0
+        while executed < n:
+            steps = min(n - executed, self.window - (self.kmc_step - self.window_step))
+            done = NumpyKMC.do_steps(self, steps)
+            executed += done
+            if done < steps:
+                break
+            if self.kmc_step - self.window_step >= self.window:
+                self.update_scaling()
+        return executed
+
+    def update_scaling(self):
+        """ adjust the scaling factors to the executions of the last window """
+        counts = self.procstat - self.window_procstat
+        self.window_procstat = self.procstat.copy()
+        self.window_step = self.kmc_step
+        if not len(self.pairs):
+            return
+
+        forward, reverse = counts[self.pair_processes[:, 0]], counts[self.pair_processes[:, 1]]
+        total = forward + reverse
+        imbalance = np.abs(forward - reverse)
+        equilibrated = (total >= self.min_events) & (
+            (imbalance <= self.tolerance * total) | (imbalance <= 3 * np.sqrt(total)))
+        slow = counts.sum() - total[equilibrated].sum()
+        target = max(self.min_events, self.ratio * slow)
+
+        scaling = self.scaling[self.pair_processes[:, 0]]
+        scaling = np.where(equilibrated | (total < self.min_events),
+                           np.minimum(1., scaling * target / np.maximum(total, 1)), 1.)
+
+        changed = scaling != self.scaling[self.pair_processes[:, 0]]
+        if not changed.any():
+            return
+        processes = self.pair_processes[changed].ravel()
+        self.scaling[self.pair_processes[:, 0]] = scaling
+        self.scaling[self.pair_processes[:, 1]] = scaling
+        self.prefactors = self.unscaled_prefactors * self.scaling
+        events = (processes[:, None] * self.n_cells + np.arange(self.n_cells)).ravel()
+        self.tree.update(events, self.evaluate_rates(events))
+
+    def scaling_factors(self):
+        """
+        Returns:
+        --------
+        factors: dict {(forward, reverse): float}
+            current scaling factor of each process pair by process names
+        """
+        names = [process.name for process in self.model.processes]
+        return dict(((names[p], names[q]), self.scaling[p]) for p, q in self.pairs)
@@ -0,0 +1,152 @@
+"""
+Benchmark of building the models and of evaluating their rates.
+
+For each model script the build phases of every otf process (bystanders,
+rate pairs, reduction and the cache lookup, see BEPProcessHolder.react_otf),
+the xml export of the script and the full rate evaluation of the exported
+model with NumpyKMC are timed, and the operations in the generated otf rates are counted. Results are
+saved as json, so they can be compared between commits.
+
+Usage (from KMC_models, requires kmos):
+    python -m tools.benchmark --output benchmark.json
+    python -m tools.benchmark --output new.json --compare benchmark.json
+"""
+import json
+import os
+import re
+import runpy
+import shutil
+import tempfile
+import time
+
+from .numpy_kmc import NumpyKMC
+
+models = [
+    'Rh111/with_lateral_interactions/Rh111_model_with_lateral_interactions.py',
+    'Rh211/with_lateral_interactions/Rh211_model_with_lateral_interactions.py',
+    'Rh211/without_lateral_interactions/Rh211_model_without_lateral_interactions.py',
+]
+phases = ['bystanders', 'rate_pairs', 'reduction', 'lookup']
+operation_pattern = r'\*\*|(?<![0-9][eE])[\+\-]|[\*/]|\b[a-z]+\('
+
+
+def count_operations(expression):
+    """
+    Number of arithmetic operations and function calls in an expression,
+    e.g. 3 for 'base_rate*exp(alpha*x)'.
+    """
+    return len(re.findall(operation_pattern, expression or ''))
+
+
+def benchmark_model(script, size=(20, 20)):
+    """
+    Run a model script in a temporary directory and time its build.
+
+    Parameters:
+    -----------
+    script: str
+        path of the model script
+    size: 2-tuple of int
+        lattice size for the rate evaluation
+
+    Returns:
+    --------
+    result: dict
+    """
+    from kmos.types import Project
+
+    script = os.path.abspath(script)
+    cwd = os.getcwd()
+    directory = tempfile.mkdtemp()
+    # time the xml export of the script instead of exporting the model again
+    export_times = []
+    export_xml_file = Project.export_xml_file
+
+    def timed_export_xml_file(self, *args, **kwargs):
+        start = time.time()
+        try:
+            return export_xml_file(self, *args, **kwargs)
+        finally:
+            export_times.append(time.time() - start)
+
+    try:
+        os.chdir(directory)
+        Project.export_xml_file = timed_export_xml_file
+        start = time.time()
+        namespace = runpy.run_path(script, run_name='__main__')
+        script_time = time.time() - start
+
+        pt = namespace['pt']
+        xml_file = os.path.join(directory, '%s.xml' % namespace['model_name'])
+        kmc = NumpyKMC(xml_file, size=size)
+        start = time.time()
+        kmc.update_rates()
+        rate_evaluation_time = time.time() - start
+    finally:
+        Project.export_xml_file = export_xml_file
+        os.chdir(cwd)
+        shutil.rmtree(directory)
+
+    timings = namespace['process_holder'].timings
+    processes = {}
+    for process in pt.process_list:
+        processes[process.name] = {
+            'operations': count_operations(process.otf_rate),
+            'bystanders': len(process.bystander_list or []),
+        }
+        if process.name in timings:
+            processes[process.name]['timings'] = timings[process.name]
+
+    totals = dict((phase, sum(timing.get(phase, 0.) for timing in timings.values())) for phase in phases)
+    totals.update({
+        'script': script_time,
+        'export': sum(export_times),
+        'rate_evaluation': rate_evaluation_time,
+        'operations': sum(process['operations'] for process in processes.values()),
+        'otf_processes': sum(1 for process in pt.process_list if process.otf_rate),
+        'cached_processes': sum(1 for timing in timings.values() if timing.get('cached')),
+        'processes': len(processes),
+        'events': len(kmc.model.processes) * kmc.n_cells,
+    })
+    return {'totals': totals, 'processes': processes}
+
+
+def compare(results, reference):
+    """ print the relative change of all totals against reference results """
+    for model in sorted(results):
+        if model not in reference:
+            continue
+        print(model)
+        for key, value in sorted(results[model]['totals'].items()):
+            old = reference[model]['totals'].get(key)
+            if old:
+                print('    %-16s %12.4g %+8.1f%%' % (key, value, 100. * (value - old) / old))
+
+
+def main():
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description='Benchmark the model build and rate evaluation')
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--compare', default=None, help='json file of an earlier benchmark')
+    parser.add_argument('--models', nargs='*', default=models)
+    parser.add_argument('--size', type=int, nargs=2, default=[20, 20])
+    args = parser.parse_args()
+
+    results = {}
+    for script in args.models:
+        name = os.path.splitext(os.path.basename(script))[0]
+        results[name] = benchmark_model(script, args.size)
+        print('%s: %s' % (name, ', '.join(
+            '%s %.4g' % item for item in sorted(results[name]['totals'].items()))))
+
+    with open(args.output, 'w') as outfile:
+        json.dump(results, outfile, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as infile:
+            compare(results, json.load(infile))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,48 @@
+import os
 import re
-from copy import deepcopy
+import time
+from copy import copy
+from multiprocessing import Pool
 from string import ascii_letters
 
 import numpy as np
 
+from .rate_tables import RateTableBuilder
+
+try:
+    from multiprocessing import get_all_start_methods, get_context
+except ImportError:
+    # python 2 always forks on posix
+    get_context = None
+
+
+class BystanderTemplate(object):
+    """
+    Lightweight representation of a bystander, used while building the
+    otf rate of a process. kmos bystanders are only created for the final
+    bystander list of a process, see BEPProcessHolder.create_bystander.
+    """
+    __slots__ = ['name', 'offset', 'flag', 'allowed_species', 'bystander']
+
+    def __init__(self, name, offset, flag, allowed_species, bystander):
+        """
+        Parameters:
+        -----------
+        name: str
+            site name of the bystander coordinate
+        offset: tuple of int
+            offset of the bystander coordinate
+        flag: str
+        allowed_species: 1-D list of species names
+        bystander: kmos bystander
+            site bystander this template was generated from
+        """
+        self.name = name
+        self.offset = offset
+        self.flag = flag
+        self.allowed_species = allowed_species
+        self.bystander = bystander
+
 
 class BEPProcessHolder(object):
     """
@@ -16,56 +55,152 @@ class BEPProcessHolder(object):
     }
     warning_messages = {
         'missing_alpha': 'Warning: Missing alpha for %s. Setting alpha to 0.5',
+        'no_fork': 'Warning: Worker processes can not be forked on this platform. Calculating otf rates serially',
     }
 
     def __init__(self):
         """ save basic processes and bystanders of sites """
         self.processes = []
         self.site_bystanders = {}
-        self.param_list = []
+        self.site_bystander_offsets = {}
+        self.parameter_list = []
+        self.parameter_index = {}
+        self.interaction_index = {}
+        self.indexed_interaction_pattern = None
+        self.otf_cache = {}
+        self.otf_cache_patterns = None
+        self.rate_optimizer = None
+        self.rate_tables = None
+        self.timings = {}
+        self.interaction_parameter_pattern = r'I_([^_]+)_([^_]+)_([^_]+)_([^_]+)'
         self.interaction_energy_pattern = (
             r'I_([A-Z0-9]+)_{bystander_site}_{species}_{species_site}'
             '|I_{species}_{species_site}_([A-Z0-9]+)_{bystander_site}'
         )
         self.self_interaction_energy_pattern = r'I_{c1_species}_{c1_site}_{c2_species}_{c2_site}'
+        self.bystander_count_pattern = r'nr_[A-Za-z0-9]+_([A-Za-z]+)'
 
     def add_process(self, **kwargs):
         """ add basic process to this holder """
         self.processes.append(kwargs)
 
     def add_param_list(self, param_list):
+        """ add the project parameters and index the interaction energies """
         self.parameter_list = param_list
+        self.index_parameters()
+
+    def index_parameters(self):
+        """
+        Build lookup tables for the project parameters, so that finding
+        interaction energies doesn't require a regex scan of the whole
+        parameter list for every bystander.
+
+        self.parameter_index maps parameter names to their position in
+        self.parameter_list. self.interaction_index maps
+        (species, species_site, bystander_site) to the list of
+        (interaction, bystander species) pairs matched by
+        self.interaction_energy_pattern, in order of the parameter list.
+        Candidate keys are taken from interaction parameters named
+        I_[species]_[site]_[species]_[site].
+        """
+        self.parameter_index = {}
+        self.interaction_index = {}
+        self.otf_cache = {}
+        for position, param in enumerate(self.parameter_list):
+            if param.name not in self.parameter_index:
+                self.parameter_index[param.name] = position
+
+            names = re.match(self.interaction_parameter_pattern, param.name)
+            if not names:
+                continue
+            species1, site1, species2, site2 = names.groups()
+            for key in set([(species2, site2, site1), (species1, site1, site2)]):
+                pattern = self.interaction_energy_pattern.format(
+                    species=key[0],
+                    species_site=key[1],
+                    bystander_site=key[2]
+                )
+                matches = re.match(pattern, param.name)
+                if matches:
+                    group1, group2 = matches.groups()
+                    if key not in self.interaction_index:
+                        self.interaction_index[key] = []
+                    self.interaction_index[key].append((param.name, group1 or group2))
+        self.indexed_interaction_pattern = self.interaction_energy_pattern
+
+    def get_interaction_parameters(self, species, species_site, bystander_site):
+        """
+        Lookup the interactions of a species at a site with a bystander site.
+        The index is rebuilt, if the interaction_energy_pattern changed
+        after the parameter list was added.
+
+        Returns:
+        --------
+        interactions: 1-D list of 2-tuples
+            [(Interaction, bystander species), ]
+        """
+        if self.indexed_interaction_pattern != self.interaction_energy_pattern:
+            self.index_parameters()
+        return self.interaction_index.get((species, species_site, bystander_site), [])
 
     def add_site_bystanders(self, site_name, site, bystanders):
         """ adds a list of bystanders for a given site """
         self.site_bystanders[site_name] = [site, bystanders]
+        self.site_bystander_offsets[site_name] = [
+            tuple(int(x) for x in bystander.coord.offset - site.offset) for bystander in bystanders
+        ]
+        self.otf_cache = {}
 
     def get_site_bystanders(self, coord, flag):
         """
-        generate bystanders of the given coordinate,
+        generate bystander templates of the given coordinate,
         by using the name and offset of self.site_bystanders
         """
-        bystanders = deepcopy(self.site_bystanders[coord.name][1])
-        offset = coord.offset - self.site_bystanders[coord.name][0].offset
-        for bystander in bystanders:
-            bystander.coord.offset += offset
-            bystander.flag += '_' + flag
+        bystanders = []
+        for bystander, offset in zip(self.site_bystanders[coord.name][1], self.site_bystander_offsets[coord.name]):
+            bystanders.append(BystanderTemplate(
+                bystander.coord.name,
+                tuple(int(x) + y for x, y in zip(coord.offset, offset)),
+                bystander.flag + '_' + flag,
+                list(bystander.allowed_species),
+                bystander,
+            ))
         return bystanders
 
+    @staticmethod
+    def create_bystander(template):
+        """
+        Create a kmos bystander from a bystander template.
+
+        Parameters:
+        -----------
+        template: BystanderTemplate
+
+        Returns:
+        --------
+        bystander: kmos bystander
+        """
+        bystander = copy(template.bystander)
+        bystander.coord = copy(template.bystander.coord)
+        bystander.coord.offset = np.array(template.offset)
+        bystander.allowed_species = template.allowed_species
+        bystander.flag = template.flag
+        return bystander
+
     def get_rate_pairs(self, sign, bystander_list, species, coord):
         """
         Given a bystander list and a species at a given coordinate, we
         calculate the rate modification summands.
         A rate modification summand is generated, if a species at a site
         has an interaction to a bystander in bystander list.
-        We use the kmos project parameter list pt.parameter_list, to lookup
-        these interactions.
+        We use the index of the kmos project parameter list pt.parameter_list,
+        to lookup these interactions.
 
         Parameters:
         -----------
         sign: '+' or '-'
             '+' for initial state and '-' for final state
-        bystander_list: 1-D list of kmos bystanders
+        bystander_list: 1-D list of bystander templates
         species: kmos species
         coord: kmos coord
 
@@ -78,28 +213,17 @@ class BEPProcessHolder(object):
         for bystander in bystander_list:
             # species and initial_coordinate given
             matched_species = []
-            pattern = self.interaction_energy_pattern.format(
-                bystander_site=bystander.coord.name,
-                species=species,
-                species_site=coord.name
-            )
-
-            for parameter in self.parameter_list:
-                matches = re.match(pattern, parameter.name)
-                if matches:
-                    group1, group2 = matches.groups()
-                    if group1:
-                        matched_species.append(group1)
-                    else:
-                        matched_species.append(group2)
-
-                    # summands within reaction rate adjustment, e.g. lines 2 and 3 in the following comment
-                    # otf_rate=('base_rate*exp(beta*alpha_CO_des*('
-                    #           'I_CO_cus_CO_cus*nr_CO_nn_cus + I_O_cus_CO_cus*nr_O_nn_cus +'
-                    #           'I_CO_cus_CO_br*nr_CO_nn_br + I_O_br_CO_cus*nr_O_nn_br'
-                    #           ')*eV)')
-                    # rate_pairs.append(sign + parameter.name + '*nr_' + matched_species[-1] + '_' + bystander.flag)
-                    rate_pairs.append((sign, parameter.name, matched_species[-1], bystander.flag))
+            interactions = self.get_interaction_parameters(species, coord.name, bystander.name)
+            for interaction, bystander_species in interactions:
+                matched_species.append(bystander_species)
+
+                # summands within reaction rate adjustment, e.g. lines 2 and 3 in the following comment
+                # otf_rate=('base_rate*exp(beta*alpha_CO_des*('
+                #           'I_CO_cus_CO_cus*nr_CO_nn_cus + I_O_cus_CO_cus*nr_O_nn_cus +'
+                #           'I_CO_cus_CO_br*nr_CO_nn_br + I_O_br_CO_cus*nr_O_nn_br'
+                #           ')*eV)')
+                # rate_pairs.append(sign + interaction + '*nr_' + bystander_species + '_' + bystander.flag)
+                rate_pairs.append((sign, interaction, bystander_species, bystander.flag))
             if bystander.allowed_species:
                 matched_species = list(set(bystander.allowed_species + matched_species))
             bystander.allowed_species = matched_species
@@ -133,6 +257,8 @@ class BEPProcessHolder(object):
     def reduce_rate_modification(rate_modification):
         """
         Reduce the rate_modification arithmetically as much as possible.
+        This greedy reduction is used unless a rate_optimizer is set,
+        see tools.rate_expressions.RateExpressionOptimizer.
 
         Usually the rate_modification looks something like:
         "Interaction1_Energy*Count_of_Interactions1 + Interaction2_Energy*Count_of_Interactions2 + ..."
@@ -189,7 +315,7 @@ class BEPProcessHolder(object):
         # using trees, however computational efficiency is no problem at all here
 
         # remove factors, which cancel each other
-        for key, factors in gathered_factors.items():
+        for key, factors in list(gathered_factors.items()):
             to_remove = []
             for i, factor1 in enumerate(factors):
                 sign1 = factor1[0]
@@ -265,9 +391,13 @@ class BEPProcessHolder(object):
                     c1_site=condition2.coord.name,
                 )
 
-                for param in self.parameter_list:
-                    if param.name == parameter_name1 or param.name == parameter_name2:
-                        interaction_parameters.append(sign + param.name)
+                # keep the order of the parameter list
+                positions = [
+                    self.parameter_index[name] for name in set([parameter_name1, parameter_name2])
+                    if name in self.parameter_index
+                ]
+                for position in sorted(positions):
+                    interaction_parameters.append(sign + self.parameter_list[position].name)
 
         return interaction_parameters
 
@@ -285,30 +415,31 @@ class BEPProcessHolder(object):
 
         Returns:
         --------
-        bystander_list: 1-D list of kmos bystanders
+        bystander_list: 1-D list of bystander templates
         """
         tmp = []
+        tmp_index = {}
         for bystanders in bystander_list:
             for bystander in bystanders:
                 # if there are no allowed species, we can just drop the bystander
                 if not bystander.allowed_species:
                     continue
 
-                tmp_index = -1
-                for i, item in enumerate(tmp):
-                    # if the bystander is already in tmp,
-                    # add allowed species to existing bystander
-                    if item.coord.name == bystander.coord.name and np.all(item.coord.offset == bystander.coord.offset):
-                        tmp_index = i
-                        item.allowed_species = list(set(item.allowed_species + bystander.allowed_species))
+                key = BEPProcessHolder.coordinate_key(bystander)
+                if key not in tmp_index:
+                    tmp_index[key] = len(tmp)
+                    tmp.append(bystander)
+                    continue
 
-                        # self consistency check - if it's the same bystander
-                        # both item and bystander should have the same flag
-                        assert item.flag == bystander.flag, \
-                            BEPProcessHolder.error_messages['flag_self_consistency'] % process_name
+                # if the bystander is already in tmp,
+                # add allowed species to existing bystander
+                item = tmp[tmp_index[key]]
+                item.allowed_species = list(set(item.allowed_species + bystander.allowed_species))
 
-                if tmp_index == -1:
-                    tmp.append(bystander)
+                # self consistency check - if it's the same bystander
+                # both item and bystander should have the same flag
+                assert item.flag == bystander.flag, \
+                    BEPProcessHolder.error_messages['flag_self_consistency'] % process_name
         return tmp
 
     def get_coord_list_bystanders(self, flag_base, coordinates, species):
@@ -325,7 +456,7 @@ class BEPProcessHolder(object):
 
         Returns:
         --------
-        bystanders: 2-D List
+        bystanders: 2-D List of bystander templates
             [[bystanders@coord1], [bystanders@coord2], ...]
         """
         bystanders = []
@@ -345,7 +476,7 @@ class BEPProcessHolder(object):
 
         Parameters:
         -----------
-        coord: kmos coordinate
+        coord: kmos coordinate or bystander template
 
         Returns:
         --------
@@ -353,6 +484,52 @@ class BEPProcessHolder(object):
         """
         return coord.name + ';'.join(map(str, coord.offset))
 
+    @staticmethod
+    def generate_flags(number):
+        """
+        Generate the given number of bystander flags, such that no flag is
+        part of another flag. All flags have the same length, which is the
+        shortest length providing enough combinations of ascii letters,
+        i.e. up to 52 flags are single letters.
+
+        Parameters:
+        -----------
+        number: int
+
+        Returns:
+        --------
+        flags: 1-D list of str
+        """
+        length = 1
+        while len(ascii_letters) ** length < number:
+            length += 1
+
+        flags = []
+        for i in range(number):
+            flag = ''
+            for _ in range(length):
+                i, digit = divmod(i, len(ascii_letters))
+                flag = ascii_letters[digit] + flag
+            flags.append(flag)
+        return flags
+
+    @staticmethod
+    def coordinate_key(coord):
+        """
+        Hashable key of a coordinate, consisting of the name and
+        the integer offset. Used for merging and membership tests.
+
+        Parameters:
+        -----------
+        coord: kmos coordinate or bystander template
+
+        Returns:
+        --------
+        key: tuple
+            (name, (offset_x, offset_y, offset_z))
+        """
+        return coord.name, tuple(int(x) for x in coord.offset)
+
     @staticmethod
     def bystander_in_coordinate_list(bystander, coords):
         """
@@ -360,25 +537,119 @@ class BEPProcessHolder(object):
 
         Parameters:
         -----------
-        bystander: kmos bystander
-        coords: 1-D list of kmos coordinates
+        bystander: bystander template
+        coords: set of coordinate keys, see coordinate_key
 
         Returns:
         --------
         in_list: bool
         """
-        in_list = False
-        for coord in coords:
-            if coord.name == bystander.coord.name and np.all(coord.offset == bystander.coord.offset):
-                in_list = True
-                break
-        return in_list
+        return BEPProcessHolder.coordinate_key(bystander) in coords
+
+    @staticmethod
+    def process_signature(process, alpha):
+        """
+        Generate a translation invariant representation of a process.
+        Processes, which only differ by a lattice offset, share the same
+        signature, the same otf rate and the same (shifted) bystanders.
+
+        Parameters:
+        -----------
+        process: kmos process
+        alpha: str
+
+        Returns:
+        --------
+        signature: tuple
+            alpha and (species, site name, offset relative to the first condition)
+            for each condition and action
+        origin: numpy array
+            offset of the first condition
+        """
+        origin = process['condition_list'][0].coord.offset
+        signature = [alpha]
+        for key in ['condition_list', 'action_list']:
+            signature.append(tuple(
+                (item.species, item.coord.name, tuple(int(x) for x in item.coord.offset - origin))
+                for item in process[key]
+            ))
+        return tuple(signature), origin
+
+    @staticmethod
+    def shift_bystanders(bystanders, offset):
+        """
+        Copy bystanders and shift their coordinates by the given offset.
+
+        Parameters:
+        -----------
+        bystanders: 1-D list of kmos bystanders
+        offset: numpy array
+
+        Returns:
+        --------
+        bystanders: 1-D list of kmos bystanders
+        """
+        shifted_bystanders = []
+        for bystander in bystanders:
+            shifted_bystander = copy(bystander)
+            shifted_bystander.coord = copy(bystander.coord)
+            shifted_bystander.coord.offset = bystander.coord.offset + offset
+            shifted_bystander.allowed_species = list(bystander.allowed_species)
+            shifted_bystanders.append(shifted_bystander)
+        return shifted_bystanders
 
     def react_otf(self, process, alpha):
+        """
+        Looks up the otf rate and bystanders of the given process in the cache
+        of already calculated processes, which are equal up to a lattice offset.
+        If there is no such process, calculate them with calculate_otf.
+        The cache is cleared, if one of the interaction energy patterns changed.
+        Cache hits are recorded in self.timings with cached=True.
+
+        Paramaters:
+        -----------
+        process: kmos process
+        alpha: str
+            Name of the param describing the BEP slope for the given process
+
+        Returns:
+        --------
+        bystanders: 1-D list of bystanders
+        rate_modification: str otf rate
+        """
+        start = time.time()
+        # the otf rates depend on the interaction parameter names
+        patterns = (self.interaction_energy_pattern, self.self_interaction_energy_pattern)
+        if self.otf_cache_patterns != patterns:
+            self.otf_cache = {}
+            self.otf_cache_patterns = patterns
+
+        signature, origin = self.__class__.process_signature(process, alpha)
+        if signature not in self.otf_cache:
+            lookup = time.time() - start
+            bystanders, otf_rate = self.calculate_otf(process, alpha)
+            self.otf_cache[signature] = (origin, bystanders, otf_rate)
+            self.timings[process['name']]['lookup'] = lookup
+            return bystanders, otf_rate
+
+        cached_origin, bystanders, otf_rate = self.otf_cache[signature]
+        bystanders = self.__class__.shift_bystanders(bystanders, origin - cached_origin)
+        self.timings[process['name']] = {
+            'bystanders': 0.,
+            'rate_pairs': 0.,
+            'reduction': 0.,
+            'lookup': time.time() - start,
+            'cached': True,
+        }
+        return bystanders, otf_rate
+
+    def calculate_otf(self, process, alpha):
         """
         First find all bystanders for each site involved in the given process.
         Given the species and calculated bystanders, the otf rate expression is
         calculated. The alpha for the BEP-relation has to be in the project parameters.
+        The time spent on bystanders, rate pairs and reduction is stored in
+        self.timings[process name], see tools.benchmark.
 
         Paramaters:
         -----------
@@ -392,6 +663,7 @@ class BEPProcessHolder(object):
         rate_modification: str otf rate
         """
 
+        start = time.time()
         initial_coordinates = [condition.coord for condition in process['condition_list']]
         initial_species = [condition.species for condition in process['condition_list']]
         final_coordinates = [action.coord for action in process['action_list']]
@@ -403,11 +675,12 @@ class BEPProcessHolder(object):
         # exclude condition / action coordinates from bystanders
         # as we know the species at these positions already
         # (also it is a requirement imposed by the otf backend)
+        initial_coordinate_keys = set(self.__class__.coordinate_key(coord) for coord in initial_coordinates)
         for x_bystanders in [initial_bystanders, final_bystanders]:
             for i, bystanders in enumerate(x_bystanders):
                 x_bystanders[i] = [
                     bystander for bystander in bystanders
-                    if not self.__class__.bystander_in_coordinate_list(bystander, initial_coordinates)
+                    if not self.__class__.bystander_in_coordinate_list(bystander, initial_coordinate_keys)
                 ]
 
         # find bystanders which are bystanders of multiple conditions / actions
@@ -415,7 +688,7 @@ class BEPProcessHolder(object):
         for flag, x_bystanders in [('initial', initial_bystanders), ('final', final_bystanders)]:
             for i, bystanders in enumerate(x_bystanders):
                 for bystander in bystanders:
-                    coord = self.__class__.hashable_coordinate(bystander.coord)
+                    coord = self.__class__.hashable_coordinate(bystander)
                     if coord not in overlap:
                         overlap[coord] = {'initial': [], 'final': []}
                     overlap[coord][flag].append(str(i))
@@ -434,18 +707,19 @@ class BEPProcessHolder(object):
         # create flags which are not part of other flags...
         # otherwise otf will not generate proper fortran files
         # should be fixed in kmos at some point...
-        base = ascii_letters
+        base = self.__class__.generate_flags(len(set(values['flag'] for values in overlap.values())))
         unique_flags = {}
         for x_bystanders in [initial_bystanders, final_bystanders]:
             for bystanders in x_bystanders:
                 for bystander in bystanders:
-                    flag = overlap[self.__class__.hashable_coordinate(bystander.coord)]['flag']
+                    flag = overlap[self.__class__.hashable_coordinate(bystander)]['flag']
                     if flag not in unique_flags:
                         unique_flags[flag] = base[len(unique_flags)]
                     bystander.flag = unique_flags[flag]
 
         # calculate rate pairs and adjust allowed_species for each bystander
         # based on the existing lateral interaction energies in the project parameters
+        rate_pairs_start = time.time()
         rate_pairs = []
         rate_pair_parameters = [
             ('+', initial_bystanders, initial_species, initial_coordinates),
@@ -461,65 +735,169 @@ class BEPProcessHolder(object):
         self_interaction_parameters = self.self_interactions('+', process['condition_list'])
         self_interaction_parameters += self.self_interactions('-', process['action_list'])
 
+        reduction_start = time.time()
         rate_modification = self.__class__.rate_modification(rate_pairs) + ''.join(self_interaction_parameters)
-        rate_modification = self.__class__.reduce_rate_modification(rate_modification)
+        if self.rate_optimizer:
+            rate_modification = self.rate_optimizer.reduce(rate_modification)
+        else:
+            rate_modification = self.__class__.reduce_rate_modification(rate_modification)
 
         # after reducing the rate_modification it is possible, that we can drop bystanders
         # or allowed species within these bystanders
         # (often the case for diffusion processes -> canceling elements)
-        bystanders = [bystander for bystander in bystanders if '_' + bystander.flag in rate_modification]
+        used_flags = set(re.findall(self.bystander_count_pattern, rate_modification))
+        bystanders = [
+            self.__class__.create_bystander(bystander) for bystander in bystanders
+            if bystander.flag in used_flags
+        ]
 
+        self.timings[process['name']] = {
+            'bystanders': rate_pairs_start - start,
+            'rate_pairs': reduction_start - rate_pairs_start,
+            'reduction': time.time() - reduction_start,
+            'lookup': 0.,
+            'cached': False,
+        }
         return bystanders, 'base_rate*exp(%s*beta*(%s)*eV)' % (alpha, rate_modification)
 
     def get_numeric_alpha_value(self, alpha_name, pt):
         """
-        Searches self.param_list for alpha and returns it's numeric value.
+        Searches self.parameter_list for alpha and returns it's numeric value.
         """
-        for param in self.parameter_list:
-            if param.name == alpha_name:
-                return float(param.value)
+        if alpha_name in self.parameter_index:
+            return float(self.parameter_list[self.parameter_index[alpha_name]].value)
 
-    def add_project_processes(self, pt):
-        """ add all processes to the project including otf_rate and bystander_list"""
-        for process in self.processes:
-            alpha = process.pop('alpha', None)
+    def get_process_alpha(self, process, pt):
+        """
+        Pops the BEP slope from the given process and resolves reversed slopes.
+
+        Returns:
+        --------
+        alpha: str
+            alpha expression for the otf rate
+        numeric_alpha: float
+        """
+        alpha = process.pop('alpha', None)
+        if not alpha:
+            if 'diff' in process['name']:
+                # BEP slope for diffusion processes of the same site is 0.5
+                # if process['condition_list'][0].coord.name == process['condition_list'][1].coord.name:
+                #     alpha = 'alpha'
+
+                # for now our assumption is, that diffusion processes always have a BEP slope of alpha=0.5
+                alpha = 'alpha'
             if not alpha:
-                if 'diff' in process['name']:
-                    # BEP slope for diffusion processes of the same site is 0.5
-                    # if process['condition_list'][0].coord.name == process['condition_list'][1].coord.name:
-                    #     alpha = 'alpha'
-
-                    # for now our assumption is, that diffusion processes always have a BEP slope of alpha=0.5
-                    alpha = 'alpha'
-                if not alpha:
-                    output = ''
-                    for condition in process['condition_list']:
-                        output += condition.species + '@' + condition.coord.name + ' + '
-                    output = output[:-2]
-                    output += ' -> '
-                    for condition in process['action_list']:
-                        output += condition.species + '@' + condition.coord.name + ' + '
-                    output = output[:-2]
-                    print(BEPProcessHolder.warning_messages['missing_alpha'] % process['name'] + ' - ' + output)
-
-                    alpha = 'alpha'
-
-            numeric_alpha = None
-            if alpha.startswith('rev_'):
-                numeric_alpha = 1 - self.get_numeric_alpha_value(alpha[4:], pt)
-                alpha = '(1-%s)' % alpha[4:]
-            else:
-                numeric_alpha = self.get_numeric_alpha_value(alpha, pt)
+                output = ''
+                for condition in process['condition_list']:
+                    output += condition.species + '@' + condition.coord.name + ' + '
+                output = output[:-2]
+                output += ' -> '
+                for condition in process['action_list']:
+                    output += condition.species + '@' + condition.coord.name + ' + '
+                output = output[:-2]
+                print(BEPProcessHolder.warning_messages['missing_alpha'] % process['name'] + ' - ' + output)
+
+                alpha = 'alpha'
+
+        numeric_alpha = None
+        if alpha.startswith('rev_'):
+            numeric_alpha = 1 - self.get_numeric_alpha_value(alpha[4:], pt)
+            alpha = '(1-%s)' % alpha[4:]
+        else:
+            numeric_alpha = self.get_numeric_alpha_value(alpha, pt)
+        return alpha, numeric_alpha
+
+    def add_project_processes(self, pt, workers=1, rate_tables=False):
+        """
+        add all processes to the project including otf_rate and bystander_list
 
-            bystander_list, otf_rate = None, None
-            if process['rate_constant'] != '0.0' and abs(numeric_alpha) > 1e-10:
-                bystander_list, otf_rate = self.react_otf(process, alpha)
+        Parameters:
+        -----------
+        pt: kmos project
+        workers: int
+            Number of worker processes used to calculate the otf rates.
+            Processes are always added to the project in their original
+            order, so the exported xml doesn't depend on the number of workers.
+            Timings of calculate_otf are only recorded for workers=1.
+            The workers are forked, because the model scripts have no
+            __main__ guard and would be executed again by spawned workers.
+            Where fork is not available, the otf rates are calculated serially.
+        rate_tables: bool
+            Build the RateTable of every otf rate at the parameter values of
+            pt into self.rate_tables {process name: RateTable}, see
+            tools/rate_tables.py.
+
+        If self.rate_optimizer is set, the parameter sums it shares between
+        processes are added to the project parameters.
 
+        Returns:
+        --------
+        pt: kmos project
+        """
+        otf_processes = []
+        for i, process in enumerate(self.processes):
+            alpha, numeric_alpha = self.get_process_alpha(process, pt)
+            if process['rate_constant'] != '0.0' and abs(numeric_alpha) > 1e-10:
+                otf_processes.append((i, alpha))
+
+        pool = fork_pool(workers, initializer=_init_worker, initargs=(self,)) if workers > 1 else None
+        if workers > 1 and pool is None:
+            print(self.warning_messages['no_fork'])
+        if pool is not None:
+            try:
+                results = pool.map(_react_otf_worker, otf_processes)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [self.react_otf(self.processes[i], alpha) for i, alpha in otf_processes]
+
+        for (i, alpha), (bystander_list, otf_rate) in zip(otf_processes, results):
             if bystander_list and otf_rate:
-                process['bystander_list'] = bystander_list
-                process['otf_rate'] = otf_rate
-
+                if self.rate_optimizer:
+                    otf_rate = self.rate_optimizer.share_parameters(otf_rate)
+                self.processes[i]['bystander_list'] = bystander_list
+                self.processes[i]['otf_rate'] = otf_rate
+
+        if self.rate_optimizer:
+            self.rate_optimizer.add_project_parameters(pt)
+        if rate_tables:
+            self.rate_tables = RateTableBuilder.from_project(pt).build_processes(self.processes)
+        for process in self.processes:
             pt.add_process(**process)
         return pt
 
 
+def fork_pool(workers, **kwargs):
+    """
+    Parameters:
+    -----------
+    workers: int
+    kwargs: see multiprocessing.Pool
+
+    Returns:
+    --------
+    pool: multiprocessing pool of forked worker processes or None, if the
+        platform can not fork
+    """
+    if get_context is not None:
+        if 'fork' not in get_all_start_methods():
+            return None
+        return get_context('fork').Pool(workers, **kwargs)
+    if os.name != 'posix':
+        return None
+    return Pool(workers, **kwargs)
+
+
+# the process holder of a worker process, see BEPProcessHolder.add_project_processes
+_worker_holder = None
+
+
+def _init_worker(holder):
+    global _worker_holder
+    _worker_holder = holder
+
+
+def _react_otf_worker(args):
+    i, alpha = args
+    return _worker_holder.react_otf(_worker_holder.processes[i], alpha)
@@ -0,0 +1,313 @@
+"""
+Compiled evaluation of the rate constants of a model.
+
+All rate_constant expressions and the parameter expressions they use (e.g.
+A or H_t_cov) are parsed once into one expression DAG (directed acyclic
+graph). Equal subterms, e.g. GibbsAds_CO_t+GibbsAds_H_t, are a single node,
+which is evaluated once for all processes, and constant subterms are folded
+at compile time. The inputs of the DAG are the numeric model parameters.
+
+The DAG is evaluated either for one parameter set with python floats, which
+gives the same numbers as RateConstantEvaluator, or for a batch of
+conditions with one numpy operation per node. Results are cached per input
+vector.
+
+Usage:
+    compiled = CompiledRateConstants.from_model(XMLModel.from_file('model.xml'))
+    k = compiled.evaluate({'T': 550.})                                # shape (processes,)
+    K = compiled.evaluate_batch({'T': np.linspace(450., 650., 10000)})  # shape (10000, processes)
+"""
+import ast
+import math
+import operator
+from functools import reduce
+
+import numpy as np
+
+from . import thermochemistry
+from .rate_constants import RateConstantEvaluator
+
+scalar_operations = {
+    'add': operator.add,
+    'sub': operator.sub,
+    'mul': operator.mul,
+    'div': operator.truediv,
+    'pow': operator.pow,
+    'neg': operator.neg,
+    'exp': math.exp,
+    'log': math.log,
+    'sqrt': math.sqrt,
+    'abs': abs,
+    'max': max,
+    'min': min,
+}
+array_operations = {
+    'add': np.add,
+    'sub': np.subtract,
+    'mul': np.multiply,
+    'div': np.true_divide,
+    'pow': np.power,
+    'neg': np.negative,
+    'exp': np.exp,
+    'log': np.log,
+    'sqrt': np.sqrt,
+    'abs': np.abs,
+    'max': lambda *arguments: reduce(np.maximum, arguments),
+    'min': lambda *arguments: reduce(np.minimum, arguments),
+}
+binary_operations = {ast.Add: 'add', ast.Sub: 'sub', ast.Mult: 'mul', ast.Div: 'div', ast.Pow: 'pow'}
+commutative = set(['add', 'mul', 'max', 'min'])
+
+
+def as_number(value):
+    """ float of a numeric parameter value, None for expressions and lists """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class CompiledRateConstants(object):
+    """
+    Rate constants of a list of processes as one expression DAG.
+
+    Each node is a tuple (operation, arguments...), where the arguments of
+    arithmetic operations and functions are node numbers. The nodes are in
+    topological order.
+    """
+    error_messages = {
+        'syntax': 'Can not compile %s: %s',
+        'fixed': 'Parameter %s is fixed in the compiled rate constants, compile them again to change it',
+        'expression': 'Can not evaluate the rate constants: %s',
+    }
+
+    def __init__(self, expressions, evaluator, cache_size=100000):
+        """
+        Parameters:
+        -----------
+        expressions: 1-D list of str or None
+            rate constant of each process, None for a rate constant of zero
+        evaluator: RateConstantEvaluator
+            provides the parameters, gas data, frequencies and the optional
+            harmonic table
+        cache_size: int
+            maximum number of cached parameter sets
+        """
+        self.evaluator = evaluator
+        self.parameters = evaluator.parameters
+        self.cache_size = cache_size
+        self.cache = {}
+
+        self.nodes = []
+        self.node_index = {}
+        self.symbols = {}
+        self.inputs = []
+        self.defaults = {}
+        self.fixed = {}
+        self.tree_size = 0
+        self.outputs = [None if expression is None else self.compile(expression) for expression in expressions]
+
+    @classmethod
+    def from_model(cls, model, gas_data=None, **kwargs):
+        """
+        Parameters:
+        -----------
+        model: XMLModel
+            disabled processes have a rate constant of zero
+        gas_data: dict {formula: dict}
+            see RateConstantEvaluator
+        """
+        expressions = [process.rate_constant if process.enabled else None for process in model.processes]
+        return cls(expressions, RateConstantEvaluator(model.parameters, gas_data), **kwargs)
+
+    def add_node(self, node):
+        """ number of an equal existing node or of the new node """
+        operation, arguments = node[0], node[1:]
+        if operation in commutative:
+            arguments = tuple(sorted(arguments))
+            node = (operation,) + arguments
+        if operation in scalar_operations and all(self.nodes[i][0] == 'constant' for i in arguments):
+            value = scalar_operations[operation](*[self.nodes[i][1] for i in arguments])
+            node = ('constant', value)
+        if node not in self.node_index:
+            self.node_index[node] = len(self.nodes)
+            self.nodes.append(node)
+        return self.node_index[node]
+
+    def constant(self, value):
+        return self.add_node(('constant', value))
+
+    def compile(self, expression):
+        """
+        Parameters:
+        -----------
+        expression: str
+
+        Returns:
+        --------
+        node: int
+        """
+        try:
+            tree = ast.parse(expression.strip(), mode='eval')
+        except SyntaxError as error:
+            raise ValueError(self.error_messages['syntax'] % (expression, error))
+        return self.compile_node(tree.body, expression)
+
+    def compile_node(self, node, expression):
+        self.tree_size += 1
+        if isinstance(node, ast.BinOp) and type(node.op) in binary_operations:
+            return self.add_node((binary_operations[type(node.op)], self.compile_node(node.left, expression),
+                                  self.compile_node(node.right, expression)))
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+            operand = self.compile_node(node.operand, expression)
+            return self.add_node(('neg', operand)) if isinstance(node.op, ast.USub) else operand
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in scalar_operations
+                and not node.keywords):
+            return self.add_node((node.func.id,) + tuple(self.compile_node(argument, expression)
+                                                         for argument in node.args))
+        if isinstance(node, ast.Name):
+            return self.symbol(node.id)
+        value = getattr(node, 'value', getattr(node, 'n', None))
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return self.constant(value)
+        raise ValueError(self.error_messages['syntax'] % (expression, ast.dump(node)))
+
+    def symbol(self, name):
+        """ node of a parameter, unit or derived quantity, see RateConstantEvaluator.value """
+        if name in self.symbols:
+            return self.symbols[name]
+        if name in self.parameters:
+            number = as_number(self.parameters[name])
+            if number is not None:
+                node = self.add_node(('input', name))
+                self.inputs.append(name)
+                self.defaults[name] = number
+            else:
+                self.fixed[name] = self.parameters[name]
+                node = self.compile(str(self.parameters[name]))
+        elif name in RateConstantEvaluator.units:
+            node = self.constant(RateConstantEvaluator.units[name])
+        elif name == 'beta':
+            node = self.add_node(('div', self.constant(1.), self.add_node((
+                'mul', self.constant(thermochemistry.kboltzmann), self.symbol('T')))))
+        elif name.startswith('m_'):
+            node = self.constant(thermochemistry.formula_mass(name[2:]))
+        elif name.startswith('GibbsAds_'):
+            species = name[len('GibbsAds_'):]
+            self.fixed['f_' + species] = self.parameters.get('f_' + species)
+            node = self.add_node(('add', self.symbol('E_' + species),
+                                  self.add_node(('harmonic', species, self.symbol('T')))))
+        elif name.startswith('GibbsGas_'):
+            species = name[len('GibbsGas_'):]
+            formula = species[:-len('gas')] if species.endswith('gas') else species
+            node = self.add_node(('add', self.symbol('E_' + species), self.add_node((
+                'ideal_gas', formula, self.symbol('T'), self.symbol('p_' + species)))))
+        else:
+            raise KeyError(RateConstantEvaluator.error_messages['unknown'] % name)
+        self.symbols[name] = node
+        return node
+
+    def harmonic(self, species, T):
+        table = self.evaluator.harmonic_table
+        if table is not None and species in table and np.ndim(T) == 0:
+            return table.free_energy(species, T)
+        if np.ndim(T) == 0:
+            return float(thermochemistry.harmonic_free_energy(self.evaluator.value('f_' + species), T))
+        temperatures, inverse = np.unique(T, return_inverse=True)
+        return thermochemistry.harmonic_free_energy(self.evaluator.value('f_' + species), temperatures)[inverse]
+
+    def ideal_gas(self, formula, T, pressure):
+        free_energy = thermochemistry.ideal_gas_free_energy(formula, T, pressure, self.evaluator.gas_data.get(formula))
+        return float(free_energy) if np.ndim(T) == 0 else free_energy
+
+    def input_values(self, parameters):
+        """ values of all inputs, parameters replace the defaults """
+        parameters = parameters or {}
+        for name, value in parameters.items():
+            if name in self.fixed and value != self.fixed[name]:
+                raise ValueError(self.error_messages['fixed'] % name)
+        return [as_number(parameters[name]) if name in parameters else self.defaults[name] for name in self.inputs]
+
+    def run(self, inputs, operations):
+        """ values of all nodes for the input values in order of self.inputs """
+        inputs = dict(zip(self.inputs, inputs))
+        values = [None] * len(self.nodes)
+        for i, node in enumerate(self.nodes):
+            operation = node[0]
+            if operation == 'constant':
+                values[i] = node[1]
+            elif operation == 'input':
+                values[i] = inputs[node[1]]
+            elif operation == 'harmonic':
+                values[i] = self.harmonic(node[1], values[node[2]])
+            elif operation == 'ideal_gas':
+                values[i] = self.ideal_gas(node[1], values[node[2]], values[node[3]])
+            else:
+                values[i] = operations[operation](*[values[j] for j in node[1:]])
+        return values
+
+    def evaluate(self, parameters=None):
+        """
+        Parameters:
+        -----------
+        parameters: dict {name: value}
+            parameter values, which replace those of the model, e.g. {'T': 550.}
+
+        Returns:
+        --------
+        rate_constants: 1-D numpy array, shape (processes,)
+        """
+        key = tuple(self.input_values(parameters))
+        if key not in self.cache:
+            try:
+                values = self.run(key, scalar_operations)
+            except (ZeroDivisionError, OverflowError, ValueError) as error:
+                raise ValueError(self.error_messages['expression'] % error)
+            self.store(key, np.array([0. if node is None else values[node] for node in self.outputs]))
+        return self.cache[key].copy()
+
+    def evaluate_batch(self, conditions):
+        """
+        Parameters:
+        -----------
+        conditions: dict {name: 1-D array} or 1-D list of dict {name: value}
+            parameter values of each condition, e.g. {'T': [500., 550.], 'p_COgas': [1., 1.]}
+
+        Returns:
+        --------
+        rate_constants: 2-D numpy array, shape (conditions, processes)
+        """
+        if not isinstance(conditions, dict):
+            names = set(name for condition in conditions for name in condition)
+            conditions = dict((name, [condition.get(name, self.parameters.get(name)) for condition in conditions])
+                              for name in names)
+        arrays = dict((name, np.atleast_1d(np.asarray(values, dtype=float))) for name, values in conditions.items()
+                      if name in self.defaults)
+        self.input_values(dict((name, value) for name, value in conditions.items() if name not in self.defaults))
+        n = max([len(values) for values in arrays.values()] + [1])
+        columns = [np.broadcast_to(arrays[name], (n,)) if name in arrays else np.full(n, self.defaults[name])
+                   for name in self.inputs]
+        keys = list(zip(*[column.tolist() for column in columns])) if columns else [()] * n
+
+        rate_constants = np.zeros((n, len(self.outputs)))
+        cached = [row for row, key in enumerate(keys) if key in self.cache]
+        for row in cached:
+            rate_constants[row] = self.cache[keys[row]]
+        missing = np.setdiff1d(np.arange(n), cached)
+        if len(missing):
+            with np.errstate(divide='ignore', over='ignore', invalid='ignore', under='ignore'):
+                values = self.run([column[missing] for column in columns], array_operations)
+            block = np.zeros((len(missing), len(self.outputs)))
+            for k, node in enumerate(self.outputs):
+                if node is not None:
+                    block[:, k] = values[node]
+            rate_constants[missing] = block
+            if len(self.cache) + len(missing) > self.cache_size:
+                self.cache.clear()
+            self.cache.update(zip([keys[row] for row in missing[:self.cache_size]], block[:self.cache_size]))
+        return rate_constants
+
+    def store(self, key, rate_constants):
+        if len(self.cache) >= self.cache_size:
+            self.cache.clear()
+        self.cache[key] = rate_constants
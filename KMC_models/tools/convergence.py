@@ -0,0 +1,342 @@
+"""
+Steady state and convergence detection of kmc runs with batch means.
+
+A run is observed in blocks of a fixed number of kmc steps. Each block gives
+its kmc time, tof counts and the coverages at its end.
+
+End of the transient: the largest truncation point of the MSER rule
+(marginal standard error, White 1997) of the coverage series and of the
+block tof series of products with at least one count per block on average.
+The truncation point is the number of blocks d, which minimises the squared
+standard error of the mean of the remaining blocks. A minimum in the second
+half of a series means that the transient is not over yet.
+
+Error estimates: the steady state blocks are grouped into batches. The tof of
+a product is the ratio estimator (sum of counts)/(sum of time*cells), its
+selectivity (sum of its counts)/(sum of the counts of all products), with
+the variance of a ratio estimator over the batches. Batches are merged in
+pairs while their lag-1 autocorrelation exceeds max_correlation, an odd
+last batch is added to the last pair, and the remaining correlation rho widens the confidence interval by
+sqrt((1 + rho)/(1 - rho)).
+
+Usage:
+    monitor = run_until_converged(kmc, target=0.05, interval=10000)
+    monitor.estimate()['tofs']['CH4_formation']    # (tof, half width, relative half width)
+"""
+from math import erf, sqrt
+
+import numpy as np
+
+try:
+    from scipy.stats import t as student_t
+except ImportError:
+    student_t = None
+
+
+def normal_quantile(p):
+    """ quantile of the standard normal distribution by bisection """
+    low, high = -10., 10.
+    for _ in range(100):
+        middle = 0.5 * (low + high)
+        if 0.5 * (1. + erf(middle / sqrt(2.))) < p:
+            low = middle
+        else:
+            high = middle
+    return 0.5 * (low + high)
+
+
+def confidence_factor(confidence, degrees_of_freedom):
+    """ two-sided quantile of the t distribution, normal without scipy """
+    p = 0.5 * (1. + confidence)
+    if student_t is not None:
+        return float(student_t.ppf(p, degrees_of_freedom))
+    return normal_quantile(p)
+
+
+def mser_truncation(series):
+    """
+    Parameters:
+    -----------
+    series: 1-D numpy array
+
+    Returns:
+    --------
+    d: int or None
+        number of initial values to drop, None if the minimum of the MSER
+        statistic lies in the second half of the series
+    """
+    series = np.asarray(series, dtype=float)
+    n = len(series)
+    if n < 4:
+        return None
+    # sums of the values and squares of series[d:] for all d
+    tail_sum = np.cumsum(series[::-1])[::-1]
+    tail_squares = np.cumsum(series[::-1] ** 2)[::-1]
+    length = np.arange(n, 0, -1, dtype=float)
+    variance = np.maximum(tail_squares / length - (tail_sum / length) ** 2, 0.)
+    statistic = variance / length
+    half = n // 2
+    d = int(np.argmin(statistic[:half + 1]))
+    if d >= half:
+        return None
+    return d
+
+
+def interval_entry(value, half_width):
+    """ (value, half width, relative half width), inf for a value of 0 """
+    return value, half_width, half_width / abs(value) if value else np.inf
+
+
+def ratio_estimate(numerators, denominators, confidence, max_correlation, min_batches):
+    """
+    Parameters:
+    -----------
+    numerators, denominators: 1-D numpy array
+        sums of each batch
+    confidence: float
+    max_correlation: float or None
+        None for independent batches, without merging and correlation
+        correction
+    min_batches: int
+
+    Returns:
+    --------
+    ratio: float
+    half_width: float
+        half width of the confidence interval, inf with too few batches
+    batches: int
+        number of batches after merging
+    """
+    numerators, denominators = np.asarray(numerators, dtype=float), np.asarray(denominators, dtype=float)
+    total = denominators.sum()
+    if total <= 0.:
+        return 0., np.inf, len(numerators)
+    ratio = numerators.sum() / total
+    while True:
+        residuals = numerators - ratio * denominators
+        squares = residuals.dot(residuals)
+        correlation = residuals[:-1].dot(residuals[1:]) / squares if squares > 0. else 0.
+        if max_correlation is None:
+            correlation = 0.
+            break
+        if correlation <= max_correlation or len(residuals) < 2 * min_batches:
+            break
+        # merge pairs, an odd last batch is added to the last pair, so the residuals still sum to zero
+        even = len(numerators) // 2 * 2
+        merged_numerators = numerators[:even].reshape(-1, 2).sum(axis=1)
+        merged_denominators = denominators[:even].reshape(-1, 2).sum(axis=1)
+        merged_numerators[-1] += numerators[even:].sum()
+        merged_denominators[-1] += denominators[even:].sum()
+        numerators, denominators = merged_numerators, merged_denominators
+    batches = len(numerators)
+    if batches < min_batches:
+        return ratio, np.inf, batches
+    standard_error = sqrt(squares / (batches * (batches - 1))) / denominators.mean()
+    correlation = min(max(correlation, 0.), 0.9)
+    standard_error *= sqrt((1. + correlation) / (1. - correlation))
+    return ratio, confidence_factor(confidence, batches - 1) * standard_error, batches
+
+
+class ConvergenceMonitor(object):
+    """
+    Block observations of a kmc run and their steady state statistics.
+    """
+
+    def __init__(self, tof_names, n_cells, products=None, batches=30, min_batches=10, confidence=0.95,
+                 max_correlation=0.2):
+        """
+        Parameters:
+        -----------
+        tof_names: 1-D list of str
+        n_cells: int
+            number of unit cells of the lattice
+        products: 1-D list of str or None
+            tof names of the selectivities, None for all tofs
+        batches: int
+            number of batches of the steady state blocks
+        min_batches: int
+            fewer batches give no error estimate
+        confidence: float
+            probability of the confidence intervals
+        max_correlation: float
+            largest lag-1 autocorrelation of the batches
+        """
+        self.tof_names = list(tof_names)
+        self.n_cells = n_cells
+        self.products = list(products) if products is not None else list(self.tof_names)
+        self.batches = batches
+        self.min_batches = min_batches
+        self.confidence = confidence
+        self.max_correlation = max_correlation
+        self.times = []
+        self.counts = []
+        self.coverages = []
+        self.previous = None
+        self.result = None
+
+    @classmethod
+    def from_time_series(cls, reader, n_cells, **kwargs):
+        """
+        Parameters:
+        -----------
+        reader: TimeSeriesReader
+            time series of record_run
+        n_cells: int
+        """
+        data = reader.read()
+        tof_names = [column[len('count_'):] for column in reader.columns if column.startswith('count_')]
+        monitor = cls(tof_names, n_cells, **kwargs)
+        coverages = np.array([data[column] for column in reader.columns if column.startswith('cov_')]).T
+        counts = np.array([data['count_' + name] for name in tof_names]).T
+        times = np.diff(np.concatenate([[0.], data['kmc_time']]))
+        counts = np.diff(np.vstack([np.zeros((1, len(tof_names))), counts]), axis=0)
+        for dt, block_counts, block_coverages in zip(times, counts, coverages):
+            monitor.add(dt, block_counts, block_coverages)
+        return monitor
+
+    def add(self, dt, counts, coverages):
+        """
+        Parameters:
+        -----------
+        dt: float
+            kmc time of the block
+        counts: 1-D numpy array
+            tof counts of the block in the order of tof_names
+        coverages: 1-D numpy array
+            coverages at the end of the block
+        """
+        self.times.append(float(dt))
+        self.counts.append(np.asarray(counts, dtype=float))
+        self.coverages.append(np.asarray(coverages, dtype=float))
+
+    def observe(self, kmc):
+        """ add the block since the previous observation of kmc """
+        counts = kmc.procstat.dot(kmc.tof_matrix)
+        if self.previous is None:
+            self.previous = (0., np.zeros(len(counts)))
+        occupation = kmc.occupation.reshape(kmc.n_cells, kmc.n_sites)
+        coverages = np.concatenate([np.bincount(occupation[:, s], minlength=len(kmc.species)) / float(kmc.n_cells)
+                                    for s in range(kmc.n_sites)])
+        self.add(kmc.kmc_time - self.previous[0], counts - self.previous[1], coverages)
+        self.previous = (kmc.kmc_time, counts)
+
+    def __len__(self):
+        return len(self.times)
+
+    def transient(self):
+        """
+        Returns:
+        --------
+        blocks: int or None
+            number of transient blocks, None if the run is not yet stationary
+        """
+        if len(self) < 4:
+            return None
+        times = np.array(self.times)
+        counts = np.array(self.counts).reshape(len(times), len(self.tof_names))
+        # block tofs of rare products are mostly zero, they only add noise
+        frequent = counts.mean(axis=0) >= 1.
+        rates = counts[:, frequent] / np.maximum(times, 1e-300)[:, None]
+        series = np.hstack([np.array(self.coverages), rates])
+        truncation = 0
+        for column in series.T:
+            if np.ptp(column) == 0.:
+                continue
+            d = mser_truncation(column)
+            if d is None:
+                return None
+            truncation = max(truncation, d)
+        return truncation
+
+    def estimate(self, target=None, tofs=None):
+        """
+        Parameters:
+        -----------
+        target: float or None
+            largest relative half width of the monitored tofs for converged
+        tofs: 1-D list of str or None
+            monitored tofs, None for all tofs with at least one count
+
+        Returns:
+        --------
+        estimate: dict
+            transient (blocks), batches (the fewest batches of any tof or
+            selectivity after merging), tofs and selectivities
+            {name: (value, half width, relative half width)} and converged
+        """
+        estimate = {'transient': self.transient(), 'batches': 0, 'tofs': {}, 'selectivities': {},
+                    'converged': False}
+        if estimate['transient'] is None:
+            return estimate
+        times = np.array(self.times[estimate['transient']:])
+        counts = np.array(self.counts[estimate['transient']:]).reshape(len(times), len(self.tof_names))
+        batches = min(self.batches, len(times))
+        if batches < self.min_batches:
+            return estimate
+        edges = np.linspace(0, len(times), batches + 1).astype(int)
+        batch_times = np.add.reduceat(times, edges[:-1]) * self.n_cells
+        batch_counts = np.add.reduceat(counts, edges[:-1], axis=0)
+        product_counts = batch_counts[:, [self.tof_names.index(name) for name in self.products]].sum(axis=1)
+
+        merged = []
+        for i, name in enumerate(self.tof_names):
+            value, half_width, merged_batches = ratio_estimate(
+                batch_counts[:, i], batch_times, self.confidence, self.max_correlation, self.min_batches)
+            estimate['tofs'][name] = interval_entry(value, half_width)
+            merged.append(merged_batches)
+        for name in self.products:
+            value, half_width, merged_batches = ratio_estimate(
+                batch_counts[:, self.tof_names.index(name)], product_counts, self.confidence, self.max_correlation,
+                self.min_batches)
+            estimate['selectivities'][name] = interval_entry(value, half_width)
+            merged.append(merged_batches)
+        estimate['batches'] = min(merged) if merged else batches
+
+        if tofs is None:
+            tofs = [name for i, name in enumerate(self.tof_names) if counts[:, i].any()]
+        if target is not None and tofs:
+            estimate['converged'] = all(estimate['tofs'][name][2] <= target for name in tofs)
+        return estimate
+
+
+def run_until_converged(kmc, target=0.05, interval=10000, max_steps=10 ** 8, check_interval=10, tofs=None,
+                        **kwargs):
+    """
+    Run kmc in blocks of interval steps until the relative half width of the
+    confidence interval of every monitored tof is at most target.
+
+    Parameters:
+    -----------
+    kmc: NumpyKMC
+    target: float
+    interval: int
+        kmc steps per block
+    max_steps: int
+    check_interval: int
+        blocks between convergence checks
+    tofs: 1-D list of str or None
+        see ConvergenceMonitor.estimate
+    kwargs: see ConvergenceMonitor
+
+    Returns:
+    --------
+    monitor: ConvergenceMonitor
+        monitor.result is the last estimate
+    """
+    monitor = ConvergenceMonitor(kmc.tof_names, kmc.n_cells, **kwargs)
+    monitor.previous = (kmc.kmc_time, kmc.procstat.dot(kmc.tof_matrix))
+    monitor.result = monitor.estimate(target, tofs)
+    steps = 0
+    while steps < max_steps:
+        n = min(interval, max_steps - steps)
+        executed = kmc.do_steps(n)
+        steps += executed
+        monitor.observe(kmc)
+        if executed < n:
+            break
+        if len(monitor) % check_interval == 0:
+            monitor.result = monitor.estimate(target, tofs)
+            if monitor.result['converged']:
+                return monitor
+    monitor.result = monitor.estimate(target, tofs)
+    return monitor
@@ -0,0 +1,338 @@
+"""
+Mean-field elimination of fast species from the lattice of a model.
+
+Hydrogen is not a lattice species of the models, its coverage is the
+analytic mean-field coverage H_t_cov of H in equilibrium with H2. The same
+is done here for other species X on chosen sites: X is assumed to be in
+quasi-equilibrium with a gas phase reservoir of chemical potential mu_X,
+    X_[site]_cov = 1/(1+exp(beta*(GibbsAds_X_[site]-mu_X)*eV))
+with mu_X the sum of the reference chemical potentials of its elements
+(H from H2, O from H2O and H2, C from CO, H2O and H2), unless given.
+
+The processes of a BEPProcessHolder are rewritten before they are added to
+the project. On each coordinate with an eliminated species
+    X consumed (X -> Y):  rate *= X_cov, the coordinate becomes empty -> Y
+    X produced (Y -> X):  rate *= (1-X_cov), the coordinate becomes Y -> empty
+    X spectator (X -> X): rate *= X_cov, the coordinate is removed
+and coordinates, which are empty before and after, are removed. Processes
+without any change of the lattice left (e.g. the diffusion of X, or the
+exchange of X with the reservoir like H2O_s_ads) are dropped. Their tof
+counts per exchanged X are moved to the remaining processes by their net
+production of X, so e.g. H2O_formation still counts the OH which is turned
+into water. Lateral interactions of the eliminated species are neglected:
+their interaction parameters and the bystanders which allow them stay in the
+otf rates, with counts which are always zero, and are listed in the report.
+
+The speed-up is estimated from the mean-field steady state of the original
+processes: a kmc step advances the time by 1/(sum of all rates), so dropping
+processes speeds up the simulated time per step by
+    (sum of all rates)/(sum of the rates of the remaining processes)
+This is a lower bound only. The mean-field rates of processes without net
+reaction, e.g. diffusion, are about zero, while they take most steps of a
+kmc run, so eliminating a fast diffusing species may give 1.
+
+Usage:
+    report = eliminate_species(process_holder, pt, ['OH'])
+    pt = process_holder.add_project_processes(pt)
+"""
+import re
+from copy import copy
+
+import numpy as np
+
+from .bep_processes import BEPProcessHolder
+
+reference_potentials = {
+    'H': '0.5*GibbsGas_H2gas',
+    'O': '(GibbsGas_H2Ogas-GibbsGas_H2gas)',
+    'C': '(GibbsGas_COgas-GibbsGas_H2Ogas+GibbsGas_H2gas)',
+}
+
+error_messages = {
+    'element': 'No reference chemical potential of element %s in %s, pass chemical_potentials',
+    'tof': 'Tof count %s of the reservoir of %s is not unique: %s',
+}
+warning_messages = {
+    'parameter': 'Warning: Missing parameter E_%s_%s, %s is not eliminated on site %s',
+    'speedup': 'Warning: Could not estimate the speed-up of the elimination (%s)',
+}
+
+
+def chemical_potential(species, chemical_potentials=None):
+    """
+    Parameters:
+    -----------
+    species: str
+        e.g. 'OH'
+    chemical_potentials: dict {species or element: expression}
+        replaces the reference chemical potentials
+
+    Returns:
+    --------
+    mu: str
+        expression of the chemical potential in eV, e.g.
+        '(GibbsGas_H2Ogas-GibbsGas_H2gas)+0.5*GibbsGas_H2gas'
+    """
+    potentials = dict(reference_potentials)
+    potentials.update(chemical_potentials or {})
+    if species in potentials:
+        return potentials[species]
+    terms = []
+    for element, number in re.findall(r'([A-Z][a-z]?)(\d*)', species):
+        if element not in potentials:
+            raise KeyError(error_messages['element'] % (element, species))
+        terms.append(potentials[element] if number in ('', '1') else '%s*%s' % (number, potentials[element]))
+    return '+'.join(terms)
+
+
+def coverage_parameter(species, site):
+    """ name of the mean-field coverage parameter, e.g. OH_t_cov """
+    return '%s_%s_cov' % (species, site)
+
+
+def coverage_expression(species, site, mu):
+    """ Langmuir coverage of species on site in equilibrium with chemical potential mu """
+    return '(1/(1+exp(beta*(GibbsAds_%s_%s-(%s))*eV)))' % (species, site, mu)
+
+
+def rewrite_process(process, eliminated):
+    """
+    Parameters:
+    -----------
+    process: dict
+        process of a BEPProcessHolder
+    eliminated: set of 2-tuples
+        (species, site) pairs to eliminate
+
+    Returns:
+    --------
+    process: dict
+        copy of the process with the eliminated species replaced by coverage
+        factors, or the unchanged process
+    exchange: dict {species: int}
+        net number of each eliminated species produced by the process
+    """
+    key = BEPProcessHolder.hashable_coordinate
+    conditions = dict((key(condition.coord), condition) for condition in process['condition_list'])
+    actions = dict((key(action.coord), action) for action in process['action_list'])
+
+    factors, exchange = [], {}
+    condition_list, action_list = [], []
+    for condition in process['condition_list']:
+        action = actions.get(key(condition.coord))
+        site = condition.coord.name
+        before = condition.species
+        after = action.species if action is not None else before
+        if (before, site) in eliminated and after == before:
+            # spectator, only its coverage enters the rate
+            factors.append(coverage_parameter(before, site))
+            continue
+        if (before, site) in eliminated:
+            factors.append(coverage_parameter(before, site))
+            exchange[before] = exchange.get(before, 0) - 1
+            condition = copy(condition)
+            condition.species = 'empty'
+        if (after, site) in eliminated:
+            factors.append('(1-%s)' % coverage_parameter(after, site))
+            exchange[after] = exchange.get(after, 0) + 1
+            action = copy(action)
+            action.species = 'empty'
+        if (condition.species == 'empty' and action is not None and action.species == 'empty'
+                and (before, after) != ('empty', 'empty')):
+            continue
+        condition_list.append(condition)
+        if action is not None:
+            action_list.append(action)
+    action_list += [action for coordinate, action in actions.items() if coordinate not in conditions]
+
+    if not factors:
+        return process, exchange
+    process = dict(process)
+    process['rate_constant'] = '*'.join(factors + [process['rate_constant']])
+    process['condition_list'] = condition_list
+    process['action_list'] = action_list
+    return process, exchange
+
+
+def changes_lattice(process):
+    """ True if an action of the process changes the species of its coordinate """
+    key = BEPProcessHolder.hashable_coordinate
+    conditions = dict((key(condition.coord), condition.species) for condition in process['condition_list'])
+    return any(conditions.get(key(action.coord)) != action.species for action in process['action_list'])
+
+
+def eliminated_interactions(process_holder, pt, eliminated):
+    """
+    Returns:
+    --------
+    interactions: 1-D list of str
+        names of the interaction parameters I_[species]_[site]_[species]_[site]
+        with an eliminated (species, site)
+    """
+    interactions = []
+    for param in pt.parameter_list:
+        names = re.match(process_holder.interaction_parameter_pattern + '$', param.name)
+        if names is None:
+            continue
+        species1, site1, species2, site2 = names.groups()
+        if (species1, site1) in eliminated or (species2, site2) in eliminated:
+            interactions.append(param.name)
+    return sorted(interactions)
+
+
+def eliminated_bystanders(process_holder, eliminated):
+    """
+    Returns:
+    --------
+    bystanders: 1-D list of 3-tuples
+        (site, bystander site, species) of the site bystanders, which allow
+        an eliminated species
+    """
+    bystanders = set()
+    for site_name, (site, site_bystanders) in process_holder.site_bystanders.items():
+        for bystander in site_bystanders:
+            for species in bystander.allowed_species:
+                if (species, bystander.coord.name) in eliminated:
+                    bystanders.add((site_name, bystander.coord.name, species))
+    return sorted(bystanders)
+
+
+def estimate_speedup(process_holder, pt, dropped, **kwargs):
+    """
+    Parameters:
+    -----------
+    process_holder: BEPProcessHolder
+        with the original processes
+    pt: kmos project
+    dropped: 1-D list of str
+        names of the dropped processes
+    kwargs: passed to MeanFieldModel.steady_state
+
+    Returns:
+    --------
+    speedup: float
+        sum of all mean-field rates over the sum of the remaining ones, a
+        lower bound of the speed-up of a kmc run
+    removed_rate: float
+        sum of the mean-field rates of the dropped processes per unit cell and second
+    """
+    from .mean_field import MeanFieldModel
+
+    model = MeanFieldModel.from_holder(process_holder, pt)
+    rates = model.rates(model.steady_state(**kwargs))
+    names = np.array([process['name'] for process in model.processes])
+    removed_rate = rates[np.isin(names, list(dropped))].sum()
+    return rates.sum() / (rates.sum() - removed_rate), removed_rate
+
+
+def eliminate_species(process_holder, pt, species, sites=None, chemical_potentials=None, estimate=True):
+    """
+    Replace species on the lattice by their mean-field coverages, see the
+    module docstring. Call before process_holder.add_project_processes.
+
+    Parameters:
+    -----------
+    process_holder: BEPProcessHolder
+    pt: kmos project
+        gets the coverage parameters, e.g. OH_t_cov
+    species: 1-D list of str
+        e.g. ['OH', 'O']
+    sites: 1-D list of str or None
+        only eliminate the species on these sites, None for all sites with
+        a formation energy E_[species]_[site]
+    chemical_potentials: dict {species or element: expression}
+        replaces the reference chemical potentials, e.g. {'O': '...'}
+    estimate: bool
+        estimate the speed-up from the mean-field steady state
+
+    Returns:
+    --------
+    report: dict
+        eliminated: 1-D list of (species, site), parameters: 1-D list of str,
+        dropped: 1-D list of process names, rewritten: 1-D list of process
+        names, reservoir_tof: dict {species: {tof name: count per species}},
+        interactions: 1-D list of the interaction parameters of eliminated
+        species, bystanders: 1-D list of (site, bystander site, species) of
+        bystanders, which allow an eliminated species,
+        speedup_lower_bound and removed_rate: float or None
+    """
+    parameters = dict((param.name, param) for param in pt.parameter_list)
+    lattice = set((item.species, item.coord.name) for process in process_holder.processes
+                  for item in process['condition_list'] + process['action_list'])
+
+    eliminated, coverage_parameters = set(), []
+    for name in species:
+        mu = chemical_potential(name, chemical_potentials)
+        for site in sorted(set(site for lattice_species, site in lattice if lattice_species == name)):
+            if sites is not None and site not in sites:
+                continue
+            if 'E_%s_%s' % (name, site) not in parameters:
+                print(warning_messages['parameter'] % (name, site, name, site))
+                continue
+            eliminated.add((name, site))
+            parameter = coverage_parameter(name, site)
+            if parameter in parameters:
+                parameters[parameter].value = coverage_expression(name, site, mu)
+            else:
+                pt.add_parameter(name=parameter, value=coverage_expression(name, site, mu))
+            coverage_parameters.append(parameter)
+
+    rewritten, exchanges = [], []
+    for process in process_holder.processes:
+        new_process, exchange = rewrite_process(process, eliminated)
+        rewritten.append(new_process)
+        exchanges.append(exchange)
+    keep = [changes_lattice(process) for process in rewritten]
+
+    # tof counts of the reservoir processes per exchanged species
+    reservoir_tof = dict((name, {}) for name in species)
+    for process, exchange, kept in zip(rewritten, exchanges, keep):
+        if kept:
+            continue
+        for name, number in exchange.items():
+            if number == 0:
+                continue
+            for tof, count in (process.get('tof_count') or {}).items():
+                per_species = -float(count) / number
+                previous = reservoir_tof[name].setdefault(tof, per_species)
+                if previous != per_species:
+                    raise ValueError(error_messages['tof'] % (tof, name, process['name']))
+
+    for p, (process, exchange, kept) in enumerate(zip(rewritten, exchanges, keep)):
+        if not kept:
+            continue
+        tof_count = dict(process.get('tof_count') or {})
+        for name, number in exchange.items():
+            for tof, per_species in reservoir_tof[name].items():
+                tof_count[tof] = tof_count.get(tof, 0) + number * per_species
+        tof_count = dict((tof, int(count) if count == int(count) else count)
+                         for tof, count in tof_count.items() if count != 0)
+        if tof_count != (process.get('tof_count') or {}):
+            if process is process_holder.processes[p]:
+                process = rewritten[p] = dict(process)
+            if tof_count:
+                process['tof_count'] = tof_count
+            else:
+                process.pop('tof_count', None)
+
+    report = {
+        'eliminated': sorted(eliminated),
+        'parameters': coverage_parameters,
+        'dropped': [process['name'] for process, kept in zip(rewritten, keep) if not kept],
+        'rewritten': [new['name'] for new, old, kept in zip(rewritten, process_holder.processes, keep)
+                      if kept and new is not old],
+        'reservoir_tof': reservoir_tof,
+        'interactions': eliminated_interactions(process_holder, pt, eliminated),
+        'bystanders': eliminated_bystanders(process_holder, eliminated),
+        'speedup_lower_bound': None,
+        'removed_rate': None,
+    }
+    if estimate and report['dropped']:
+        try:
+            report['speedup_lower_bound'], report['removed_rate'] = estimate_speedup(
+                process_holder, pt, report['dropped'])
+        except (RuntimeError, ValueError, KeyError) as error:
+            print(warning_messages['speedup'] % error)
+
+    process_holder.processes = [process for process, kept in zip(rewritten, keep) if kept]
+    return report
@@ -0,0 +1,172 @@
+"""
+Ensembles of independent replicas of one model and condition.
+
+Rare pathways, e.g. the ethanol formation by H_CH3CHOH_t_react, give noisy
+tofs in a single run. An Ensemble runs N replicas on a process pool, each
+with its own random number stream, and merges their sampled tof counts and
+coverages. The replicas are independent, so each one is a batch of the
+ratio estimators of tools/convergence.py and the confidence intervals need no
+autocorrelation correction.
+
+The streams are spawned from one seed with numpy.random.SeedSequence, whose
+children give statistically independent states of the Mersenne twister.
+The replicas run AcceleratedKMC by default, see tools/acceleration.py. A tof
+without counts in all replicas has no error estimate, and a warning is
+printed.
+
+Usage:
+    ensemble = Ensemble('Rh211_model_with_lateral_interactions.xml', replicas=16, workers=8,
+                        parameters={'T': 600.}, relaxation_steps=100000, sampling_steps=100000)
+    result = ensemble.run()
+    result['tofs']['CH3CH2OH_formation']     # (tof, half width, relative half width)
+"""
+from multiprocessing import cpu_count
+
+import numpy as np
+
+from .acceleration import AcceleratedKMC
+from .convergence import confidence_factor, interval_entry, ratio_estimate
+from .kmc_pool import run_pool
+from .xml_model import XMLModel
+
+warning_messages = {
+    'no_counts': 'Warning: no counts of %s in %d replicas, the relative half width is inf',
+}
+
+
+def replica_seeds(seed, replicas):
+    """
+    Parameters:
+    -----------
+    seed: int
+    replicas: int
+
+    Returns:
+    --------
+    seeds: 1-D list of 1-D list of int
+        uint32 seed arrays of independent streams, one per replica
+    """
+    if hasattr(np.random, 'SeedSequence'):
+        children = np.random.SeedSequence(seed).spawn(replicas)
+        return [child.generate_state(8).tolist() for child in children]
+    # older numpy: distinct seed arrays of the Mersenne twister
+    return [[seed, replica] for replica in range(replicas)]
+
+
+class Ensemble(object):
+    """
+    Runs replicas of a model at the same parameters on a process pool.
+    """
+
+    def __init__(self, model, replicas, size=(20, 20), parameters=None, relaxation_steps=10000,
+                 sampling_steps=10000, workers=None, seed=0, products=None, confidence=0.95,
+                 kmc_class=AcceleratedKMC):
+        """
+        Parameters:
+        -----------
+        model: XMLModel or str
+            model or path of the exported xml file
+        replicas: int
+            number of replicas
+        size: 2-tuple of int
+            lattice size of each replica
+        parameters: dict {name: value}
+            parameter values, which replace those of the model
+        relaxation_steps: int
+            kmc steps of each replica before sampling
+        sampling_steps: int
+        workers: int or None
+            number of worker processes, None for all cores
+        seed: int
+            seed of the random number streams
+        products: 1-D list of str or None
+            tof names of the selectivities, None for all tofs
+        confidence: float
+            probability of the confidence intervals
+        kmc_class: see run_pool
+        """
+        if not isinstance(model, XMLModel):
+            model = XMLModel.from_file(model)
+        self.model = model
+        self.replicas = replicas
+        self.size = tuple(size)
+        self.parameters = dict(parameters or {})
+        self.relaxation_steps = relaxation_steps
+        self.sampling_steps = sampling_steps
+        self.workers = workers or cpu_count()
+        self.seeds = replica_seeds(seed, replicas)
+        self.products = products
+        self.confidence = confidence
+        self.kmc_class = kmc_class
+
+    def run(self):
+        """
+        Returns:
+        --------
+        result: dict
+            replicas: 1-D list of the result of each replica
+            tofs, selectivities: dict {name: (value, half width, relative half width)}
+            coverages: dict {site: {species: (mean, half width)}}
+            kmc_time: sum of the sampled kmc time of all replicas
+        """
+        parameters = dict(self.model.parameters)
+        parameters.update(self.parameters)
+        results = list(run_pool(run_replica, list(enumerate(self.seeds)), self.model, self.size,
+                                kmc_class=self.kmc_class, workers=self.workers,
+                                settings=(parameters, self.relaxation_steps, self.sampling_steps)))
+        return self.merge(results)
+
+    def merge(self, results):
+        """ merged statistics of the replica results, see run """
+        tof_names = self.model.tof_names
+        products = self.products if self.products is not None else tof_names
+        n_cells = self.size[0] * self.size[1]
+        counts = np.array([[result['counts'][name] for name in tof_names] for result in results],
+                          dtype=float).reshape(len(results), len(tof_names))
+        times = np.array([result['kmc_time'] for result in results]) * n_cells
+        product_counts = counts[:, [tof_names.index(name) for name in products]].sum(axis=1)
+        missing = [name for i, name in enumerate(tof_names) if not counts[:, i].any()]
+        if missing:
+            print(warning_messages['no_counts'] % (', '.join(missing), len(results)))
+
+        # independent replicas, at least two of them for an error estimate
+        tofs = dict((name, interval_entry(*ratio_estimate(counts[:, i], times, self.confidence, None, 2)[:2]))
+                    for i, name in enumerate(tof_names))
+        selectivities = dict((name, interval_entry(*ratio_estimate(counts[:, tof_names.index(name)], product_counts,
+                                                                   self.confidence, None, 2)[:2]))
+                             for name in products)
+
+        coverages = {}
+        factor = confidence_factor(self.confidence, len(results) - 1) if len(results) > 1 else np.inf
+        for site in self.model.sites:
+            coverages[site] = {}
+            for species in results[0]['coverages'][site]:
+                values = np.array([result['coverages'][site][species] for result in results])
+                error = values.std(ddof=1) / np.sqrt(len(values)) if len(values) > 1 else np.inf
+                coverages[site][species] = (values.mean(), factor * error)
+        return {
+            'replicas': results,
+            'tofs': tofs,
+            'selectivities': selectivities,
+            'coverages': coverages,
+            'kmc_time': float(times.sum() / n_cells),
+        }
+
+
+def run_replica(kmc, settings, argument):
+    """ counts, time and coverages of one replica, see run_pool """
+    replica, seed = argument
+    parameters, relaxation_steps, sampling_steps = settings
+    kmc.restart(parameters, np.array(seed, dtype=np.uint32))
+    kmc.do_steps(relaxation_steps)
+    kmc_time, counts = kmc.kmc_time, kmc.procstat.dot(kmc.tof_matrix)
+    kmc.do_steps(sampling_steps)
+    counts = kmc.procstat.dot(kmc.tof_matrix) - counts
+    return {
+        'replica': replica,
+        'seed': seed,
+        'counts': dict(zip(kmc.tof_names, counts.tolist())),
+        'kmc_time': kmc.kmc_time - kmc_time,
+        'kmc_steps': kmc.kmc_step,
+        'coverages': kmc.get_coverages(),
+    }
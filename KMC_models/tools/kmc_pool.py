@@ -0,0 +1,78 @@
+"""
+Runs of one model on a process pool, shared by Sweep, Ensemble and
+SensitivityAnalysis.
+
+Every worker process builds its kmc model once, in the pool initializer, and
+calls a run function with it for each argument it is given. With a single
+worker the runs are done in the calling process.
+
+Usage:
+    def sample(kmc, settings, seed):
+        kmc.restart(seed=seed)
+        return kmc.sample_tofs(*settings)
+
+    tofs = list(run_pool(sample, range(8), model, (20, 20), settings=(10000, 10000), workers=4))
+"""
+from multiprocessing import Pool
+
+from .acceleration import AcceleratedKMC
+
+
+def run_pool(run, arguments, model, size, parameters=None, kmc_class=AcceleratedKMC, settings=(), workers=1,
+             ordered=True):
+    """
+    Parameters:
+    -----------
+    run: function(kmc, settings, argument)
+        result of one run, a module level function, so it can be pickled
+    arguments: 1-D list
+    model: XMLModel
+    size: 2-tuple of int
+    parameters: dict {name: value} or None
+        parameter values of the kmc model, which replace those of the model
+    kmc_class: NumpyKMC subclass
+        or a factory with the same arguments, e.g.
+        functools.partial(AcceleratedKMC, window=5000)
+    settings: tuple
+        passed to every run
+    workers: int
+        number of worker processes, at most one per argument
+    ordered: bool
+        yield the results in the order of the arguments, else as soon as
+        they are finished
+
+    Returns:
+    --------
+    results: iterator over the results of run
+    """
+    initargs = (run, model, size, parameters, kmc_class, settings)
+    if workers > 1 and len(arguments) > 1:
+        pool = Pool(min(workers, len(arguments)), initializer=_init_worker, initargs=initargs)
+        try:
+            if ordered:
+                results = pool.imap(_run_worker, arguments)
+            else:
+                results = pool.imap_unordered(_run_worker, arguments)
+            for result in results:
+                yield result
+        finally:
+            pool.close()
+            pool.join()
+    elif arguments:
+        _init_worker(*initargs)
+        for argument in arguments:
+            yield _run_worker(argument)
+
+
+# run function, kmc model and settings of a worker process, see run_pool
+_worker = None
+
+
+def _init_worker(run, model, size, parameters, kmc_class, settings):
+    global _worker
+    _worker = (run, kmc_class(model, size=size, parameters=parameters), settings)
+
+
+def _run_worker(argument):
+    run, kmc, settings = _worker
+    return run(kmc, settings, argument)
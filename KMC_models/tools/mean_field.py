@@ -0,0 +1,353 @@
+"""
+Mean-field microkinetic model of the processes of a BEPProcessHolder (or an
+exported xml model).
+
+Each (site, species) pair is a coverage variable theta_v. The rate of a process
+per unit cell is its rate constant times the coverages of its conditions,
+    r_p = k_p*prod_c theta_c (*exp(sum_v G_pv*theta_v) with interactions)
+and the coverages change as d theta/dt = nu^T r with the stoichiometry nu of
+conditions and actions. With interactions the bystander counts of the otf
+rates are replaced by their mean-field averages.
+
+The steady state is found by pseudo-transient continuation: implicit Euler
+steps with growing time steps, which turn into Newton steps. One equation of
+each site is replaced by the normalisation of its coverages. The Jacobian is
+sparse and solved with scipy if available.
+"""
+import numpy as np
+
+try:
+    from scipy import sparse
+    from scipy.sparse.linalg import spsolve
+except ImportError:
+    sparse = None
+
+from .compiled_rates import CompiledRateConstants
+from .rate_constants import RateConstantEvaluator
+
+
+def process_attribute(process, name, default=None):
+    """ attribute of a process dict (BEPProcessHolder) or object (XMLModel) """
+    if isinstance(process, dict):
+        return process.get(name, default)
+    return getattr(process, name, default)
+
+
+class MeanFieldModel(object):
+    """
+    Rate equations and steady state solver of a list of processes.
+    """
+    error_messages = {
+        'action': 'Action of process %s without condition on its coordinate',
+        'convergence': 'No mean-field steady state after %d iterations',
+        'count': 'Bystander count %s of process %s without bystander of flag %s',
+    }
+    max_time_step = 1e30
+
+    def __init__(self, processes, parameters, interactions=False, gas_data=None):
+        """
+        Parameters:
+        -----------
+        processes: 1-D list of process dicts or XMLProcess
+            with name, rate_constant, condition_list, action_list and
+            optionally tof_count, otf_rate and bystander_list
+        parameters: dict {name: value}
+        interactions: bool
+            include the otf rates in mean-field approximation
+        gas_data: dict {formula: dict}
+            see RateConstantEvaluator
+        """
+        self.processes = [process for process in processes if process_attribute(process, 'enabled', True)]
+        self.evaluator = RateConstantEvaluator(parameters, gas_data)
+        self.interactions = interactions
+        self.compile_processes()
+        self.compile_rate_constants()
+        self.update_rate_constants()
+
+    @classmethod
+    def from_holder(cls, process_holder, pt=None, **kwargs):
+        """ processes of a BEPProcessHolder with the parameters of pt or of the holder """
+        parameter_list = pt.parameter_list if pt is not None else process_holder.parameter_list
+        parameters = dict((param.name, param.value) for param in parameter_list)
+        return cls(process_holder.processes, parameters, **kwargs)
+
+    @classmethod
+    def from_xml(cls, model, **kwargs):
+        """ processes and parameters of an XMLModel """
+        return cls(model.processes, model.parameters, **kwargs)
+
+    @staticmethod
+    def coord_key(coord):
+        return coord.name, tuple(int(x) for x in coord.offset)
+
+    def compile_processes(self):
+        """ coverage variables, conditions, stoichiometry and tof counts """
+        self.sites = []
+        variables = set()
+        for process in self.processes:
+            for item in process_attribute(process, 'condition_list') + process_attribute(process, 'action_list'):
+                if item.coord.name not in self.sites:
+                    self.sites.append(item.coord.name)
+                variables.add((item.coord.name, item.species))
+        self.variables = sorted(variables, key=lambda variable: (self.sites.index(variable[0]), variable[1]))
+        self.variable_index = dict((variable, v) for v, variable in enumerate(self.variables))
+        n_variables = len(self.variables)
+
+        # one normalisation row per site, preferably replacing the equation of empty
+        self.site_variables = []
+        self.constraint_rows = []
+        for site in self.sites:
+            indices = [v for v, variable in enumerate(self.variables) if variable[0] == site]
+            self.site_variables.append(indices)
+            empty = [v for v in indices if self.variables[v][1] == 'empty']
+            self.constraint_rows.append((empty or indices)[0])
+
+        width = max(len(process_attribute(process, 'condition_list')) for process in self.processes)
+        self.condition_variables = n_variables * np.ones((len(self.processes), width), dtype=int)
+        self.stoichiometry = np.zeros((len(self.processes), n_variables))
+        self.tof_names = sorted(set(name for process in self.processes
+                                    for name in (process_attribute(process, 'tof_count') or {})))
+        self.tof_matrix = np.zeros((len(self.processes), len(self.tof_names)))
+
+        for p, process in enumerate(self.processes):
+            conditions = {}
+            for k, condition in enumerate(process_attribute(process, 'condition_list')):
+                v = self.variable_index[(condition.coord.name, condition.species)]
+                self.condition_variables[p, k] = v
+                conditions[self.__class__.coord_key(condition.coord)] = v
+            for action in process_attribute(process, 'action_list'):
+                key = self.__class__.coord_key(action.coord)
+                if key not in conditions:
+                    raise ValueError(self.error_messages['action'] % process_attribute(process, 'name'))
+                self.stoichiometry[p, conditions[key]] -= 1
+                self.stoichiometry[p, self.variable_index[(action.coord.name, action.species)]] += 1
+            for name, count in (process_attribute(process, 'tof_count') or {}).items():
+                self.tof_matrix[p, self.tof_names.index(name)] = count
+        self.flux_matrix = np.abs(self.stoichiometry)
+
+    def compile_rate_constants(self):
+        """ rate constants of all processes as one expression DAG """
+        self.compiled_rates = CompiledRateConstants(
+            [process_attribute(process, 'rate_constant') for process in self.processes], self.evaluator)
+
+    def update_rate_constants(self):
+        """ rate constants and mean-field interaction matrix at the current parameter values """
+        self.rate_constants = self.compiled_rates.evaluate(self.evaluator.parameters)
+        self.interaction_matrix = np.zeros((len(self.processes), len(self.variables)))
+        for p, process in enumerate(self.processes):
+            otf_rate = process_attribute(process, 'otf_rate')
+            if not (self.interactions and otf_rate):
+                continue
+            bystanders = process_attribute(process, 'bystander_list') or []
+            exponent, energies = self.evaluator.otf_energies(otf_rate)
+            for count, energy in energies.items():
+                if count == '1':
+                    self.rate_constants[p] *= np.exp(exponent * energy)
+                    continue
+                species, flag = count[len('nr_'):].rsplit('_', 1)
+                if not any(bystander.flag == flag for bystander in bystanders):
+                    raise ValueError(self.error_messages['count'] % (count, process_attribute(process, 'name'), flag))
+                for bystander in bystanders:
+                    v = self.variable_index.get((bystander.coord.name, species))
+                    if bystander.flag == flag and species in bystander.allowed_species and v is not None:
+                        self.interaction_matrix[p, v] += exponent * energy
+        self.compile_jacobian()
+
+    def set_parameters(self, **parameters):
+        """ change parameter values, e.g. set_parameters(T=550) """
+        self.evaluator.set_parameters(**parameters)
+        if any(name in self.compiled_rates.fixed for name in parameters):
+            self.compile_rate_constants()
+        self.update_rate_constants()
+
+    def matrix(self, data, rows, columns, shape):
+        """ sparse matrix if scipy is available, summing duplicate entries """
+        if sparse is not None:
+            return sparse.csr_matrix((data, (rows, columns)), shape=shape)
+        matrix = np.zeros(shape)
+        np.add.at(matrix, (rows, columns), data)
+        return matrix
+
+    def compile_jacobian(self):
+        """
+        Sparsity pattern of the Jacobian d(nu^T r)/d theta. Each entry is
+        nu_pv times one of the rate derivatives of derivatives().
+        """
+        n_processes, width = self.condition_variables.shape
+        n_variables = len(self.variables)
+        self.interaction_entries = np.nonzero(self.interaction_matrix)
+        entry_process = np.concatenate([np.repeat(np.arange(n_processes), width), self.interaction_entries[0]])
+        entry_column = np.concatenate([self.condition_variables.ravel(), self.interaction_entries[1]])
+
+        rows, columns, coefficients, sources = [], [], [], []
+        for p in range(n_processes):
+            entries = np.nonzero((entry_process == p) & (entry_column < n_variables))[0]
+            for v in np.nonzero(self.stoichiometry[p])[0]:
+                rows.append(v * np.ones(len(entries), dtype=int))
+                columns.append(entry_column[entries])
+                coefficients.append(self.stoichiometry[p, v] * np.ones(len(entries)))
+                sources.append(entries)
+        self.jacobian_pattern = tuple(np.concatenate(items) for items in [rows, columns, coefficients, sources])
+
+    def rates(self, theta):
+        """
+        Parameters:
+        -----------
+        theta: numpy array
+            coverages of all variables
+
+        Returns:
+        --------
+        rates: numpy array
+            rate of each process per unit cell
+        """
+        values = np.append(theta, 1.)[self.condition_variables]
+        rates = self.rate_constants * values.prod(axis=1)
+        if self.interactions:
+            rates *= np.exp(self.interaction_matrix.dot(theta))
+        return rates
+
+    def derivatives(self, theta):
+        """
+        Returns:
+        --------
+        rates: numpy array
+        derivatives: numpy array
+            d rate_p / d theta of each condition of each process, followed
+            by those of the nonzero interactions
+        """
+        width = self.condition_variables.shape[1]
+        values = np.append(theta, 1.)[self.condition_variables]
+        factors = self.rate_constants.copy()
+        if self.interactions:
+            factors *= np.exp(self.interaction_matrix.dot(theta))
+        rates = factors * values.prod(axis=1)
+        derivatives = np.stack([factors * np.delete(values, k, axis=1).prod(axis=1) for k in range(width)], axis=1)
+        interaction_process, interaction_column = self.interaction_entries
+        return rates, np.concatenate([
+            derivatives.ravel(),
+            rates[interaction_process] * self.interaction_matrix[interaction_process, interaction_column],
+        ])
+
+    def jacobian(self, theta):
+        """ d(nu^T r)/d theta """
+        rows, columns, coefficients, sources = self.jacobian_pattern
+        derivatives = self.derivatives(theta)[1]
+        return self.matrix(coefficients * derivatives[sources], rows, columns, (len(theta), len(theta)))
+
+    def initial_coverages(self):
+        """ empty sites, or the first species of sites without empty """
+        theta = np.zeros(len(self.variables))
+        theta[self.constraint_rows] = 1.
+        return theta
+
+    def steady_state(self, theta=None, tolerance=1e-8, max_iterations=500):
+        """
+        Parameters:
+        -----------
+        theta: numpy array
+            initial coverages, e.g. the steady state of a similar condition
+        tolerance: float
+            largest residual relative to the total flux of each variable
+        max_iterations: int
+
+        Returns:
+        --------
+        theta: numpy array
+            steady state coverages
+        """
+        n_variables = len(self.variables)
+        theta = self.initial_coverages() if theta is None else np.array(theta, dtype=float)
+        dynamic = np.ones(n_variables)
+        dynamic[self.constraint_rows] = 0.
+
+        # system matrix: 1/dt - jacobian for dynamic rows, normalisation for constraint rows
+        rows, columns, coefficients, sources = self.jacobian_pattern
+        used = dynamic[rows] > 0
+        rows, columns, coefficients, sources = rows[used], columns[used], coefficients[used], sources[used]
+        diagonal = np.nonzero(dynamic)[0]
+        constraint_rows = np.concatenate(
+            [[row] * len(indices) for row, indices in zip(self.constraint_rows, self.site_variables)])
+        constraint_columns = np.concatenate(self.site_variables)
+        system_rows = np.concatenate([rows, diagonal, constraint_rows]).astype(int)
+        system_columns = np.concatenate([columns, diagonal, constraint_columns]).astype(int)
+
+        dt = 1e-3 / max(self.rate_constants.max(), 1.)
+        for _ in range(max_iterations):
+            rates, derivatives = self.derivatives(theta)
+            residual = self.stoichiometry.T.dot(rates)
+            flux = self.flux_matrix.T.dot(rates)
+            normalisation = np.array([theta[indices].sum() - 1. for indices in self.site_variables])
+            if np.all(np.abs(residual * dynamic) <= tolerance * flux) and np.all(np.abs(normalisation) < tolerance):
+                return np.clip(theta, 0., 1.)
+
+            data = np.concatenate([
+                -coefficients * derivatives[sources],
+                np.ones(len(diagonal)) / dt,
+                np.ones(len(constraint_columns)),
+            ])
+            system = self.matrix(data, system_rows, system_columns, (n_variables, n_variables))
+            rhs = residual * dynamic
+            rhs[self.constraint_rows] = -normalisation
+            step = spsolve(system, rhs) if sparse is not None else np.linalg.solve(system, rhs)
+
+            new_theta = theta + step
+            if np.any(new_theta < -1e-3) or not np.all(np.isfinite(new_theta)):
+                dt /= 10.
+                continue
+            theta = new_theta
+            # coverages far below the tolerance can't reach a relative residual
+            # in floating point, accept vanishing Newton steps instead
+            if dt >= self.max_time_step and np.max(np.abs(step)) < 1e-6 * tolerance:
+                return np.clip(theta, 0., 1.)
+            dt = min(100. * dt, self.max_time_step)
+        raise RuntimeError(self.error_messages['convergence'] % max_iterations)
+
+    def coverages(self, theta):
+        """
+        Returns:
+        --------
+        coverages: dict {site: {species: float}}
+        """
+        coverages = dict((site, {}) for site in self.sites)
+        for (site, species), value in zip(self.variables, theta):
+            coverages[site][species] = value
+        return coverages
+
+    def tofs(self, theta):
+        """
+        Returns:
+        --------
+        tofs: dict {tof name: float}
+            turnover frequencies per unit cell and second
+        """
+        return dict(zip(self.tof_names, self.rates(theta).dot(self.tof_matrix)))
+
+    def screen(self, conditions, **kwargs):
+        """
+        Steady states of a list of conditions, each starting from the
+        steady state of the previous one.
+
+        Parameters:
+        -----------
+        conditions: 1-D list of dict {name: value}
+
+        Returns:
+        --------
+        results: 1-D list of dict
+            {'conditions', 'coverages', 'tofs'}
+        """
+        results = []
+        theta = None
+        base_parameters = dict(self.evaluator.parameters)
+        for parameters in conditions:
+            self.evaluator.parameters = dict(base_parameters)
+            self.set_parameters(**parameters)
+            try:
+                theta = self.steady_state(theta, **kwargs)
+            except RuntimeError:
+                theta = self.steady_state(None, **kwargs)
+            results.append({'conditions': parameters, 'coverages': self.coverages(theta), 'tofs': self.tofs(theta)})
+        self.evaluator.parameters = base_parameters
+        self.set_parameters()
+        return results
@@ -0,0 +1,228 @@
+"""
+Cache of compiled kmos models, keyed by the content of the exported xml file.
+
+Exporting with the Fortran backend (kmos export model.xml model -b otf -t)
+compiles the whole model, even when the xml file is the same as in a
+previous build. The key of a build is a hash of the canonical xml (parsed,
+without whitespace between elements and with sorted attributes), the export
+options, the kmos, python and numpy versions and the version of the Fortran
+compiler ($FC, else gfortran). A compiled model directory
+is stored once per key and copied to the export directory of later builds
+with the same key.
+
+The cache directory is $KMOS_MODEL_CACHE or ~/.cache/kmos_models, with one
+subdirectory per key. The modification time of an entry is updated on every
+use, the least recently used entries are removed if there are more than
+max_entries.
+
+Usage:
+    export_model('Rh211_model_with_lateral_interactions.xml', 'Rh211_model_with_lateral_interactions')
+"""
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ElementTree
+from xml.sax.saxutils import escape, quoteattr
+
+import numpy as np
+
+default_directory = os.environ.get('KMOS_MODEL_CACHE',
+                                   os.path.join(os.path.expanduser('~'), '.cache', 'kmos_models'))
+
+warning_messages = {
+    'store': 'Warning: could not store the compiled model in the cache %s (%s)',
+    'evict': 'Warning: could not remove the cached model %s (%s)',
+}
+
+
+def canonical_xml(filename):
+    """
+    Parameters:
+    -----------
+    filename: str
+        exported kmos xml file
+
+    Returns:
+    --------
+    xml: bytes
+        the xml without formatting whitespace and with sorted attributes
+    """
+    def canonical(element):
+        text = escape((element.text or '').strip())
+        attributes = ''.join(' %s=%s' % (name, quoteattr(value)) for name, value in sorted(element.attrib.items()))
+        children = ''.join(canonical(child) for child in element)
+        tail = escape((element.tail or '').strip())
+        return '<%s%s>%s%s</%s>%s' % (element.tag, attributes, text, children, element.tag, tail)
+    return canonical(ElementTree.parse(filename).getroot()).encode('utf-8')
+
+
+def kmos_version():
+    try:
+        import kmos
+    except ImportError:
+        return None
+    return getattr(kmos, '__version__', None)
+
+
+def compiler_version():
+    """ first line of '$FC --version', the Fortran compiler of f2py, None if it can't be run """
+    compiler = os.environ.get('FC') or 'gfortran'
+    try:
+        process = subprocess.Popen([compiler, '--version'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        output = process.communicate()[0]
+    except OSError:
+        return None
+    lines = output.decode('utf-8', 'replace').strip().splitlines()
+    return '%s: %s' % (compiler, lines[0] if lines else '')
+
+
+def model_key(filename, options=''):
+    """
+    Parameters:
+    -----------
+    filename: str
+        exported kmos xml file
+    options: str
+        options of kmos export, e.g. '-b otf -t'
+
+    Returns:
+    --------
+    key: str
+        sha256 hex digest of the canonical xml and the build environment
+    """
+    digest = hashlib.sha256(canonical_xml(filename))
+    for item in [' '.join(options.split()), str(kmos_version()), sys.version, np.__version__,
+                 str(compiler_version())]:
+        digest.update(b'\0' + item.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def copy_tree(source, target):
+    """ copy all files of source into target, replacing existing files """
+    for directory, _, filenames in os.walk(source):
+        destination = os.path.join(target, os.path.relpath(directory, source))
+        if not os.path.isdir(destination):
+            os.makedirs(destination)
+        for filename in filenames:
+            shutil.copy2(os.path.join(directory, filename), os.path.join(destination, filename))
+
+
+class ModelCache(object):
+    """
+    Directory of compiled models, one subdirectory per key.
+    """
+
+    def __init__(self, directory=None, max_entries=20):
+        """
+        Parameters:
+        -----------
+        directory: str
+            defaults to $KMOS_MODEL_CACHE or ~/.cache/kmos_models
+        max_entries: int
+            number of compiled models to keep
+        """
+        self.directory = os.path.abspath(directory or default_directory)
+        self.max_entries = max_entries
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def __contains__(self, key):
+        return os.path.isdir(self.path(key))
+
+    def entries(self):
+        """ keys of all entries, least recently used first """
+        if not os.path.isdir(self.directory):
+            return []
+        keys = [key for key in os.listdir(self.directory)
+                if not key.startswith('.') and os.path.isdir(self.path(key))]
+        return sorted(keys, key=lambda key: os.path.getmtime(self.path(key)))
+
+    def load(self, key, target):
+        """
+        Copy the compiled model of key into the directory target.
+
+        Returns:
+        --------
+        found: bool
+        """
+        if key not in self:
+            return False
+        copy_tree(self.path(key), target)
+        now = time.time()
+        os.utime(self.path(key), (now, now))
+        return True
+
+    def store(self, key, source):
+        """
+        Copy the compiled model directory source into the cache. The entry is
+        copied to a temporary directory first and renamed, so other processes
+        never see an incomplete entry.
+        """
+        if key in self:
+            return
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            temporary = tempfile.mkdtemp(prefix='.' + key, dir=self.directory)
+            copy_tree(source, temporary)
+            try:
+                os.rename(temporary, self.path(key))
+            except OSError:
+                # stored by another process in the meantime
+                shutil.rmtree(temporary, ignore_errors=True)
+        except (IOError, OSError) as error:
+            print(warning_messages['store'] % (self.directory, error))
+            return
+        self.evict()
+
+    def evict(self):
+        """ remove the least recently used entries beyond max_entries """
+        entries = self.entries()
+        for key in entries[:max(len(entries) - self.max_entries, 0)]:
+            try:
+                shutil.rmtree(self.path(key))
+            except OSError as error:
+                print(warning_messages['evict'] % (key, error))
+
+    def clear(self):
+        for key in self.entries():
+            shutil.rmtree(self.path(key), ignore_errors=True)
+
+
+def export_model(xml_file, export_dir, options='-b otf -t', cache=None):
+    """
+    kmos export of xml_file into export_dir, or a copy of the cached build
+    of the same xml file and options.
+
+    Parameters:
+    -----------
+    xml_file: str
+    export_dir: str
+    options: str
+        options of kmos export
+    cache: ModelCache or None
+        defaults to ModelCache(), False to always compile
+
+    Returns:
+    --------
+    cached: bool
+        True if the compiled model was taken from the cache
+    """
+    if cache is False:
+        cache = None
+    elif cache is None:
+        cache = ModelCache()
+    key = model_key(xml_file, options)
+    if cache is not None and cache.load(key, export_dir):
+        return True
+
+    from kmos.cli import main as cli_main
+    cli_main('export {} {} {}'.format(xml_file, export_dir, options))
+    if cache is not None and os.path.isdir(export_dir):
+        cache.store(key, export_dir)
+    return False
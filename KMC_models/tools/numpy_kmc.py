@@ -0,0 +1,486 @@
+"""
+Rejection-free kmc of exported kmos models with numpy, without a Fortran build.
+
+The lattice is a periodic array of size[0] x size[1] unit cells. An event is a
+(process, unit cell) pair with index process*n_cells + cell, where cells are
+numbered x*size[1] + y and lattice sites cell*n_sites + site. Offsets of
+coordinates are replaced by indices into a table of neighbouring cells, and
+event rates are kept in a binary sum tree. After an event only the rates of events, which have
+a condition or bystander on a changed site, are evaluated again.
+
+The otf rates base_rate*exp(alpha*beta*(rate_modification)*eV) are linear in
+the bystander counts in the exponent, so they factorise into a constant and
+one factor per bystander, which depends on the species on its site:
+    rate = base_rate*constant_factor*prod_k bystander_factors[k, species_k]
+see tools/rate_tables.py.
+
+Usage:
+    python -m tools.numpy_kmc Rh111/with_lateral_interactions/Rh111_model_with_lateral_interactions.xml
+"""
+import time
+from math import log
+
+import numpy as np
+
+from .compiled_rates import CompiledRateConstants
+from .rate_constants import RateConstantEvaluator
+from .rate_tables import bystander_factor_tables
+from .xml_model import XMLModel
+
+
+class SumTree(object):
+    """
+    Binary tree of partial sums over the event rates. The leaves are stored
+    at positions size ... 2*size-1 and node i holds the sum of nodes 2i and 2i+1.
+    """
+
+    def __init__(self, number):
+        """
+        Parameters:
+        -----------
+        number: int
+            number of events
+        """
+        self.size = 1
+        while self.size < number:
+            self.size *= 2
+        self.tree = np.zeros(2 * self.size)
+
+    @property
+    def total(self):
+        return self.tree[1]
+
+    def set_all(self, rates):
+        """ set all leaves and rebuild the tree """
+        self.tree[:] = 0.
+        self.tree[self.size:self.size + len(rates)] = rates
+        start = self.size
+        while start > 1:
+            half = start // 2
+            self.tree[half:start] = self.tree[start:2 * start:2] + self.tree[start + 1:2 * start:2]
+            start = half
+
+    def update(self, indices, rates):
+        """
+        Parameters:
+        -----------
+        indices: numpy array of int
+            event indices
+        rates: numpy array of float
+        """
+        nodes = indices + self.size
+        changed = self.tree[nodes] != rates
+        if not changed.any():
+            return
+        nodes = nodes[changed]
+        self.tree[nodes] = rates[changed]
+        nodes = np.sort(nodes) // 2
+        while len(nodes) > 1:
+            nodes = nodes[np.concatenate(([True], nodes[1:] != nodes[:-1]))]
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+            nodes //= 2
+        # single path to the root
+        tree = self.tree
+        node = int(nodes[0])
+        while node > 0:
+            tree[node] = tree[2 * node] + tree[2 * node + 1]
+            node //= 2
+
+    def find(self, value):
+        """
+        Parameters:
+        -----------
+        value: float
+            between 0 and total
+
+        Returns:
+        --------
+        index: int
+            event, whose interval of the cumulative rates contains value
+        """
+        tree = self.tree
+        node = 1
+        while node < self.size:
+            node *= 2
+            if value >= tree[node] and tree[node + 1] > 0:
+                value -= tree[node]
+                node += 1
+        return node - self.size
+
+    def rates(self, number):
+        return self.tree[self.size:self.size + number]
+
+
+class NumpyKMC(object):
+    """
+    kmc model of an exported kmos xml file on a periodic lattice.
+    """
+    warning_messages = {
+        'no_events': 'Warning: no executable process at kmc step %d',
+    }
+    chunk_size = 2 ** 15
+    # state of subclasses, which is saved in snapshots, see tools/snapshots.py
+    checkpoint_attributes = []
+
+    def __init__(self, model, size=(20, 20), parameters=None, seed=None, gas_data=None):
+        """
+        Parameters:
+        -----------
+        model: XMLModel or str
+            model or path of the exported xml file
+        size: 2-tuple of int
+            number of unit cells in x and y direction
+        parameters: dict {name: value}
+            parameter values, which replace those of the model
+        seed: int
+            seed of the random number generator
+        gas_data: dict {formula: dict}
+            see RateConstantEvaluator
+        """
+        if not isinstance(model, XMLModel):
+            model = XMLModel.from_file(model)
+        self.model = model
+        self.size = tuple(size)
+        self.n_cells = self.size[0] * self.size[1]
+        self.n_sites = len(model.sites)
+        self.species = list(model.species)
+        self.tof_names = model.tof_names
+        self.random_state = np.random.RandomState(seed)
+
+        self.evaluator = RateConstantEvaluator(model.parameters, gas_data)
+        if parameters:
+            self.evaluator.set_parameters(**parameters)
+        self.compile_processes()
+        self.compile_rate_constants()
+        self.update_rate_constants()
+        self.tree = SumTree(len(model.processes) * self.n_cells)
+        self.reset()
+
+    def compile_processes(self):
+        """
+        Convert the conditions, actions and bystanders of all processes into
+        padded integer arrays and find the events, whose rates change when a
+        process is executed.
+        """
+        processes = self.model.processes
+        species_index = dict((name, i) for i, name in enumerate(self.species))
+        site_index = dict((name, i) for i, name in enumerate(self.model.sites))
+
+        offsets = {(0, 0): 0}
+
+        def offset_index(dx, dy):
+            return offsets.setdefault((dx, dy), len(offsets))
+
+        def coord_arrays(coord_lists):
+            width = max([len(coords) for coords in coord_lists] + [0])
+            arrays = np.zeros((2, len(coord_lists), width), dtype=int)
+            for p, coords in enumerate(coord_lists):
+                for k, coord in enumerate(coords):
+                    arrays[:, p, k] = offset_index(*coord.offset[:2]), site_index[coord.name]
+            return arrays
+
+        self.condition_offset, self.condition_site = coord_arrays(
+            [[condition.coord for condition in process.condition_list] for process in processes])
+        self.condition_species = -np.ones(self.condition_site.shape, dtype=int)
+        for p, process in enumerate(processes):
+            for k, condition in enumerate(process.condition_list):
+                self.condition_species[p, k] = species_index[condition.species]
+
+        self.bystander_offset, self.bystander_site = coord_arrays(
+            [[bystander.coord for bystander in process.bystander_list] for process in processes])
+        self.bystander_column = np.arange(self.bystander_site.shape[1])
+
+        self.actions = []
+        for process in processes:
+            self.actions.append((
+                np.array([offset_index(*action.coord.offset[:2]) for action in process.action_list], dtype=int),
+                np.array([site_index[action.coord.name] for action in process.action_list], dtype=int),
+                np.array([species_index[action.species] for action in process.action_list], dtype=np.uint8),
+            ))
+
+        self.tof_matrix = np.zeros((len(processes), len(self.tof_names)))
+        for p, process in enumerate(processes):
+            for name, count in process.tof_count.items():
+                self.tof_matrix[p, self.tof_names.index(name)] = count
+
+        # (process, offset) of all conditions and bystanders on each site
+        dependencies = [set() for _ in self.model.sites]
+        for p, process in enumerate(processes):
+            for coord in [condition.coord for condition in process.condition_list] + \
+                    [bystander.coord for bystander in process.bystander_list]:
+                dependencies[site_index[coord.name]].add((p, coord.offset[0], coord.offset[1]))
+
+        # events with a condition or bystander on a site changed by the process, relative to its cell
+        self.affected = []
+        for p, process in enumerate(processes):
+            affected = set()
+            for action in process.action_list:
+                for q, dx, dy in dependencies[site_index[action.coord.name]]:
+                    affected.add((q, offset_index(action.coord.offset[0] - dx, action.coord.offset[1] - dy)))
+            affected = np.array(sorted(affected), dtype=int).reshape(-1, 2)
+            self.affected.append((affected[:, 0] * self.n_cells, affected[:, 1]))
+
+        # neighbours[offset, cell]: cell at the offset
+        x, y = np.divmod(np.arange(self.n_cells), self.size[1])
+        self.neighbours = np.zeros((len(offsets), self.n_cells), dtype=int)
+        for (dx, dy), i in offsets.items():
+            self.neighbours[i] = ((x + dx) % self.size[0]) * self.size[1] + (y + dy) % self.size[1]
+
+    def compile_rate_constants(self):
+        """ rate constants of the enabled processes as one expression DAG """
+        self.compiled_rates = CompiledRateConstants(
+            [process.rate_constant if process.enabled else None for process in self.model.processes], self.evaluator)
+
+    def update_rate_constants(self):
+        """
+        Evaluate the rate constants and the bystander factors of the otf rates
+        at the current parameter values.
+        """
+        self.prefactors = self.compiled_rates.evaluate(self.evaluator.parameters)
+        self.bystander_factors = bystander_factor_tables(self.model.processes, self.evaluator, self.species,
+                                                         self.bystander_site.shape[1], self.prefactors)
+
+    def apply_parameters(self, parameters):
+        """
+        Set parameter values and evaluate the rate constants again. Parameters
+        with expression values, e.g. H_s_cov, are fixed in the compiled rate
+        constants, which are compiled again if one of them changes.
+
+        Parameters:
+        -----------
+        parameters: dict {name: value}
+        """
+        self.evaluator.set_parameters(**parameters)
+        if any(name in self.compiled_rates.fixed for name in parameters):
+            self.compile_rate_constants()
+        self.update_rate_constants()
+
+    def set_parameters(self, **parameters):
+        """ change parameter values, e.g. set_parameters(T=550, p_COgas=1.) """
+        self.apply_parameters(parameters)
+        self.update_rates()
+
+    def reset(self):
+        """ empty lattice (default species), zero time and counters """
+        default_species = [self.species.index(self.model.site_default_species[site])
+                           for site in self.model.sites]
+        self.occupation = np.tile(np.array(default_species, dtype=np.uint8), self.n_cells)
+        self.kmc_time = 0.
+        self.kmc_step = 0
+        self.procstat = np.zeros(len(self.model.processes), dtype=np.int64)
+        self.update_rates()
+
+    def restart(self, parameters=None, seed=None):
+        """
+        Reset the lattice with new parameter values and random number seed.
+
+        Parameters:
+        -----------
+        parameters: dict {name: value}
+        seed: int
+        """
+        if parameters:
+            self.apply_parameters(parameters)
+        if seed is not None:
+            self.random_state.seed(seed)
+        self.reset()
+
+    def set_coverages(self, coverages):
+        """
+        Occupy random sites with the given coverages, e.g. the mean-field
+        steady state MeanFieldModel.coverages(theta). All other sites get
+        their default species.
+
+        Parameters:
+        -----------
+        coverages: dict {site: {species: float}}
+        """
+        occupation = self.occupation.reshape(self.n_cells, self.n_sites)
+        for s, site in enumerate(self.model.sites):
+            default_species = self.model.site_default_species[site]
+            occupation[:, s] = self.species.index(default_species)
+            cells = self.random_state.permutation(self.n_cells)
+            start = 0
+            for species, coverage in sorted(coverages.get(site, {}).items()):
+                if species == default_species:
+                    continue
+                number = min(int(round(coverage * self.n_cells)), self.n_cells - start)
+                occupation[cells[start:start + number], s] = self.species.index(species)
+                start += number
+        self.update_rates()
+
+    def site_indices(self, cell, offset, site):
+        """ lattice indices of sites at the offsets (indices) relative to the cells """
+        return self.neighbours[offset, cell] * self.n_sites + site
+
+    def evaluate_rates(self, events):
+        """
+        Parameters:
+        -----------
+        events: numpy array of int
+
+        Returns:
+        --------
+        rates: numpy array of float
+        """
+        process = events // self.n_cells
+        cell = (events % self.n_cells)[:, None]
+
+        species = self.occupation[self.site_indices(cell, self.condition_offset[process], self.condition_site[process])]
+        required = self.condition_species[process]
+        possible = np.all((species == required) | (required < 0), axis=1)
+
+        bystanders = self.occupation[self.site_indices(
+            cell, self.bystander_offset[process], self.bystander_site[process])]
+        factors = np.prod(self.bystander_factors[process[:, None], self.bystander_column, bystanders], axis=1)
+        return self.prefactors[process] * possible * factors
+
+    def update_rates(self):
+        """ evaluate the rates of all events """
+        number = len(self.model.processes) * self.n_cells
+        rates = np.zeros(number)
+        for start in range(0, number, self.chunk_size):
+            events = np.arange(start, min(start + self.chunk_size, number))
+            rates[events] = self.evaluate_rates(events)
+        self.tree.set_all(rates)
+
+    def execute(self, event):
+        """ execute the event and update the rates of affected events """
+        process, cell = divmod(event, self.n_cells)
+        offset, site, species = self.actions[process]
+        self.occupation[self.site_indices(cell, offset, site)] = species
+        self.procstat[process] += 1
+        self.kmc_step += 1
+
+        processes, offset = self.affected[process]
+        events = processes + self.neighbours[offset, cell]
+        self.tree.update(events, self.evaluate_rates(events))
+
+    def do_steps(self, n=1):
+        """
+        Parameters:
+        -----------
+        n: int
+            number of kmc steps
+
+        Returns:
+        --------
+        n: int
+            number of executed steps, smaller than n if no process is possible
+        """
+        random_sample = self.random_state.random_sample
+        for i in range(n):
+            total = self.tree.total
+            if total <= 0.:
+                print(self.warning_messages['no_events'] % self.kmc_step)
+                return i
+            event = self.tree.find(random_sample() * total)
+            self.kmc_time += log(1. / (1. - random_sample())) / total
+            self.execute(event)
+        return n
+
+    def get_tofs(self):
+        """
+        Returns:
+        --------
+        tofs: dict {tof name: float}
+            turnover frequencies per unit cell and second since reset
+        """
+        if not self.kmc_time:
+            return dict((name, 0.) for name in self.tof_names)
+        tofs = self.procstat.dot(self.tof_matrix) / (self.kmc_time * self.n_cells)
+        return dict(zip(self.tof_names, tofs))
+
+    def sample_tofs(self, relaxation_steps, sampling_steps):
+        """
+        Parameters:
+        -----------
+        relaxation_steps: int
+            kmc steps before sampling
+        sampling_steps: int
+
+        Returns:
+        --------
+        tofs: dict {tof name: float}
+            turnover frequencies of the sampling steps only
+        """
+        self.do_steps(relaxation_steps)
+        kmc_time, procstat = self.kmc_time, self.procstat.copy()
+        self.do_steps(sampling_steps)
+        if self.kmc_time == kmc_time:
+            return dict((name, 0.) for name in self.tof_names)
+        tofs = (self.procstat - procstat).dot(self.tof_matrix) / ((self.kmc_time - kmc_time) * self.n_cells)
+        return dict(zip(self.tof_names, tofs))
+
+    def get_coverages(self):
+        """
+        Returns:
+        --------
+        coverages: dict {site: {species: float}}
+            fraction of each site type occupied by each species
+        """
+        occupation = self.occupation.reshape(self.n_cells, self.n_sites)
+        coverages = {}
+        for s, site in enumerate(self.model.sites):
+            counts = np.bincount(occupation[:, s], minlength=len(self.species))
+            coverages[site] = dict(zip(self.species, counts / float(self.n_cells)))
+        return coverages
+
+
+def benchmark(model, steps=10000, size=(20, 20), seed=None, kmos=False):
+    """
+    Throughput of NumpyKMC, and optionally of the compiled kmos model in the
+    current directory.
+
+    Parameters:
+    -----------
+    model: XMLModel or str
+    steps: int
+    size: 2-tuple of int
+    seed: int
+    kmos: bool
+        also time kmos.run.KMC_Model
+
+    Returns:
+    --------
+    steps_per_second: dict {engine: float}
+    """
+    kmc = NumpyKMC(model, size=size, seed=seed)
+    start = time.time()
+    executed = kmc.do_steps(steps)
+    steps_per_second = {'numpy': executed / (time.time() - start)}
+
+    if kmos:
+        from kmos.run import KMC_Model
+        kmos_model = KMC_Model(print_rates=False, banner=False)
+        start = time.time()
+        kmos_model.do_steps(steps)
+        steps_per_second['kmos'] = steps / (time.time() - start)
+        kmos_model.deallocate()
+    return steps_per_second
+
+
+def main():
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description='Run an exported kmos model with the numpy kmc engine')
+    parser.add_argument('xml_file')
+    parser.add_argument('--steps', type=int, default=10000)
+    parser.add_argument('--size', type=int, nargs=2, default=[20, 20])
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--kmos', action='store_true', help='compare with the compiled kmos model in this directory')
+    args = parser.parse_args()
+
+    model = XMLModel.from_file(args.xml_file)
+    for engine, rate in sorted(benchmark(model, args.steps, args.size, args.seed, args.kmos).items()):
+        print('%s: %.0f steps/s' % (engine, rate))
+
+    kmc = NumpyKMC(model, size=args.size, seed=args.seed)
+    kmc.do_steps(args.steps)
+    print('kmc time: %.4e s after %d steps' % (kmc.kmc_time, kmc.kmc_step))
+    for name, tof in sorted(kmc.get_tofs().items()):
+        print('%s: %.4e' % (name, tof))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""
+Evaluation of the kmos rate constant expressions of exported models, e.g.
+    p_COgas*bar*A/2/sqrt(2*pi*umass*m_CO/beta)*exp(-beta*(GibbsGas_COgas-GibbsAds_CO_t)*eV)
+without kmos. Besides the model parameters the expressions use kmos units,
+beta, the masses m_[formula] and the free energies GibbsAds_[name] and
+GibbsGas_[name], see thermochemistry.
+"""
+import re
+from math import exp, log, pi, sqrt
+
+from . import thermochemistry
+from .rate_expressions import LinearRateExpression
+
+
+class RateConstantEvaluator(object):
+    """
+    Evaluates rate constants and parameters of an XMLModel, caching
+    all derived quantities until the parameters change.
+    """
+    error_messages = {
+        'unknown': 'Unknown quantity %s',
+        'expression': 'Can not evaluate %s: %s',
+        'otf_rate': 'Unknown otf rate format: %s',
+    }
+    identifier_pattern = r'\b[A-Za-z_][A-Za-z0-9_]*'
+    otf_rate_pattern = r'^base_rate\*exp\((.*)\*beta\*\((.*)\)\*eV\)$'
+    functions = {'exp': exp, 'log': log, 'sqrt': sqrt, 'max': max, 'min': min, 'abs': abs}
+    units = {
+        'kboltzmann': thermochemistry.kboltzmann,
+        'h': thermochemistry.h,
+        'eV': thermochemistry.eV,
+        'umass': thermochemistry.umass,
+        'bar': thermochemistry.bar,
+        'angstrom': thermochemistry.angstrom,
+        'pi': pi,
+    }
+
+    def __init__(self, parameters, gas_data=None, harmonic_table=None):
+        """
+        Parameters:
+        -----------
+        parameters: dict {name: value}
+            numbers or expressions, e.g. XMLModel.parameters
+        gas_data: dict {formula: dict}
+            overrides thermochemistry.gas_data
+        harmonic_table: thermochemistry.HarmonicTable
+            tabulated GibbsAds_ free energies, see tabulate_harmonic
+        """
+        self.parameters = dict(parameters)
+        self.gas_data = dict(thermochemistry.gas_data)
+        self.gas_data.update(gas_data or {})
+        self.harmonic_table = harmonic_table
+        self.values = {}
+        self.otf_expressions = {}
+
+    def set_parameters(self, **parameters):
+        """ change parameter values, e.g. set_parameters(T=550) """
+        self.parameters.update(parameters)
+        self.values = {}
+        if self.harmonic_table is not None and any(name.startswith('f_') for name in parameters):
+            self.harmonic_table = None
+
+    def tabulate_harmonic(self, **grid):
+        """
+        Tabulate the harmonic free energies of all f_ parameters, which
+        speeds up the evaluation of the rate constants at many temperatures.
+        The table is dropped when a frequency parameter is changed.
+
+        Parameters:
+        -----------
+        grid: T_min, T_max, T_step, see thermochemistry.HarmonicTable
+        """
+        frequencies = {}
+        for name in self.parameters:
+            if name.startswith('f_'):
+                frequencies[name[2:]] = self.value(name)
+        self.harmonic_table = thermochemistry.HarmonicTable(frequencies, **grid)
+        return self.harmonic_table
+
+    def value(self, name):
+        """
+        Parameters:
+        -----------
+        name: str
+            parameter, unit or derived quantity, e.g. 'GibbsAds_CO_t'
+
+        Returns:
+        --------
+        value: float (or list for frequency parameters)
+        """
+        if name in self.values:
+            return self.values[name]
+        if name in self.parameters:
+            value = self.evaluate(str(self.parameters[name]))
+        elif name in self.units:
+            value = self.units[name]
+        elif name == 'beta':
+            value = 1. / (thermochemistry.kboltzmann * self.value('T'))
+        elif name.startswith('m_'):
+            value = thermochemistry.formula_mass(name[2:])
+        elif name.startswith('GibbsAds_'):
+            species = name[len('GibbsAds_'):]
+            if self.harmonic_table is not None and species in self.harmonic_table:
+                free_energy = self.harmonic_table.free_energy(species, self.value('T'))
+            else:
+                free_energy = float(thermochemistry.harmonic_free_energy(self.value('f_' + species), self.value('T')))
+            value = self.value('E_' + species) + free_energy
+        elif name.startswith('GibbsGas_'):
+            species = name[len('GibbsGas_'):]
+            formula = species[:-len('gas')] if species.endswith('gas') else species
+            value = self.value('E_' + species) + float(thermochemistry.ideal_gas_free_energy(
+                formula, self.value('T'), self.value('p_' + species), self.gas_data.get(formula)))
+        else:
+            raise KeyError(self.error_messages['unknown'] % name)
+        self.values[name] = value
+        return value
+
+    def evaluate(self, expression):
+        """
+        Parameters:
+        -----------
+        expression: str
+            arithmetic expression of parameters and derived quantities
+
+        Returns:
+        --------
+        value: float (or list for frequency parameters)
+        """
+        namespace = {'__builtins__': {}}
+        for name in set(re.findall(self.identifier_pattern, expression)):
+            if name in self.functions:
+                namespace[name] = self.functions[name]
+            else:
+                namespace[name] = self.value(name)
+        try:
+            return eval(expression, namespace)
+        except (SyntaxError, TypeError, ZeroDivisionError, OverflowError) as error:
+            raise ValueError(self.error_messages['expression'] % (expression, error))
+
+    def otf_energies(self, otf_rate):
+        """
+        Parameters:
+        -----------
+        otf_rate: str
+            'base_rate*exp(alpha*beta*(rate_modification)*eV)'
+
+        Returns:
+        --------
+        exponent: float
+            alpha*beta*eV
+        energies: dict {count: float}
+            summed interaction energy per bystander count (or '1'), such that
+            otf_rate = base_rate*exp(exponent*sum_count energy*count)
+        """
+        if otf_rate not in self.otf_expressions:
+            match = re.match(self.otf_rate_pattern, otf_rate)
+            if not match:
+                raise ValueError(self.error_messages['otf_rate'] % otf_rate)
+            self.otf_expressions[otf_rate] = (match.group(1), LinearRateExpression.parse(match.group(2)).terms)
+
+        alpha, terms = self.otf_expressions[otf_rate]
+        exponent = self.evaluate(alpha) * self.value('beta') * thermochemistry.eV
+        energies = {}
+        for count, parameters in terms.items():
+            energies[count] = sum(coefficient * self.value(name) for name, coefficient in parameters.items())
+        return exponent, energies
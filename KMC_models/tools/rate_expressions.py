@@ -0,0 +1,279 @@
+"""
+Symbolic treatment of otf rate modifications.
+
+A rate modification is a sum of interaction energies, each multiplied by a
+bystander count, or by 1 for interactions between reactants / products, e.g.
+"+I_CO_t_CO_t*nr_CO_a-I_CO_t_CO_t*nr_CO_b+I_CH_t_CO_t".
+It is linear in the bystander counts, so it can be written as
+    sum over groups of parameter_sum*count_sum
+where parameter_sum only depends on project parameters. These sums are
+constant during a kmc run and are precomputed as project parameters.
+"""
+import re
+
+try:
+    from math import gcd
+except ImportError:
+    from fractions import gcd
+
+
+class LinearRateExpression(object):
+    """
+    Term tree of a rate modification:
+        {count: {parameter: coefficient}}
+    with count '1' for summands without bystander count.
+    """
+    error_messages = {
+        'nonlinear_term': 'Rate modification term is not a parameter times a bystander count: %s',
+    }
+
+    def __init__(self, count_prefix='nr_'):
+        """
+        Parameters:
+        -----------
+        count_prefix: str
+            prefix of bystander count variables
+        """
+        self.count_prefix = count_prefix
+        self.terms = {}
+
+    @classmethod
+    def parse(cls, rate_modification, count_prefix='nr_'):
+        """
+        Parse a rate modification, e.g. '+I_a*nr_CO_b-I_a*nr_CO_c+I_b' or
+        the reduced form '+I_a*(+nr_CO_b-nr_CO_c)+I_b', into a term tree.
+
+        Parameters:
+        -----------
+        rate_modification: str
+        count_prefix: str
+
+        Returns:
+        --------
+        expression: LinearRateExpression
+        """
+        expression = cls(count_prefix)
+        for coefficient, factors in cls.expand(rate_modification.strip().replace(' ', '')):
+            counts = [factor for factor in factors if factor.startswith(count_prefix)]
+            parameters = [factor for factor in factors if not factor.startswith(count_prefix)]
+            if len(counts) > 1 or len(parameters) != 1:
+                raise ValueError(cls.error_messages['nonlinear_term'] % '*'.join(factors))
+            expression.add(counts[0] if counts else '1', parameters[0], coefficient)
+        return expression
+
+    @staticmethod
+    def split(expression, separators):
+        """
+        Split the expression at separators outside of parentheses.
+
+        Returns:
+        --------
+        parts: 1-D list of 2-tuples
+            [(separator or '', part), ]
+        """
+        parts = []
+        depth, start = 0, 0
+        for i, char in enumerate(expression):
+            if char == '(':
+                depth += 1
+            elif char == ')':
+                depth -= 1
+            elif char in separators and depth == 0 and i > start:
+                parts.append(expression[start:i])
+                start = i
+        parts.append(expression[start:])
+        return [(part[0], part[1:]) if part[0] in separators else ('', part) for part in parts if part]
+
+    @classmethod
+    def expand(cls, expression):
+        """
+        Expand products of (parenthesised) sums.
+
+        Parameters:
+        -----------
+        expression: str
+
+        Returns:
+        --------
+        monomials: 1-D list of 2-tuples
+            [(integer coefficient, [factor names]), ]
+        """
+        monomials = []
+        for sign, term in cls.split(expression, '+-'):
+            product = [(-1 if sign == '-' else 1, [])]
+            for _, factor in cls.split(term, '*'):
+                if factor.startswith('(') and factor.endswith(')'):
+                    summands = cls.expand(factor[1:-1])
+                elif factor.isdigit():
+                    summands = [(int(factor), [])]
+                else:
+                    summands = [(1, [factor])]
+                product = [
+                    (coefficient1*coefficient2, factors1 + factors2)
+                    for coefficient1, factors1 in product
+                    for coefficient2, factors2 in summands
+                ]
+            monomials.extend(product)
+        return monomials
+
+    def add(self, count, parameter, coefficient):
+        """ add coefficient*parameter*count, dropping summands which cancel """
+        parameters = self.terms.setdefault(count, {})
+        parameters[parameter] = parameters.get(parameter, 0) + coefficient
+        if not parameters[parameter]:
+            parameters.pop(parameter)
+        if not parameters:
+            self.terms.pop(count)
+
+    @staticmethod
+    def normalise(parameters):
+        """
+        Split a parameter sum into a canonical sum and an integer factor,
+        such that parameters == factor*canonical. The canonical sum is sorted
+        by name, its first coefficient is positive and the coefficients have
+        no common divisor.
+
+        Parameters:
+        -----------
+        parameters: dict {parameter: coefficient}
+
+        Returns:
+        --------
+        canonical: tuple of (parameter, coefficient)
+        factor: int
+        """
+        items = sorted(parameters.items())
+        factor = 0
+        for _, coefficient in items:
+            factor = gcd(factor, abs(coefficient))
+        if items[0][1] < 0:
+            factor = -factor
+        return tuple((name, coefficient // factor) for name, coefficient in items), factor
+
+    def groups(self):
+        """
+        Collect bystander counts with proportional parameter sums.
+
+        Returns:
+        --------
+        groups: 1-D list of 2-tuples
+            [(canonical parameter sum, {count: factor}), ] sorted by parameter sum
+        """
+        groups = {}
+        for count, parameters in self.terms.items():
+            canonical, factor = self.__class__.normalise(parameters)
+            groups.setdefault(canonical, {})[count] = factor
+        return sorted(groups.items())
+
+    @staticmethod
+    def format_sum(items):
+        """ '+a-2*b' for [('a', 1), ('b', -2)] """
+        output = ''
+        for name, coefficient in items:
+            output += '-' if coefficient < 0 else '+'
+            if abs(coefficient) != 1:
+                output += '%d*' % abs(coefficient)
+            output += name
+        return output
+
+    def factorise(self):
+        """
+        Write the expression with a single multiplication per group of
+        proportional parameter sums, e.g.
+        '+I_a*nr_CO_b-I_a*nr_CO_c+I_b*nr_CO_b-I_c*nr_CO_b' becomes
+        '+(+I_b-I_c)*nr_CO_b+I_a*(+nr_CO_b-nr_CO_c)'.
+        Parameter sums with more than one summand are put in parentheses,
+        see RateExpressionOptimizer.share_parameters.
+
+        Returns:
+        --------
+        rate_modification: str
+        """
+        output = ''
+        for canonical, counts in self.groups():
+            if len(canonical) == 1 and canonical[0][1] == 1:
+                parameter_sum = canonical[0][0]
+            else:
+                parameter_sum = '(%s)' % self.__class__.format_sum(canonical)
+
+            if len(counts) == 1:
+                count, factor = list(counts.items())[0]
+                output += '-' if factor < 0 else '+'
+                output += parameter_sum
+                if abs(factor) != 1:
+                    output += '*%d' % abs(factor)
+                if count != '1':
+                    output += '*' + count
+            else:
+                output += '+%s*(%s)' % (parameter_sum, self.__class__.format_sum(sorted(counts.items())))
+        return output
+
+
+class RateExpressionOptimizer(object):
+    """
+    Replaces the greedy BEPProcessHolder.reduce_rate_modification when set as
+    rate_optimizer of a BEPProcessHolder. Rate modifications are factorised
+    per process and parameter sums shared by processes are turned into
+    precomputed project parameters.
+    """
+
+    def __init__(self, parameter_prefix='otf_I_', count_prefix='nr_'):
+        """
+        Parameters:
+        -----------
+        parameter_prefix: str
+            prefix of the names of the precomputed parameters
+        count_prefix: str
+            prefix of bystander count variables
+        """
+        self.parameter_prefix = parameter_prefix
+        self.count_prefix = count_prefix
+        self.shared_parameters = {}
+        self.shared_parameter_names = []
+
+    def reduce(self, rate_modification):
+        """
+        Factorise the rate_modification of a single process.
+
+        Parameters:
+        -----------
+        rate_modification: str
+
+        Returns:
+        --------
+        reduced_rate_modification: str
+        """
+        return LinearRateExpression.parse(rate_modification, self.count_prefix).factorise()
+
+    def share_parameters(self, otf_rate):
+        """
+        Replace the parameter sums of a factorised otf rate by precomputed
+        parameters. Equal sums in different processes share the same parameter.
+        Parameter sums are parenthesised, signed sums of at least two
+        summands without bystander counts, which follow a sign or multiplication.
+
+        Parameters:
+        -----------
+        otf_rate: str
+
+        Returns:
+        --------
+        otf_rate: str
+        """
+        def replace(match):
+            parameter_sum = match.group(2)
+            summands = re.findall(r'[\+-][^\+-]+', parameter_sum)
+            if self.count_prefix in parameter_sum or len(summands) < 2 or ''.join(summands) != parameter_sum:
+                return match.group(0)
+            if parameter_sum not in self.shared_parameters:
+                name = '%s%d' % (self.parameter_prefix, len(self.shared_parameter_names) + 1)
+                self.shared_parameters[parameter_sum] = name
+                self.shared_parameter_names.append((name, parameter_sum))
+            return match.group(1) + self.shared_parameters[parameter_sum]
+        return re.sub(r'([\+\-\*])\(([^()]*)\)', replace, otf_rate)
+
+    def add_project_parameters(self, pt):
+        """ add the precomputed parameter sums to the kmos project """
+        for name, parameter_sum in self.shared_parameter_names:
+            pt.add_parameter(name=name, value=parameter_sum)
+        return pt
@@ -0,0 +1,288 @@
+"""
+Lookup tables for the bystander dependent factor of otf rates.
+
+An otf rate generated by BEPProcessHolder reads
+    base_rate*exp(alpha*beta*(rate_modification)*eV)
+where the rate_modification is linear in the integer bystander counts
+nr_[species]_[flag]. Grouping the counts as in LinearRateExpression gives
+    exp(alpha*beta*eV*sum_g P_g*C_g) = prod_g table_g[C_g]
+with constant parameter sums P_g and integer count sums C_g, which are
+bounded by the number of bystanders of each flag. A table over all count
+combinations of a process would have up to (bystanders per flag + 1) entries
+per counted species and flag, so each group gets its own small table and
+evaluating a rate takes a product of table lookups instead of an exp call.
+
+Tables are generated at model build time with
+    process_holder.add_project_processes(pt, rate_tables=True)
+into process_holder.rate_tables, at the parameter values (e.g. T) of pt. The
+Fortran otf backend can't index tables from an otf_rate string, so they are
+used by python side rate evaluation.
+
+NumpyKMC indexes the same factorisation by the species on each bystander
+site instead of the count sums, see bystander_factor_tables.
+"""
+import re
+
+import numpy as np
+
+from .rate_constants import RateConstantEvaluator
+from .rate_expressions import LinearRateExpression
+
+error_messages = {
+    'count': 'Bystander count %s of process %s without bystander of flag %s',
+}
+
+# kmos.units
+kboltzmann = 1.3806488e-23
+eV = 1.602176565e-19
+
+
+class RateTable(object):
+    """
+    Factor tables of the bystander dependent part of a single otf rate.
+    """
+
+    def __init__(self, groups):
+        """
+        Parameters:
+        -----------
+        groups: 1-D list of 3-tuples
+            [({count: integer coefficient}, smallest count sum, numpy array of factors), ]
+        """
+        self.groups = groups
+
+    def factor(self, counts):
+        """
+        Parameters:
+        -----------
+        counts: dict {count: int or numpy array of int}
+            bystander counts, e.g. {'nr_CO_a': 2}. Missing counts are 0.
+
+        Returns:
+        --------
+        factor: float or numpy array
+            exp(alpha*beta*(rate_modification)*eV)
+        """
+        factor = 1.
+        for coefficients, minimum, factors in self.groups:
+            count_sum = 0
+            for count, coefficient in coefficients.items():
+                count_sum = count_sum + coefficient*counts.get(count, 0)
+            factor = factor*factors[count_sum - minimum]
+        return factor
+
+
+class RateTableBuilder(object):
+    """
+    Builds RateTables for processes with otf rates at the current parameter
+    values, e.g. after BEPProcessHolder.add_project_processes.
+    """
+    error_messages = {
+        'otf_rate': 'Unknown otf rate format: %s',
+        'parameter': 'Can not evaluate parameter: %s',
+    }
+    otf_rate_pattern = RateConstantEvaluator.otf_rate_pattern
+
+    def __init__(self, parameters, count_prefix='nr_'):
+        """
+        Parameters:
+        -----------
+        parameters: dict {name: value}
+            numeric values or expressions of other parameters,
+            like the values of pt.parameter_list. Requires T.
+        count_prefix: str
+        """
+        self.parameters = self.__class__.evaluate_parameters(parameters)
+        self.count_prefix = count_prefix
+        self.beta_eV = eV / (kboltzmann * self.parameters['T'])
+
+    @classmethod
+    def from_project(cls, pt, **kwargs):
+        """ use the values of the kmos project parameters """
+        return cls(dict((param.name, param.value) for param in pt.parameter_list), **kwargs)
+
+    @classmethod
+    def evaluate_parameters(cls, parameters):
+        """
+        Evaluate parameters, which are given as numbers or as arithmetic
+        expressions of other parameters. Parameters depending on kmos
+        quantities (like GibbsAds_* or units) and non scalar parameters
+        (like frequency lists) are skipped.
+
+        Parameters:
+        -----------
+        parameters: dict {name: value}
+
+        Returns:
+        --------
+        values: dict {name: float}
+        """
+        values = {}
+        expressions = {}
+        for name, value in parameters.items():
+            try:
+                values[name] = float(value)
+            except (TypeError, ValueError):
+                expressions[name] = str(value)
+
+        namespace = {'__builtins__': {}, 'exp': np.exp, 'sqrt': np.sqrt, 'log': np.log}
+        while expressions:
+            evaluated = []
+            for name, expression in expressions.items():
+                try:
+                    value = eval(expression, namespace, values)
+                except NameError:
+                    continue
+                except (SyntaxError, TypeError, ZeroDivisionError):
+                    value = None
+                evaluated.append(name)
+                try:
+                    values[name] = float(value)
+                except (TypeError, ValueError):
+                    pass
+            if not evaluated:
+                break
+            for name in evaluated:
+                expressions.pop(name)
+        return values
+
+    def evaluate(self, expression):
+        """ evaluate an arithmetic expression of the parameters """
+        try:
+            return float(eval(expression, {'__builtins__': {}}, self.parameters))
+        except NameError:
+            raise ValueError(self.error_messages['parameter'] % expression)
+
+    @staticmethod
+    def flag_sizes(bystanders):
+        """
+        Number of bystanders per flag, which allow each species.
+
+        Returns:
+        --------
+        sizes: dict {flag: number of bystanders}
+        allowed: dict {(species, flag): number of bystanders}
+        """
+        sizes, allowed = {}, {}
+        for bystander in bystanders:
+            sizes[bystander.flag] = sizes.get(bystander.flag, 0) + 1
+            for species in bystander.allowed_species:
+                allowed[(species, bystander.flag)] = allowed.get((species, bystander.flag), 0) + 1
+        return sizes, allowed
+
+    def count_sum_range(self, coefficients, sizes, allowed):
+        """
+        Bounds of sum_j coefficient_j*nr_j, given that the counts of each
+        flag can't exceed its number of bystanders.
+
+        Returns:
+        --------
+        minimum, maximum: int
+        """
+        per_flag = {}
+        for count, coefficient in coefficients.items():
+            species, flag = count[len(self.count_prefix):].rsplit('_', 1)
+            per_flag.setdefault(flag, []).append((coefficient, allowed.get((species, flag), 0)))
+
+        # fill the bystanders of each flag with the species of largest (smallest) coefficients first
+        minimum, maximum = 0, 0
+        for flag, items in per_flag.items():
+            for sign in [1, -1]:
+                remaining = sizes.get(flag, 0)
+                for coefficient, nr_allowed in sorted(items, key=lambda item: -sign*item[0]):
+                    if sign*coefficient <= 0 or not remaining:
+                        break
+                    nr_occupied = min(nr_allowed, remaining)
+                    remaining -= nr_occupied
+                    if sign > 0:
+                        maximum += coefficient*nr_occupied
+                    else:
+                        minimum += coefficient*nr_occupied
+        return minimum, maximum
+
+    def build(self, otf_rate, bystanders):
+        """
+        Parameters:
+        -----------
+        otf_rate: str
+            'base_rate*exp(alpha*beta*(rate_modification)*eV)'
+        bystanders: 1-D list of kmos bystanders
+
+        Returns:
+        --------
+        rate_table: RateTable
+        """
+        match = re.match(self.otf_rate_pattern, otf_rate)
+        if not match:
+            raise ValueError(self.error_messages['otf_rate'] % otf_rate)
+        alpha = self.evaluate(match.group(1))
+        expression = LinearRateExpression.parse(match.group(2), self.count_prefix)
+        sizes, allowed = self.__class__.flag_sizes(bystanders)
+
+        groups = []
+        for canonical, counts in expression.groups():
+            energy = sum(coefficient*self.evaluate(name) for name, coefficient in canonical)
+            coefficients = dict((count, factor) for count, factor in counts.items() if count != '1')
+            constant = counts.get('1', 0)
+            minimum, maximum = self.count_sum_range(coefficients, sizes, allowed)
+            count_sums = np.arange(minimum, maximum + 1) + constant
+            groups.append((coefficients, minimum, np.exp(alpha*self.beta_eV*energy*count_sums)))
+        return RateTable(groups)
+
+    def build_processes(self, processes):
+        """
+        Build the RateTables of all processes with an otf rate.
+
+        Parameters:
+        -----------
+        processes: 1-D list of process dicts, see BEPProcessHolder.processes
+
+        Returns:
+        --------
+        rate_tables: dict {process name: RateTable}
+        """
+        rate_tables = {}
+        for process in processes:
+            if process.get('otf_rate'):
+                rate_tables[process['name']] = self.build(process['otf_rate'], process.get('bystander_list', []))
+        return rate_tables
+
+
+def bystander_factor_tables(processes, evaluator, species, width, prefactors):
+    """
+    Factors of the otf rates per bystander and species at the current
+    parameter values of evaluator,
+        otf_rate = prefactor*prod_k factors[p, k, species on bystander k]
+
+    Parameters:
+    -----------
+    processes: 1-D list of XMLProcess
+    evaluator: RateConstantEvaluator
+    species: 1-D list of str
+    width: int
+        largest number of bystanders of a process
+    prefactors: 1-D numpy array
+        rate constants of the processes, which are multiplied in place by the
+        count independent factor of their otf rates
+
+    Returns:
+    --------
+    factors: 3-D numpy array, shape (processes, width, species)
+    """
+    species_index = dict((name, i) for i, name in enumerate(species))
+    log_factors = np.zeros((len(processes), width, len(species)))
+    for p, process in enumerate(processes):
+        if not (process.enabled and process.otf_rate):
+            continue
+        exponent, energies = evaluator.otf_energies(process.otf_rate)
+        for count, energy in energies.items():
+            if count == '1':
+                prefactors[p] *= np.exp(exponent * energy)
+                continue
+            count_species, flag = count[len('nr_'):].rsplit('_', 1)
+            if not any(bystander.flag == flag for bystander in process.bystander_list):
+                raise ValueError(error_messages['count'] % (count, process.name, flag))
+            columns = [k for k, bystander in enumerate(process.bystander_list)
+                       if bystander.flag == flag and count_species in bystander.allowed_species]
+            log_factors[p, columns, species_index[count_species]] += exponent * energy
+    return np.exp(log_factors)
@@ -0,0 +1,180 @@
+"""
+Degree of rate control (DRC) and degree of selectivity control (DSC) with
+respect to the transition state sensitivity parameters sens_* of a model.
+
+Each sens_* parameter shifts the energy of a transition state. The DRC of
+product j is
+    X_ij = -kT*d ln(r_j)/d sens_i ~ -kT*(ln r_j(+delta) - ln r_j(-delta))/(2*delta)
+and the DSC uses the selectivity r_j/sum_k r_k instead of r_j. The +delta and
+-delta runs of a replica use the same random number seed (common random
+numbers), so their noise largely cancels in the difference. Error bars are
+standard errors over the replicas. A product without counts in a run has no
+rate to take the logarithm of, so its DRC and DSC are NaN.
+
+The runs use AcceleratedKMC by default, because the product tofs of the
+models are zero for step counts reachable with plain NumpyKMC.
+"""
+import numpy as np
+
+from . import thermochemistry
+from .acceleration import AcceleratedKMC
+from .kmc_pool import run_pool
+from .xml_model import XMLModel
+
+warning_messages = {
+    'no_counts': 'Warning: no counts of %s in the runs of %s, the DRC and DSC are NaN',
+}
+
+
+def sensitivity_parameters(parameters, prefix='sens_'):
+    """
+    Parameters:
+    -----------
+    parameters: dict {name: value} or kmos project
+        e.g. XMLModel.parameters
+
+    Returns:
+    --------
+    names: 1-D list of str
+        sorted names of all sensitivity parameters
+    """
+    if hasattr(parameters, 'parameter_list'):
+        parameters = dict((param.name, param.value) for param in parameters.parameter_list)
+    return sorted(name for name in parameters if name.startswith(prefix))
+
+
+class SensitivityAnalysis(object):
+    """
+    Batched +/- perturbation runs of all sens_* parameters.
+    """
+
+    def __init__(self, model, size=(20, 20), delta=0.02, relaxation_steps=10000, sampling_steps=10000,
+                 replicas=4, workers=1, parameters=None, seed=0, names=None, kmc_class=AcceleratedKMC):
+        """
+        Parameters:
+        -----------
+        model: XMLModel or str
+            model or path of the exported xml file
+        size: 2-tuple of int
+        delta: float
+            perturbation of the sens_* parameters in eV
+        relaxation_steps: int
+            kmc steps before the tofs are sampled
+        sampling_steps: int
+            kmc steps to sample the tofs
+        replicas: int
+            independent pairs of +/- runs per parameter
+        workers: int
+            number of worker processes
+        parameters: dict {name: value}
+            parameter values, which replace those of the model, e.g. {'T': 600}
+        seed: int
+            seed of the first replica, replica r uses seed + r
+        names: 1-D list of str
+            sensitivity parameters to perturb, defaults to all sens_* parameters
+        kmc_class: see run_pool
+        """
+        if not isinstance(model, XMLModel):
+            model = XMLModel.from_file(model)
+        self.model = model
+        self.size = tuple(size)
+        self.delta = delta
+        self.relaxation_steps = relaxation_steps
+        self.sampling_steps = sampling_steps
+        self.replicas = replicas
+        self.workers = workers
+        self.parameters = dict(parameters or {})
+        self.seed = seed
+        self.sensitivity_parameters = names or sensitivity_parameters(model.parameters)
+        self.kmc_class = kmc_class
+
+    def jobs(self):
+        """
+        Returns:
+        --------
+        jobs: 1-D list of 4-tuples
+            [(parameter, sign, replica, {parameter: value}), ]
+        """
+        jobs = []
+        for name in self.sensitivity_parameters:
+            value = float(self.parameters.get(name, self.model.parameters[name]))
+            for replica in range(self.replicas):
+                for sign in [1, -1]:
+                    jobs.append((name, sign, replica, {name: value + sign * self.delta}))
+        return jobs
+
+    def run(self):
+        """
+        Run all perturbations.
+
+        Returns:
+        --------
+        results: dict {parameter: {'drc': {product: (value, error)}, 'dsc': {product: (value, error)}}}
+        """
+        jobs = self.jobs()
+        arguments = [(self.seed + replica, parameters) for _, _, replica, parameters in jobs]
+        settings = (dict(self.parameters), self.relaxation_steps, self.sampling_steps)
+        tofs = list(run_pool(run_perturbation, arguments, self.model, self.size, parameters=self.parameters,
+                             kmc_class=self.kmc_class, settings=settings, workers=self.workers))
+        return self.analyse(jobs, tofs)
+
+    def analyse(self, jobs, tofs):
+        """
+        Parameters:
+        -----------
+        jobs: see jobs()
+        tofs: 1-D list of dict {product: tof}, one per job
+
+        Returns:
+        --------
+        results: see run()
+        """
+        T = float(self.parameters.get('T', self.model.parameters['T']))
+        kT = thermochemistry.kboltzmann * T / thermochemistry.eV
+        products = self.model.tof_names
+
+        runs = {}
+        for (name, sign, replica, _), tof in zip(jobs, tofs):
+            runs[(name, sign, replica)] = np.array([tof[product] for product in products])
+
+        results = {}
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for name in self.sensitivity_parameters:
+                drc, dsc = [], []
+                missing = set()
+                for replica in range(self.replicas):
+                    plus, minus = runs[(name, 1, replica)], runs[(name, -1, replica)]
+                    counted = (plus > 0) & (minus > 0)
+                    missing.update(product for j, product in enumerate(products) if not counted[j])
+                    drc.append(np.where(counted, -kT * (np.log(plus) - np.log(minus)) / (2 * self.delta), np.nan))
+                    dsc.append(np.where(counted, -kT * (np.log(plus / plus.sum()) - np.log(minus / minus.sum()))
+                                        / (2 * self.delta), np.nan))
+                if missing:
+                    print(warning_messages['no_counts'] % (', '.join(sorted(missing)), name))
+                results[name] = {
+                    'drc': self.__class__.statistics(products, drc),
+                    'dsc': self.__class__.statistics(products, dsc),
+                }
+        return results
+
+    @staticmethod
+    def statistics(products, estimates):
+        """ mean and standard error over replicas per product """
+        estimates = np.array(estimates)
+        mean = estimates.mean(axis=0)
+        if len(estimates) > 1:
+            error = estimates.std(axis=0, ddof=1) / np.sqrt(len(estimates))
+        else:
+            error = np.nan * mean
+        return dict((product, (mean[j], error[j])) for j, product in enumerate(products))
+
+
+def run_perturbation(kmc, settings, argument):
+    """ tofs of a single run, sampled after relaxation, see run_pool """
+    seed, perturbation = argument
+    parameters, relaxation_steps, sampling_steps = settings
+    run_parameters = dict((name, kmc.model.parameters[name]) for name in sensitivity_parameters(kmc.model.parameters))
+    run_parameters.update(parameters)
+    run_parameters.update(perturbation)
+    kmc.restart(run_parameters, seed)
+    return kmc.sample_tofs(relaxation_steps, sampling_steps)
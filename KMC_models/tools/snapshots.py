@@ -0,0 +1,230 @@
+"""
+Compact lattice snapshots and checkpoints of NumpyKMC runs.
+
+A snapshot is an uncompressed npz file with
+    lattice      the species numbers of all sites, two sites per byte if the
+                 model has at most 16 species (e.g. Rh111 and Rh211), else
+                 one site per byte
+    procstat     executions of each process, which give the tof counts
+    tof_counts   accumulated tof counts in the order of the tof names
+    rng_keys     state of the Mersenne twister
+    meta         json with the model name, species, sites, lattice size,
+                 kmc time and step, the rest of the random number state
+                 and the parameter values
+and the checkpoint_attributes of the kmc class, e.g. the scaling factors of
+AcceleratedKMC. Snapshots are written to a temporary file, which is renamed,
+so an interrupted write never replaces a good snapshot. The members of the
+npz file are stored without compression, so read_snapshot maps them into
+memory instead of reading the whole file.
+
+Usage:
+    save_snapshot(kmc, 'run.npz')
+    ...
+    kmc = NumpyKMC('Rh211_model_with_lateral_interactions.xml', size=(20, 20))
+    restore_snapshot(kmc, 'run.npz')   # continues the run exactly
+"""
+import json
+import os
+import struct
+import zipfile
+
+import numpy as np
+
+snapshot_version = 1
+
+error_messages = {
+    'mismatch': 'Snapshot %s does not match the model: %s differ',
+    'compressed': 'Member %s of %s is compressed and can not be memory mapped',
+}
+
+
+def pack_lattice(occupation, n_species):
+    """
+    Parameters:
+    -----------
+    occupation: 1-D numpy array of uint8
+        species number of each site
+    n_species: int
+
+    Returns:
+    --------
+    packed: 1-D numpy array of uint8
+    bits: int
+        bits per site, 4 or 8
+    """
+    occupation = np.asarray(occupation, dtype=np.uint8)
+    if n_species > 16:
+        return occupation.copy(), 8
+    if len(occupation) % 2:
+        occupation = np.append(occupation, np.uint8(0))
+    return (occupation[0::2] << 4) | occupation[1::2], 4
+
+
+def unpack_lattice(packed, bits, length):
+    """
+    Parameters:
+    -----------
+    packed: 1-D numpy array of uint8
+    bits: int
+    length: int
+        number of sites
+
+    Returns:
+    --------
+    occupation: 1-D numpy array of uint8
+    """
+    packed = np.asarray(packed, dtype=np.uint8)
+    if bits == 8:
+        return packed[:length].copy()
+    occupation = np.empty(2 * len(packed), dtype=np.uint8)
+    occupation[0::2] = packed >> 4
+    occupation[1::2] = packed & 15
+    return occupation[:length]
+
+
+def save_snapshot(kmc, filename):
+    """
+    Parameters:
+    -----------
+    kmc: NumpyKMC
+    filename: str
+    """
+    packed, bits = pack_lattice(kmc.occupation, len(kmc.species))
+    name, keys, position, has_gauss, cached_gaussian = kmc.random_state.get_state()
+    meta = {
+        'version': snapshot_version,
+        'model_name': kmc.model.model_name,
+        'species': kmc.species,
+        'sites': kmc.model.sites,
+        'processes': [process.name for process in kmc.model.processes],
+        'tof_names': kmc.tof_names,
+        'size': kmc.size,
+        'bits': bits,
+        'kmc_time': kmc.kmc_time,
+        'kmc_step': int(kmc.kmc_step),
+        'rng': [name, int(position), int(has_gauss), float(cached_gaussian)],
+        'parameters': kmc.evaluator.parameters,
+    }
+    arrays = {
+        'lattice': packed,
+        'procstat': kmc.procstat,
+        'tof_counts': kmc.procstat.dot(kmc.tof_matrix),
+        'rng_keys': keys,
+        'meta': np.array(json.dumps(meta, sort_keys=True, default=float)),
+    }
+    for attribute in kmc.checkpoint_attributes:
+        arrays['attribute_' + attribute] = np.asarray(getattr(kmc, attribute))
+
+    temporary = filename + '.tmp'
+    with open(temporary, 'wb') as outfile:
+        np.savez(outfile, **arrays)
+        outfile.flush()
+        os.fsync(outfile.fileno())
+    os.rename(temporary, filename)
+
+
+def mmap_npz(filename):
+    """
+    Parameters:
+    -----------
+    filename: str
+        npz file written by numpy.savez (without compression)
+
+    Returns:
+    --------
+    arrays: dict {name: numpy memmap}
+    """
+    arrays = {}
+    with zipfile.ZipFile(filename) as archive, open(filename, 'rb') as infile:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(error_messages['compressed'] % (info.filename, filename))
+            # local file header: 30 bytes, the file name and an extra field
+            infile.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack('<HH', infile.read(4))
+            infile.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(infile)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(infile)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(infile)
+            name = info.filename[:-len('.npy')] if info.filename.endswith('.npy') else info.filename
+            if not int(np.prod(shape)):
+                arrays[name] = np.zeros(shape, dtype=dtype)
+                continue
+            arrays[name] = np.memmap(filename, dtype=dtype, mode='r', offset=infile.tell(), shape=shape,
+                                     order='F' if fortran_order else 'C')
+    return arrays
+
+
+def read_snapshot(filename):
+    """
+    Parameters:
+    -----------
+    filename: str
+
+    Returns:
+    --------
+    meta: dict
+        see the module docstring
+    arrays: dict {name: numpy memmap}
+        lattice, procstat, tof_counts, rng_keys and attribute_[name]
+    """
+    arrays = mmap_npz(filename)
+    meta = json.loads(str(arrays.pop('meta')[()]))
+    return meta, arrays
+
+
+def read_lattice(filename):
+    """
+    Returns:
+    --------
+    lattice: 3-D numpy array of uint8, shape (size x, size y, sites)
+        species numbers, see meta['species'] of read_snapshot
+    """
+    meta, arrays = read_snapshot(filename)
+    n_sites = len(meta['sites'])
+    length = meta['size'][0] * meta['size'][1] * n_sites
+    return unpack_lattice(arrays['lattice'], meta['bits'], length).reshape(meta['size'][0], meta['size'][1], n_sites)
+
+
+def restore_snapshot(kmc, filename):
+    """
+    Restore lattice, time, counters, random number state and parameters of
+    a snapshot into kmc, which has to be a model with the same species,
+    sites, processes and lattice size.
+
+    Parameters:
+    -----------
+    kmc: NumpyKMC
+    filename: str
+
+    Returns:
+    --------
+    meta: dict
+    """
+    meta, arrays = read_snapshot(filename)
+    for key, value in [('species', kmc.species), ('sites', kmc.model.sites), ('size', list(kmc.size)),
+                       ('processes', [process.name for process in kmc.model.processes])]:
+        if list(meta[key]) != list(value):
+            raise ValueError(error_messages['mismatch'] % (filename, key))
+
+    changed = dict((name, value) for name, value in meta['parameters'].items()
+                   if kmc.evaluator.parameters.get(name) != value)
+    if changed:
+        kmc.evaluator.set_parameters(**changed)
+        if any(name in kmc.compiled_rates.fixed for name in changed):
+            kmc.compile_rate_constants()
+
+    kmc.occupation = unpack_lattice(arrays['lattice'], meta['bits'], len(kmc.occupation))
+    kmc.kmc_time = meta['kmc_time']
+    kmc.kmc_step = meta['kmc_step']
+    kmc.procstat = np.array(arrays['procstat'], dtype=np.int64)
+    name, position, has_gauss, cached_gaussian = meta['rng']
+    kmc.random_state.set_state((name, np.array(arrays['rng_keys']), position, has_gauss, cached_gaussian))
+    for attribute in kmc.checkpoint_attributes:
+        value = np.array(arrays['attribute_' + attribute])
+        setattr(kmc, attribute, value.item() if value.ndim == 0 else value)
+    kmc.update_rate_constants()
+    kmc.update_rates()
+    return meta
@@ -0,0 +1,383 @@
+"""
+Formation energies, frequencies and geometries of the adsorbates and
+transition states in the folder structures.
+
+Each subfolder (e.g. Yang_structures) has a data.txt table
+
+    name        formation energy    frequencies
+    CH-H-s       0.21                 56.0,  380.0, ...
+
+and the geometries [facet]/[name].xyz. A name is the species and the site,
+e.g. CH-H-s is the transition state of CH + H on the s site, and the facet is
+the folder of its xyz file.
+
+All tables and geometries are parsed into flat numpy arrays, which are cached
+in a npz file next to the structures. The cache is rebuilt when a data.txt or
+xyz file is added, removed or modified.
+
+Usage:
+    db = StructureDatabase()
+    db.energy('CH-H', 's')          # 0.21
+    db.frequencies('CO', 't')       # array([60., 231., ...])
+    db.geometry('CO', 't', 'Rh111') # (symbols, positions)
+"""
+import glob
+import os
+
+import numpy as np
+
+default_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'structures')
+cache_version = 1
+
+error_messages = {
+    'data_line': 'Line %i of %s is not [name] [formation energy] [frequencies]',
+    'xyz': 'Number of atoms in %s does not match its header',
+    'structure': 'No structure %s',
+}
+warning_messages = {
+    'cache': 'Warning: could not write the structure cache %s (%s)',
+    'duplicate': 'Warning: structure %s is listed in %s and %s, using %s',
+}
+
+
+def split_name(name):
+    """
+    Parameters:
+    -----------
+    name: str
+        e.g. 'CH-H-s'
+
+    Returns:
+    --------
+    species: str
+        e.g. 'CH-H'
+    site: str
+        e.g. 's'
+    """
+    species, site = name.rsplit('-', 1)
+    return species, site
+
+
+def read_data_file(filename):
+    """
+    Parameters:
+    -----------
+    filename: str
+        path of a data.txt table
+
+    Returns:
+    --------
+    entries: 1-D list of 3-tuples
+        [(name, formation energy in eV, 1-D list of frequencies in cm^-1), ]
+    """
+    entries = []
+    with open(filename) as infile:
+        for number, line in enumerate(infile):
+            words = line.replace(',', ' ').split()
+            if number == 0 or not words:
+                continue
+            try:
+                entries.append((words[0], float(words[1]), [float(word) for word in words[2:]]))
+            except (IndexError, ValueError):
+                raise ValueError(error_messages['data_line'] % (number + 1, filename))
+    return entries
+
+
+def read_xyz(filename):
+    """
+    Parameters:
+    -----------
+    filename: str
+
+    Returns:
+    --------
+    comment: str
+    symbols: 1-D list of str
+    positions: 2-D numpy array, shape (atoms, 3)
+        in Angstrom
+    """
+    with open(filename) as infile:
+        lines = infile.read().splitlines()
+    number = int(lines[0])
+    atoms = [line.split() for line in lines[2:] if line.strip()]
+    if len(atoms) != number:
+        raise ValueError(error_messages['xyz'] % filename)
+    symbols = [atom[0] for atom in atoms]
+    positions = np.array([[float(x) for x in atom[1:4]] for atom in atoms]).reshape(-1, 3)
+    return lines[1].strip(), symbols, positions
+
+
+class StructureDatabase(object):
+    """
+    Array-backed store of all structures, indexed by (species, site, facet).
+
+    Frequencies and geometries of structure i are the slices
+    frequency_offsets[i]:frequency_offsets[i+1] of all_frequencies and
+    atom_offsets[i]:atom_offsets[i+1] of all_symbols and all_positions.
+    """
+
+    array_names = [
+        'names', 'species', 'sites', 'facets', 'sources', 'comments', 'energies',
+        'all_frequencies', 'frequency_offsets', 'all_symbols', 'all_positions', 'atom_offsets',
+    ]
+
+    def __init__(self, directory=None, cache='structures_cache.npz'):
+        """
+        Parameters:
+        -----------
+        directory: str
+            folder with one subfolder per data source, defaults to the
+            structures folder of this repository
+        cache: str or None
+            file name of the cache in directory (or an absolute path), None
+            to always parse the text files
+        """
+        self.directory = os.path.abspath(directory or default_directory)
+        if cache is not None:
+            cache = os.path.join(self.directory, cache)
+        self.cache = cache
+
+        self.source_files = self.find_files()
+        self.mtimes = np.array([os.path.getmtime(os.path.join(self.directory, filename))
+                                for filename in self.source_files])
+        if not self.load_cache():
+            self.parse()
+            self.save_cache()
+        self.build_index()
+
+    def find_files(self):
+        """ all data.txt and xyz files, sorted """
+        files = glob.glob(os.path.join(self.directory, '*', 'data.txt'))
+        files += glob.glob(os.path.join(self.directory, '*', '*', '*.xyz'))
+        return sorted(os.path.relpath(filename, self.directory) for filename in files)
+
+    def parse(self):
+        """ read all text files into the flat arrays """
+        geometries = {}
+        for filename in self.source_files:
+            if filename.endswith('.xyz'):
+                source, facet, basename = filename.split(os.sep)
+                geometries[(source, os.path.splitext(basename)[0])] = (facet, filename)
+
+        columns = dict((name, []) for name in ['names', 'species', 'sites', 'facets', 'sources', 'comments',
+                                               'energies', 'frequencies', 'symbols', 'positions'])
+        frequency_offsets, atom_offsets = [0], [0]
+        for filename in self.source_files:
+            if not filename.endswith('data.txt'):
+                continue
+            source = os.path.dirname(filename)
+            for name, energy, frequencies in read_data_file(os.path.join(self.directory, filename)):
+                species, site = split_name(name)
+                facet, xyz_file = geometries.get((source, name), ('', None))
+                if xyz_file is not None:
+                    comment, symbols, positions = read_xyz(os.path.join(self.directory, xyz_file))
+                else:
+                    comment, symbols, positions = '', [], np.zeros((0, 3))
+                for key, value in [('names', name), ('species', species), ('sites', site), ('facets', facet),
+                                   ('sources', source), ('comments', comment), ('energies', energy)]:
+                    columns[key].append(value)
+                columns['frequencies'].extend(frequencies)
+                columns['symbols'].extend(symbols)
+                columns['positions'].extend(positions)
+                frequency_offsets.append(frequency_offsets[-1] + len(frequencies))
+                atom_offsets.append(atom_offsets[-1] + len(symbols))
+
+        for key in ['names', 'species', 'sites', 'facets', 'sources', 'comments']:
+            setattr(self, key, np.array(columns[key], dtype=str))
+        self.energies = np.array(columns['energies'], dtype=float)
+        self.all_frequencies = np.array(columns['frequencies'], dtype=float)
+        self.all_symbols = np.array(columns['symbols'], dtype=str)
+        self.all_positions = np.array(columns['positions'], dtype=float).reshape(-1, 3)
+        self.frequency_offsets = np.array(frequency_offsets, dtype=int)
+        self.atom_offsets = np.array(atom_offsets, dtype=int)
+
+    def load_cache(self):
+        """ load the arrays from the cache, if it is up to date """
+        if self.cache is None or not os.path.isfile(self.cache):
+            return False
+        try:
+            with np.load(self.cache, allow_pickle=False) as data:
+                if (int(data['version']) != cache_version
+                        or list(data['source_files']) != self.source_files
+                        or not np.array_equal(data['mtimes'], self.mtimes)):
+                    return False
+                for key in self.array_names:
+                    setattr(self, key, data[key])
+        except (IOError, OSError, KeyError, ValueError):
+            return False
+        return True
+
+    def save_cache(self):
+        if self.cache is None:
+            return
+        arrays = dict((key, getattr(self, key)) for key in self.array_names)
+        arrays.update(version=cache_version, source_files=np.array(self.source_files, dtype=str),
+                      mtimes=self.mtimes)
+        try:
+            with open(self.cache, 'wb') as outfile:
+                np.savez(outfile, **arrays)
+        except (IOError, OSError) as error:
+            print(warning_messages['cache'] % (self.cache, error))
+
+    def build_index(self):
+        """
+        index[(species, site, facet)] and index[(species, site)] = structure
+        number, where later sources replace earlier ones
+        """
+        self.index = {}
+        for i, (species, site, facet) in enumerate(zip(self.species, self.sites, self.facets)):
+            for key in [(species, site, facet), (species, site)]:
+                if key in self.index and self.sources[self.index[key]] != self.sources[i]:
+                    print(warning_messages['duplicate'] % (
+                        '-'.join(key), self.sources[self.index[key]], self.sources[i], self.sources[i]))
+                self.index[key] = i
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, key):
+        return tuple(key) in self.index
+
+    def lookup(self, species, site, facet=None):
+        """
+        Parameters:
+        -----------
+        species: str
+            e.g. 'CH-H'
+        site: str
+            e.g. 's'
+        facet: str or None
+            e.g. 'Rh211', None for any facet
+
+        Returns:
+        --------
+        i: int
+            structure number
+        """
+        key = (species, site) if facet is None else (species, site, facet)
+        try:
+            return self.index[key]
+        except KeyError:
+            raise KeyError(error_messages['structure'] % '-'.join(key))
+
+    def energy(self, species, site, facet=None):
+        """ formation energy in eV """
+        return float(self.energies[self.lookup(species, site, facet)])
+
+    def frequencies(self, species, site, facet=None):
+        """ frequencies in cm^-1 as 1-D numpy array """
+        i = self.lookup(species, site, facet)
+        return self.all_frequencies[self.frequency_offsets[i]:self.frequency_offsets[i + 1]]
+
+    def geometry(self, species, site, facet=None):
+        """
+        Returns:
+        --------
+        symbols: 1-D numpy array of str
+        positions: 2-D numpy array, shape (atoms, 3)
+            in Angstrom
+        """
+        i = self.lookup(species, site, facet)
+        atoms = slice(self.atom_offsets[i], self.atom_offsets[i + 1])
+        return self.all_symbols[atoms], self.all_positions[atoms]
+
+    def select(self, species=None, site=None, facet=None):
+        """
+        Returns:
+        --------
+        numbers: 1-D numpy array of int
+            all structures that match the given species, site and facet
+        """
+        mask = np.ones(len(self), dtype=bool)
+        for values, value in [(self.species, species), (self.sites, site), (self.facets, facet)]:
+            if value is not None:
+                mask &= values == value
+        return np.flatnonzero(mask)
+
+
+def parameter_name(prefix, species, site):
+    """
+    Parameters:
+    -----------
+    prefix: str
+        'E' or 'f'
+    species: str
+        e.g. 'CH-H'
+    site: str
+        e.g. 's'
+
+    Returns:
+    --------
+    name: str
+        e.g. 'E_CH_H_s'
+    """
+    return '%s_%s_%s' % (prefix, species.replace('-', '_'), site)
+
+
+def structure_parameters(database=None, species=None, sites=None, facets=None, sources=None):
+    """
+    Formation energies E_[species]_[site] and frequencies f_[species]_[site]
+    of the selected structures, formatted like the parameters of the models.
+
+    Parameters:
+    -----------
+    database: StructureDatabase or None
+        defaults to StructureDatabase()
+    species, sites, facets, sources: 1-D list of str or None
+        only structures of the listed species, sites, facets and data
+        sources (e.g. 'Yang_structures'), None for all
+
+    Returns:
+    --------
+    parameters: 1-D list of 2-tuples
+        [(name, value), ] with float energies and frequencies as str '[56.0, ...]'.
+        All energies come before all frequencies. The structures are ordered by
+        the position of their source in sources, then of their facet in facets,
+        then by their order in the data files.
+    """
+    if database is None:
+        database = StructureDatabase()
+    mask = np.ones(len(database), dtype=bool)
+    for values, selection in [(database.species, species), (database.sites, sites),
+                              (database.facets, facets), (database.sources, sources)]:
+        if selection is not None:
+            mask &= np.isin(values, list(selection))
+
+    order = np.flatnonzero(mask)
+    for values, selection in [(database.facets, facets), (database.sources, sources)]:
+        if selection is not None:
+            rank = dict((value, position) for position, value in enumerate(selection))
+            order = order[np.argsort([rank[value] for value in values[order]], kind='stable')]
+
+    energies, frequencies = [], []
+    for i in order:
+        species_name, site = str(database.species[i]), str(database.sites[i])
+        values = database.all_frequencies[database.frequency_offsets[i]:database.frequency_offsets[i + 1]]
+        energies.append((parameter_name('E', species_name, site), float(database.energies[i])))
+        frequencies.append((parameter_name('f', species_name, site),
+                            '[%s]' % ', '.join(repr(float(value)) for value in values)))
+    return energies + frequencies
+
+
+def add_structure_parameters(project, database=None, **selection):
+    """
+    Add the E_ and f_ parameters of the structure database to a kmos
+    project, replacing the values of parameters which already exist.
+
+    Parameters:
+    -----------
+    project: kmos project
+    database: StructureDatabase or None
+    selection: see structure_parameters
+
+    Returns:
+    --------
+    project: kmos project
+    """
+    existing = dict((param.name, param) for param in project.parameter_list)
+    for name, value in structure_parameters(database, **selection):
+        if name in existing:
+            existing[name].value = value
+        else:
+            project.add_parameter(name=name, value=value)
+    return project
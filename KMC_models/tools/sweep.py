@@ -0,0 +1,225 @@
+"""
+Sweeps of a model over grids or lists of conditions, e.g. T and partial
+pressures, with AcceleratedKMC or another NumpyKMC class.
+
+Every worker process compiles the model once and runs the conditions it is
+given. Results are appended to a SweepStore as soon as they are finished, so
+an interrupted sweep continues with the missing conditions only.
+
+With a warm start directory each point starts from the stored steady state
+lattice of the nearest condition (see tools/warm_start.py) and relaxes for
+warm_relaxation_steps only. The lattice of each finished point is added to
+the library. The library is frozen when the Sweep is created, so the points
+only start from lattices stored before, and the results don't depend on the
+order of the points or the number of workers. A resumed sweep also starts
+from the lattices of the points finished before the interruption.
+
+Usage:
+    sweep = Sweep('Rh211_model_with_lateral_interactions.xml', 'sweep_results',
+                  condition_grid(T=[500, 550, 600], p_COgas=[1., 6.66]), workers=4)
+    results = sweep.run()
+"""
+import glob
+import json
+import os
+import zlib
+from itertools import product
+
+from .acceleration import AcceleratedKMC
+from .kmc_pool import run_pool
+from .warm_start import WarmStartLibrary
+from .xml_model import XMLModel
+
+
+def condition_grid(**axes):
+    """
+    Parameters:
+    -----------
+    axes: parameter name = 1-D list of values
+
+    Returns:
+    --------
+    conditions: 1-D list of dict {name: value}
+        all combinations of the values
+    """
+    names = sorted(axes)
+    return [dict(zip(names, values)) for values in product(*[axes[name] for name in names])]
+
+
+def condition_key(conditions):
+    """ unique string of a condition dict """
+    return json.dumps(conditions, sort_keys=True)
+
+
+class SweepStore(object):
+    """
+    Results of a sweep in a directory of chunk files chunk_[n].jsonl, with one
+    json result per line. Each result is flushed to disk when it is added,
+    an incomplete last line of an interrupted sweep is ignored.
+    """
+
+    def __init__(self, directory, chunk_size=100):
+        """
+        Parameters:
+        -----------
+        directory: str
+        chunk_size: int
+            number of results per chunk file
+        """
+        self.directory = directory
+        self.chunk_size = chunk_size
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.results = {}
+        self.chunk = 0
+        self.chunk_length = 0
+        self.load()
+
+    def chunk_files(self):
+        return sorted(glob.glob(os.path.join(self.directory, 'chunk_*.jsonl')))
+
+    @staticmethod
+    def chunk_number(filename):
+        """ n of chunk_[n].jsonl """
+        return int(os.path.basename(filename)[len('chunk_'):-len('.jsonl')])
+
+    def load(self):
+        """
+        read all complete results, new results go into a new chunk after the
+        highest chunk number, also if chunk files are missing
+        """
+        chunk_files = self.chunk_files()
+        for filename in chunk_files:
+            with open(filename) as infile:
+                for line in infile:
+                    try:
+                        result = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.results[condition_key(result['conditions'])] = result
+        self.chunk = max([self.__class__.chunk_number(filename) + 1 for filename in chunk_files] or [0])
+        self.chunk_length = 0
+
+    def __contains__(self, conditions):
+        return condition_key(conditions) in self.results
+
+    def add(self, result):
+        """
+        Parameters:
+        -----------
+        result: dict
+            with the key 'conditions'
+        """
+        if self.chunk_length >= self.chunk_size:
+            self.chunk += 1
+            self.chunk_length = 0
+        filename = os.path.join(self.directory, 'chunk_%05d.jsonl' % self.chunk)
+        with open(filename, 'a') as outfile:
+            outfile.write(json.dumps(result, sort_keys=True) + '\n')
+            outfile.flush()
+            os.fsync(outfile.fileno())
+        self.chunk_length += 1
+        self.results[condition_key(result['conditions'])] = result
+
+    def get(self, conditions):
+        return self.results.get(condition_key(conditions))
+
+
+class Sweep(object):
+    """
+    Runs a model for a list of conditions on a process pool.
+    """
+
+    def __init__(self, model, directory, conditions, size=(20, 20), relaxation_steps=10000,
+                 sampling_steps=10000, workers=1, seed=0, chunk_size=100, warm_start=None,
+                 warm_relaxation_steps=None, kmc_class=AcceleratedKMC):
+        """
+        Parameters:
+        -----------
+        model: XMLModel or str
+            model or path of the exported xml file
+        directory: str
+            directory of the SweepStore
+        conditions: 1-D list of dict {name: value}
+            parameter values of each point, see condition_grid
+        size: 2-tuple of int
+        relaxation_steps: int
+            kmc steps before the tofs are sampled
+        sampling_steps: int
+        workers: int
+            number of worker processes
+        seed: int
+            the seed of each point is derived from seed and its conditions
+        chunk_size: int
+        warm_start: str or None
+            directory of a WarmStartLibrary, None to start from empty lattices.
+            The library is frozen here, see WarmStartLibrary.freeze
+        warm_relaxation_steps: int or None
+            kmc steps before sampling of points started from the library,
+            defaults to 5% of relaxation_steps
+        kmc_class: see run_pool
+        """
+        if not isinstance(model, XMLModel):
+            model = XMLModel.from_file(model)
+        self.model = model
+        self.store = SweepStore(directory, chunk_size)
+        self.conditions = conditions
+        self.size = tuple(size)
+        self.relaxation_steps = relaxation_steps
+        self.sampling_steps = sampling_steps
+        self.workers = workers
+        self.seed = seed
+        self.warm_start = warm_start
+        self.library = WarmStartLibrary(warm_start).freeze() if warm_start else None
+        if warm_relaxation_steps is None:
+            warm_relaxation_steps = relaxation_steps // 20
+        self.warm_relaxation_steps = warm_relaxation_steps
+        self.kmc_class = kmc_class
+
+    def pending(self):
+        """ conditions without result in the store """
+        return [conditions for conditions in self.conditions if conditions not in self.store]
+
+    def point_seed(self, conditions):
+        return (self.seed + zlib.crc32(condition_key(conditions).encode('utf-8'))) & 0x7fffffff
+
+    def run(self):
+        """
+        Run all pending conditions.
+
+        Returns:
+        --------
+        results: 1-D list of dict
+            results of all conditions, in their order
+        """
+        arguments = [(conditions, self.point_seed(conditions)) for conditions in self.pending()]
+        settings = (dict(self.model.parameters), self.relaxation_steps, self.sampling_steps, self.library,
+                    self.warm_relaxation_steps)
+        for result in run_pool(run_point, arguments, self.model, self.size, kmc_class=self.kmc_class,
+                               settings=settings, workers=self.workers, ordered=False):
+            self.store.add(result)
+        return [self.store.get(conditions) for conditions in self.conditions]
+
+
+def run_point(kmc, settings, argument):
+    """ result of one condition, see run_pool """
+    conditions, seed = argument
+    parameters, relaxation_steps, sampling_steps, library, warm_relaxation_steps = settings
+    run_parameters = dict(parameters)
+    run_parameters.update(conditions)
+    kmc.restart(run_parameters, seed)
+    warm_start = library.seed(kmc) if library is not None else None
+    if warm_start is not None:
+        relaxation_steps = warm_relaxation_steps
+    tofs = kmc.sample_tofs(relaxation_steps, sampling_steps)
+    if library is not None:
+        library.add(kmc)
+    return {
+        'conditions': conditions,
+        'seed': seed,
+        'tofs': tofs,
+        'coverages': kmc.get_coverages(),
+        'kmc_time': kmc.kmc_time,
+        'kmc_steps': kmc.kmc_step,
+        'warm_start': warm_start['conditions'] if warm_start is not None else None,
+    }
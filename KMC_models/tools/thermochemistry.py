@@ -0,0 +1,294 @@
+"""
+Free energies of adsorbates and gas phase species, which enter the rate
+constants of the models as GibbsAds_[name] and GibbsGas_[name].
+
+Adsorbates are treated as harmonic oscillators with the frequencies f_[name]
+(in cm^-1) of the model parameters. Gas phase species are ideal gases, where
+rotations and vibrations are included if listed in gas_data and otherwise
+only the translational contribution is used.
+
+For sweeps over T, HarmonicTable tabulates the harmonic free energies and
+entropies of all adsorbates on a temperature grid in one numpy pass and
+interpolates them at any temperature.
+"""
+import ast
+import re
+
+import numpy as np
+
+# kmos.units
+kboltzmann = 1.3806488e-23
+h = 6.62606957e-34
+eV = 1.602176565e-19
+umass = 1.660538921e-27
+bar = 1e5
+angstrom = 1e-10
+c = 299792458.
+
+atomic_masses = {
+    'H': 1.008,
+    'C': 12.011,
+    'O': 15.999,
+}
+
+# rotational constants and harmonic frequencies in cm^-1, experimental values
+# of the NIST CCCBDB. conformers is the number of (nearly degenerate)
+# conformers, e.g. trans and two gauche ethanol, default 1
+gas_data = {
+    'CO': {'symmetry': 1, 'rotational_constants': [1.9313], 'frequencies': [2143.0]},
+    'H2': {'symmetry': 2, 'rotational_constants': [60.853], 'frequencies': [4401.0]},
+    'H2O': {'symmetry': 2, 'rotational_constants': [27.88, 14.51, 9.28], 'frequencies': [3657.0, 1595.0, 3756.0]},
+    'CH4': {
+        'symmetry': 12,
+        'rotational_constants': [5.241, 5.241, 5.241],
+        'frequencies': [2917.0, 1534.0, 1534.0, 3019.0, 3019.0, 3019.0, 1306.0, 1306.0, 1306.0],
+    },
+    'CH3CHO': {
+        'symmetry': 1,
+        'rotational_constants': [1.8875, 0.3393, 0.3031],
+        'frequencies': [3005.0, 2917.0, 2822.0, 1743.0, 1441.0, 1400.0, 1352.0, 1113.0, 919.0, 509.0,
+                        2967.0, 1420.0, 867.0, 763.0, 150.0],
+    },
+    'CH3CH2OH': {
+        'symmetry': 1,
+        'conformers': 3,
+        'rotational_constants': [1.1638, 0.3119, 0.2714],
+        'frequencies': [3676.0, 2985.0, 2939.0, 2900.0, 1490.0, 1452.0, 1394.0, 1367.0, 1241.0, 1089.0, 1062.0,
+                        885.0, 419.0, 2989.0, 2950.0, 1446.0, 1275.0, 1117.0, 812.0, 251.0, 243.0],
+    },
+}
+
+warning_messages = {
+    'gas_data': 'Warning: no rotational and vibrational data for %s, using the translational free energy only',
+}
+warned = set()
+
+
+def formula_mass(formula):
+    """
+    Parameters:
+    -----------
+    formula: str
+        e.g. 'CH3CH2OH'
+
+    Returns:
+    --------
+    mass: float
+        in atomic mass units
+    """
+    mass = 0.
+    for element, number in re.findall(r'([A-Z][a-z]?)(\d*)', formula):
+        mass += atomic_masses[element] * int(number or 1)
+    return mass
+
+
+def harmonic_free_energy(frequencies, T):
+    """
+    Zero point energy and vibrational free energy of harmonic oscillators.
+
+    Parameters:
+    -----------
+    frequencies: 1-D list of float
+        in cm^-1
+    T: float or numpy array
+        temperature in K
+
+    Returns:
+    --------
+    free_energy: float or numpy array
+        in eV
+    """
+    energies = np.asarray(frequencies, dtype=float) * 100 * h * c / eV
+    kT = np.multiply.outer(np.asarray(T, dtype=float), np.ones(len(energies))) * kboltzmann / eV
+    return np.sum(energies / 2 + kT * np.log(1 - np.exp(-energies / kT)), axis=-1)
+
+
+def ideal_gas_free_energy(formula, T, pressure, data=None):
+    """
+    Chemical potential of an ideal gas without electronic energy.
+
+    Parameters:
+    -----------
+    formula: str
+    T: float or numpy array
+        temperature in K
+    pressure: float
+        in bar
+    data: dict
+        symmetry, rotational_constants, frequencies and optionally conformers,
+        defaults to gas_data[formula]
+
+    Returns:
+    --------
+    free_energy: float or numpy array
+        in eV
+    """
+    if data is None:
+        data = gas_data.get(formula)
+    T = np.asarray(T, dtype=float)
+    kT = kboltzmann * T
+    mass = formula_mass(formula) * umass
+
+    free_energy = -kT * np.log((2 * np.pi * mass * kT / h ** 2) ** 1.5 * kT / (pressure * bar))
+    if data is None:
+        if formula not in warned:
+            warned.add(formula)
+            print(warning_messages['gas_data'] % formula)
+        return free_energy / eV
+
+    constants = np.array(data['rotational_constants']) * 100 * h * c
+    if len(constants) == 1:
+        q_rot = kT / (data['symmetry'] * constants[0])
+    else:
+        q_rot = np.sqrt(np.pi * kT ** 3 / np.prod(constants)) / data['symmetry']
+    free_energy = free_energy - kT * np.log(q_rot * data.get('conformers', 1))
+    return free_energy / eV + harmonic_free_energy(data['frequencies'], T)
+
+
+def harmonic_thermochemistry(frequency_lists, T):
+    """
+    Harmonic zero point energies, free energies, entropies and heat capacities
+    of many species in one pass.
+
+    Parameters:
+    -----------
+    frequency_lists: 1-D list of 1-D lists of float
+        frequencies in cm^-1 of each species
+    T: 1-D numpy array
+        temperatures in K
+
+    Returns:
+    --------
+    zero_point_energy: 1-D numpy array, shape (species,)
+        in eV
+    free_energy: 2-D numpy array, shape (species, temperatures)
+        zero point energy and vibrational free energy in eV, see harmonic_free_energy
+    entropy: 2-D numpy array, shape (species, temperatures)
+        in eV/K
+    heat_capacity: 2-D numpy array, shape (species, temperatures)
+        in eV/K
+    """
+    modes = max([len(frequencies) for frequencies in frequency_lists] + [1])
+    energies = np.zeros((len(frequency_lists), modes))
+    for i, frequencies in enumerate(frequency_lists):
+        energies[i, :len(frequencies)] = frequencies
+    energies *= 100 * h * c / eV
+    mask = energies > 0
+    energies[~mask] = 1.
+
+    k = kboltzmann / eV
+    x = energies[:, :, np.newaxis] / (k * np.asarray(T, dtype=float))
+    boltzmann = np.exp(-x)
+    occupation = boltzmann / (1 - boltzmann)
+    log_term = np.log(1 - boltzmann)
+    mask = mask[:, :, np.newaxis]
+
+    zero_point_energy = np.sum(np.where(mask[:, :, 0], energies / 2, 0.), axis=1)
+    free_energy = zero_point_energy[:, np.newaxis] + k * T * np.sum(np.where(mask, log_term, 0.), axis=1)
+    entropy = k * np.sum(np.where(mask, x * occupation - log_term, 0.), axis=1)
+    heat_capacity = k * np.sum(np.where(mask, x ** 2 * occupation * (1 + occupation), 0.), axis=1)
+    return zero_point_energy, free_energy, entropy, heat_capacity
+
+
+class HarmonicTable(object):
+    """
+    Harmonic free energies and entropies of many species tabulated on an
+    equidistant temperature grid. Between the grid points they are cubic
+    Hermite interpolants with the exact slopes dF/dT = -S and dS/dT = Cv/T.
+    Temperatures outside of the grid are evaluated directly.
+    """
+
+    def __init__(self, frequencies, T_min=100., T_max=1500., T_step=1.):
+        """
+        Parameters:
+        -----------
+        frequencies: dict {name: 1-D list of float}
+            frequencies in cm^-1, e.g. {'CO_t': [60.0, 231.0, ...]}
+        T_min, T_max, T_step: float
+            temperature grid in K
+        """
+        self.names = sorted(frequencies)
+        self.index = dict((name, i) for i, name in enumerate(self.names))
+        self.frequencies = dict((name, list(frequencies[name])) for name in self.names)
+        self.T_min = float(T_min)
+        self.T_step = float(T_step)
+        self.T = self.T_min + self.T_step * np.arange(int(round((T_max - T_min) / T_step)) + 1)
+        self.T_max = self.T[-1]
+
+        (self.zero_point_energy, self.free_energy_table, self.entropy_table,
+         self.heat_capacity_table) = harmonic_thermochemistry([self.frequencies[name] for name in self.names], self.T)
+        self.free_energy_slope = -self.entropy_table
+        self.entropy_slope = self.heat_capacity_table / self.T
+
+    @classmethod
+    def from_parameters(cls, parameters, **grid):
+        """
+        Table of all frequency parameters f_[name] of a model.
+
+        Parameters:
+        -----------
+        parameters: dict {name: value}
+            e.g. XMLModel.parameters, frequency values are lists or their str
+        grid: see __init__
+        """
+        frequencies = {}
+        for name, value in parameters.items():
+            if not name.startswith('f_'):
+                continue
+            if isinstance(value, str):
+                try:
+                    value = ast.literal_eval(value)
+                except (SyntaxError, ValueError):
+                    continue
+            if isinstance(value, (list, tuple)):
+                frequencies[name[2:]] = [float(frequency) for frequency in value]
+        return cls(frequencies, **grid)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def interpolate(self, table, slopes, rows, T):
+        """ cubic Hermite interpolation of table[rows] at T within the grid """
+        position = (T - self.T_min) / self.T_step
+        i = min(int(position), len(self.T) - 2)
+        t = position - i
+        t2, t3 = t * t, t * t * t
+        return ((2 * t3 - 3 * t2 + 1) * table[rows, i] + (t3 - 2 * t2 + t) * self.T_step * slopes[rows, i]
+                + (3 * t2 - 2 * t3) * table[rows, i + 1] + (t3 - t2) * self.T_step * slopes[rows, i + 1])
+
+    def free_energy(self, name, T):
+        """
+        Parameters:
+        -----------
+        name: str
+            e.g. 'CO_t'
+        T: float
+            temperature in K
+
+        Returns:
+        --------
+        free_energy: float
+            in eV, see harmonic_free_energy
+        """
+        if not self.T_min <= T <= self.T_max:
+            return float(harmonic_free_energy(self.frequencies[name], T))
+        return float(self.interpolate(self.free_energy_table, self.free_energy_slope, self.index[name], T))
+
+    def entropy(self, name, T):
+        """ vibrational entropy in eV/K """
+        if not self.T_min <= T <= self.T_max:
+            return float(harmonic_thermochemistry([self.frequencies[name]], np.array([T]))[2][0, 0])
+        return float(self.interpolate(self.entropy_table, self.entropy_slope, self.index[name], T))
+
+    def free_energies(self, T):
+        """
+        Returns:
+        --------
+        free_energies: dict {name: float}
+            free energies of all species at temperature T in eV
+        """
+        if not self.T_min <= T <= self.T_max:
+            values = harmonic_thermochemistry([self.frequencies[name] for name in self.names], np.array([T]))[1][:, 0]
+        else:
+            values = self.interpolate(self.free_energy_table, self.free_energy_slope, slice(None), T)
+        return dict(zip(self.names, values.tolist()))
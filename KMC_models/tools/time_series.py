@@ -0,0 +1,320 @@
+"""
+Streaming output of the tof counts, coverages and kmc time of long runs.
+
+A TimeSeriesWriter appends rows of float columns to a directory
+    meta.json            columns, chunk size, number of chunks and rows
+    chunk_[n].npy        complete chunks of shape (columns, rows)
+    tail.npy             the current chunk, preallocated and memory mapped
+Only the tail and one row are held in memory, so memory use does not grow
+with the length of the run. meta.json is replaced atomically every
+meta_interval rows, after the tail has been flushed, and after each chunk.
+
+While the run is going, the chunks and the tail are uncompressed npy files,
+which a TimeSeriesReader maps into memory, so it can read the whole run up
+to the last update of meta.json. With compress=True, close() replaces the
+chunks with compressed chunk_[n].npz files, one array per column. These are
+smaller but are read into memory completely. A continued time series adds
+npy chunks again until it is closed.
+
+Usage:
+    kmc = NumpyKMC('Rh211_model_with_lateral_interactions.xml', size=(20, 20))
+    record_run(kmc, 'run_output', steps=10**7, interval=10000)
+
+    series = TimeSeriesReader('run_output')      # also during the run
+    series.column('tof_CH4_formation')
+"""
+import json
+import os
+
+import numpy as np
+
+meta_version = 1
+
+error_messages = {
+    'columns': 'Columns of %s differ from the existing time series: %s',
+    'row': 'Row with %d values for %d columns',
+    'closed': 'Time series %s is closed',
+}
+
+
+def write_json(filename, data):
+    """ write data to a temporary file and rename it, readers never see a partial file """
+    temporary = filename + '.tmp'
+    with open(temporary, 'w') as outfile:
+        json.dump(data, outfile, sort_keys=True)
+    os.rename(temporary, filename)
+
+
+class TimeSeriesWriter(object):
+    """
+    Appends rows to a chunked columnar time series. An existing time series
+    with the same columns is continued.
+    """
+
+    def __init__(self, directory, columns, chunk_size=4096, compress=True, meta_interval=16):
+        """
+        Parameters:
+        -----------
+        directory: str
+        columns: 1-D list of str
+        chunk_size: int
+            number of rows per chunk file
+        compress: bool
+            compress the chunks when the time series is closed, else keep
+            the memory mappable npy chunks
+        meta_interval: int
+            rows between updates of meta.json, which makes them visible to
+            readers
+        """
+        self.directory = directory
+        self.meta_interval = meta_interval
+        self.columns = list(columns)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.meta_file = os.path.join(directory, 'meta.json')
+        self.tail_file = os.path.join(directory, 'tail.npy')
+
+        if os.path.isfile(self.meta_file):
+            with open(self.meta_file) as infile:
+                self.meta = json.load(infile)
+            if self.meta['columns'] != self.columns:
+                raise ValueError(error_messages['columns'] % (directory, self.meta['columns']))
+            self.meta['closed'] = False
+        else:
+            self.meta = {
+                'version': meta_version,
+                'columns': self.columns,
+                'chunk_size': chunk_size,
+                'compress': compress,
+                'chunks': 0,
+                'chunk_rows': [],
+                'tail_rows': 0,
+                'closed': False,
+            }
+        self.chunk_size = self.meta['chunk_size']
+        if os.path.isfile(self.tail_file):
+            self.tail = np.lib.format.open_memmap(self.tail_file, mode='r+')
+        else:
+            self.tail = np.lib.format.open_memmap(self.tail_file, mode='w+', dtype=np.float64,
+                                                  shape=(self.chunk_size, len(self.columns)))
+        write_json(self.meta_file, self.meta)
+
+    def __len__(self):
+        return sum(self.meta['chunk_rows']) + self.meta['tail_rows']
+
+    def append(self, row):
+        """
+        Parameters:
+        -----------
+        row: 1-D list of float or dict {column: float}
+        """
+        if self.meta['closed']:
+            raise ValueError(error_messages['closed'] % self.directory)
+        if isinstance(row, dict):
+            row = [row[column] for column in self.columns]
+        if len(row) != len(self.columns):
+            raise ValueError(error_messages['row'] % (len(row), len(self.columns)))
+        self.tail[self.meta['tail_rows']] = row
+        self.meta['tail_rows'] += 1
+        if self.meta['tail_rows'] == self.chunk_size:
+            self.write_chunk()
+        elif self.meta['tail_rows'] % self.meta_interval == 0:
+            self.flush()
+
+    def flush(self):
+        """ flush the tail and update meta.json, readers see all appended rows """
+        self.tail.flush()
+        write_json(self.meta_file, self.meta)
+
+    def write_chunk(self):
+        """ move the rows of the tail into a new chunk file """
+        rows = self.meta['tail_rows']
+        if not rows:
+            return
+        self.tail.flush()
+        data = self.tail[:rows]
+        filename = os.path.join(self.directory, 'chunk_%05d' % self.meta['chunks'])
+        # numpy adds the extension to a file name, but not to an open file
+        with open(filename + '.npy.tmp', 'wb') as outfile:
+            np.save(outfile, np.ascontiguousarray(data.T))
+        os.rename(filename + '.npy.tmp', filename + '.npy')
+        self.meta['chunks'] += 1
+        self.meta['chunk_rows'].append(rows)
+        self.meta['tail_rows'] = 0
+        write_json(self.meta_file, self.meta)
+
+    def compress_chunks(self):
+        """ replace the npy chunks with compressed npz chunks """
+        for n in range(self.meta['chunks']):
+            filename = os.path.join(self.directory, 'chunk_%05d' % n)
+            if not os.path.isfile(filename + '.npy'):
+                continue
+            data = np.load(filename + '.npy')
+            with open(filename + '.npz.tmp', 'wb') as outfile:
+                np.savez_compressed(outfile, **dict((column, data[c]) for c, column in enumerate(self.columns)))
+            os.rename(filename + '.npz.tmp', filename + '.npz')
+            os.remove(filename + '.npy')
+
+    def close(self):
+        """ write the remaining rows as the last chunk, compress the chunks and remove the tail """
+        if self.meta['closed']:
+            return
+        self.write_chunk()
+        if self.meta['compress']:
+            self.compress_chunks()
+        self.meta['closed'] = True
+        write_json(self.meta_file, self.meta)
+        del self.tail
+        os.remove(self.tail_file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class TimeSeriesReader(object):
+    """
+    Reads a time series of a TimeSeriesWriter, also while it is written.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.meta_file = os.path.join(directory, 'meta.json')
+        self.refresh()
+
+    def refresh(self):
+        """ read the current number of chunks and rows """
+        with open(self.meta_file) as infile:
+            self.meta = json.load(infile)
+        self.columns = self.meta['columns']
+
+    def __len__(self):
+        return sum(self.meta['chunk_rows']) + self.meta['tail_rows']
+
+    def chunk(self, n, columns=None):
+        """
+        Parameters:
+        -----------
+        n: int
+            chunk number
+        columns: 1-D list of str or None
+            None for all columns
+
+        Returns:
+        --------
+        data: dict {column: 1-D numpy array}
+            memory mapped for npy chunks
+        """
+        columns = columns or self.columns
+        filename = os.path.join(self.directory, 'chunk_%05d' % n)
+        try:
+            data = np.load(filename + '.npy', mmap_mode='r')
+        except IOError:
+            # compressed by TimeSeriesWriter.close
+            with np.load(filename + '.npz') as data:
+                return dict((column, data[column]) for column in columns)
+        return dict((column, data[self.columns.index(column)]) for column in columns)
+
+    def tail(self, columns=None):
+        """ rows of the current chunk as dict {column: memory mapped 1-D numpy array} """
+        columns = columns or self.columns
+        rows = self.meta['tail_rows']
+        if not rows:
+            return dict((column, np.zeros(0)) for column in columns)
+        data = np.load(os.path.join(self.directory, 'tail.npy'), mmap_mode='r')
+        return dict((column, data[:rows, self.columns.index(column)]) for column in columns)
+
+    def chunks(self, columns=None):
+        """ iterate over all chunks and the tail, each as dict {column: 1-D numpy array} """
+        for n in range(self.meta['chunks']):
+            yield self.chunk(n, columns)
+        if self.meta['tail_rows']:
+            yield self.tail(columns)
+
+    def read(self, columns=None):
+        """
+        Returns:
+        --------
+        data: dict {column: 1-D numpy array}
+            all rows written so far
+        """
+        columns = columns or self.columns
+        while True:
+            self.refresh()
+            chunks = self.meta['chunks']
+            parts = [dict((column, np.array(values)) for column, values in chunk.items())
+                     for chunk in self.chunks(columns)]
+            self.refresh()
+            # the tail was moved into a new chunk while reading it
+            if self.meta['chunks'] == chunks:
+                break
+        if not parts:
+            return dict((column, np.zeros(0)) for column in columns)
+        return dict((column, np.concatenate([part[column] for part in parts])) for column in columns)
+
+    def column(self, name):
+        return self.read([name])[name]
+
+
+def kmc_columns(kmc):
+    """
+    Columns of record_run: kmc_step, kmc_time, the accumulated tof counts
+    count_[tof], the tofs tof_[tof] per unit cell and second since the
+    previous row and the coverages cov_[site]_[species].
+    """
+    columns = ['kmc_step', 'kmc_time']
+    columns += ['count_%s' % name for name in kmc.tof_names]
+    columns += ['tof_%s' % name for name in kmc.tof_names]
+    columns += ['cov_%s_%s' % (site, species) for site in kmc.model.sites for species in kmc.species]
+    return columns
+
+
+def kmc_row(kmc, previous_time, previous_counts):
+    """ values of kmc_columns for the current state of kmc """
+    counts = kmc.procstat.dot(kmc.tof_matrix)
+    dt = kmc.kmc_time - previous_time
+    tofs = (counts - previous_counts) / (dt * kmc.n_cells) if dt > 0 else np.zeros(len(counts))
+    occupation = kmc.occupation.reshape(kmc.n_cells, kmc.n_sites)
+    coverages = [np.bincount(occupation[:, s], minlength=len(kmc.species)) / float(kmc.n_cells)
+                 for s in range(kmc.n_sites)]
+    return np.concatenate([[kmc.kmc_step, kmc.kmc_time], counts, tofs] + coverages), counts
+
+
+def record_run(kmc, directory, steps, interval, chunk_size=4096, compress=True, meta_interval=16):
+    """
+    Run kmc and append a row of kmc_columns every interval steps.
+
+    Parameters:
+    -----------
+    kmc: NumpyKMC
+    directory: str
+        directory of the time series, an existing one is continued
+    steps: int
+        number of kmc steps
+    interval: int
+        kmc steps between rows
+    chunk_size, compress, meta_interval: see TimeSeriesWriter
+
+    Returns:
+    --------
+    rows: int
+        number of rows in the time series
+    """
+    writer = TimeSeriesWriter(directory, kmc_columns(kmc), chunk_size, compress, meta_interval)
+    try:
+        previous_time, previous_counts = kmc.kmc_time, kmc.procstat.dot(kmc.tof_matrix)
+        done = 0
+        while done < steps:
+            n = min(interval, steps - done)
+            executed = kmc.do_steps(n)
+            done += executed
+            row, previous_counts = kmc_row(kmc, previous_time, previous_counts)
+            previous_time = kmc.kmc_time
+            writer.append(row)
+            if executed < n:
+                break
+    finally:
+        writer.close()
+    return len(writer)
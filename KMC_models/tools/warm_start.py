@@ -0,0 +1,203 @@
+"""
+Library of steady state lattices for warm starts of kmc runs.
+
+A run from the empty lattice spends a large part of its steps building up
+the CO coverage. The library stores the lattice of finished runs as
+snapshots (see tools/snapshots.py), keyed by the model and the operating
+conditions T, p_COgas and p_H2gas, and seeds new runs from the closest stored
+condition of the same model, with the distance
+    d^2 = ((T - T')/T_scale)^2 + ln(p_COgas/p_COgas')^2 + ln(p_H2gas/p_H2gas')^2
+The lattice is copied if the lattice sizes agree, otherwise random sites
+are occupied with the stored coverages.
+
+Each entry is a pair of files [key].npz and [key].json, which are written
+atomically, so several sweep workers can share a library.
+
+Which entries exist while a sweep runs depends on the order in which its
+points finish, i.e. on the number of workers. A frozen library (see freeze)
+seeds runs from the entries and lattices read at the time of freezing only,
+while new entries are still written to the directory.
+
+Usage:
+    library = WarmStartLibrary('warm_start')
+    kmc.restart({'T': 560.})
+    library.seed(kmc)
+    tofs = kmc.sample_tofs(5000, 100000)
+    library.add(kmc)
+"""
+import glob
+import hashlib
+import json
+import os
+from math import log, sqrt
+
+import numpy as np
+
+from .snapshots import read_snapshot, save_snapshot, unpack_lattice
+from .time_series import write_json
+
+condition_names = ['T', 'p_COgas', 'p_H2gas']
+
+
+def model_signature(model):
+    """
+    Parameters:
+    -----------
+    model: XMLModel
+
+    Returns:
+    --------
+    signature: str
+        hash of model name, species, sites and process names
+    """
+    description = json.dumps([model.model_name, model.species, model.sites,
+                              [process.name for process in model.processes]])
+    return hashlib.sha1(description.encode('utf-8')).hexdigest()[:16]
+
+
+class WarmStartLibrary(object):
+    """
+    Steady state lattices in a directory, one snapshot per model, condition
+    and lattice size.
+    """
+
+    def __init__(self, directory, T_scale=50.):
+        """
+        Parameters:
+        -----------
+        directory: str
+        T_scale: float
+            temperature difference in K, which counts as much as a factor e
+            in a partial pressure
+        """
+        self.directory = directory
+        self.T_scale = T_scale
+        self.frozen = None
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def freeze(self):
+        """
+        Keep the current entries and their lattices in memory and seed runs
+        from them only. Entries added later are written, but not used.
+
+        Returns:
+        --------
+        library: WarmStartLibrary
+            self
+        """
+        self.frozen = None
+        entries = self.entries()
+        lattices = {}
+        for entry in entries:
+            meta, arrays = read_snapshot(os.path.join(self.directory, entry['file']))
+            lattices[entry['file']] = (meta['bits'], np.array(arrays['lattice']))
+        self.frozen = (entries, lattices)
+        return self
+
+    def entries(self):
+        """
+        Returns:
+        --------
+        entries: 1-D list of dict
+            model, conditions, size, coverages and file of every snapshot,
+            the frozen entries of a frozen library
+        """
+        if self.frozen is not None:
+            return list(self.frozen[0])
+        entries = []
+        for filename in sorted(glob.glob(os.path.join(self.directory, '*.json'))):
+            try:
+                with open(filename) as infile:
+                    entries.append(json.load(infile))
+            except (IOError, ValueError):
+                continue
+        return entries
+
+    def conditions(self, kmc):
+        """ current values of the condition_names of kmc """
+        return dict((name, float(kmc.evaluator.value(name))) for name in condition_names)
+
+    def distance(self, conditions, other):
+        return sqrt(((conditions['T'] - other['T']) / self.T_scale) ** 2
+                    + sum(log(conditions[name] / other[name]) ** 2 for name in condition_names[1:]))
+
+    def nearest(self, kmc, max_distance=None):
+        """
+        Parameters:
+        -----------
+        kmc: NumpyKMC
+        max_distance: float or None
+            ignore stored conditions further away
+
+        Returns:
+        --------
+        entry: dict or None
+            closest stored condition of the model of kmc, entries with the
+            lattice size of kmc first among equally close ones
+        """
+        signature = model_signature(kmc.model)
+        conditions = self.conditions(kmc)
+        candidates = [(self.distance(conditions, entry['conditions']), tuple(entry['size']) != kmc.size, entry['file'],
+                       entry) for entry in self.entries() if entry['model'] == signature]
+        candidates = [candidate for candidate in candidates if max_distance is None or candidate[0] <= max_distance]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda candidate: candidate[:3])[3]
+
+    def add(self, kmc):
+        """
+        Store the lattice of kmc, replacing a stored lattice of the same
+        model, conditions and lattice size.
+
+        Returns:
+        --------
+        entry: dict
+        """
+        signature = model_signature(kmc.model)
+        conditions = self.conditions(kmc)
+        key = hashlib.sha1(json.dumps([signature, conditions, kmc.size], sort_keys=True).encode('utf-8'))
+        key = key.hexdigest()[:16]
+        entry = {
+            'model': signature,
+            'model_name': kmc.model.model_name,
+            'conditions': conditions,
+            'size': list(kmc.size),
+            'coverages': kmc.get_coverages(),
+            'kmc_step': int(kmc.kmc_step),
+            'file': key + '.npz',
+        }
+        save_snapshot(kmc, os.path.join(self.directory, entry['file']))
+        write_json(os.path.join(self.directory, key + '.json'), entry)
+        return entry
+
+    def seed(self, kmc, max_distance=None):
+        """
+        Reset kmc (time, counters) and occupy its lattice like the nearest
+        stored condition. The parameters and random numbers of kmc are kept.
+
+        Parameters:
+        -----------
+        kmc: NumpyKMC
+        max_distance: float or None
+
+        Returns:
+        --------
+        entry: dict or None
+            the entry kmc was seeded from, None if kmc keeps its empty lattice
+        """
+        entry = self.nearest(kmc, max_distance)
+        kmc.reset()
+        if entry is None:
+            return None
+        if tuple(entry['size']) == kmc.size:
+            if self.frozen is not None:
+                bits, lattice = self.frozen[1][entry['file']]
+            else:
+                meta, arrays = read_snapshot(os.path.join(self.directory, entry['file']))
+                bits, lattice = meta['bits'], arrays['lattice']
+            kmc.occupation = unpack_lattice(lattice, bits, len(kmc.occupation))
+            kmc.update_rates()
+        else:
+            kmc.set_coverages(entry['coverages'])
+        return entry
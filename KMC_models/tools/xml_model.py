@@ -0,0 +1,148 @@
+"""
+Read exported kmos xml files (version (0, 3)) into plain python objects,
+without requiring kmos.
+"""
+import ast
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+
+class XMLCoord(object):
+    """ site name, integer offset and layer of a coordinate """
+    __slots__ = ['name', 'offset', 'layer']
+
+    def __init__(self, name, offset, layer):
+        self.name = name
+        self.offset = offset
+        self.layer = layer
+
+
+class XMLCondition(object):
+    """ condition or action of a process """
+    __slots__ = ['coord', 'species']
+
+    def __init__(self, coord, species):
+        self.coord = coord
+        self.species = species
+
+
+class XMLBystander(object):
+    __slots__ = ['coord', 'allowed_species', 'flag']
+
+    def __init__(self, coord, allowed_species, flag):
+        self.coord = coord
+        self.allowed_species = allowed_species
+        self.flag = flag
+
+
+class XMLProcess(object):
+    """ process as exported by kmos, with otf_rate and bystander_list of the otf backend """
+
+    def __init__(self, name, rate_constant, condition_list, action_list,
+                 bystander_list=None, otf_rate=None, tof_count=None, enabled=True):
+        self.name = name
+        self.rate_constant = rate_constant
+        self.condition_list = condition_list
+        self.action_list = action_list
+        self.bystander_list = bystander_list or []
+        self.otf_rate = otf_rate
+        self.tof_count = tof_count or {}
+        self.enabled = enabled
+
+
+class XMLModel(object):
+    """
+    Species, parameters, lattice and processes of an exported kmos model.
+    """
+    error_messages = {
+        'version': 'Unsupported kmos xml version %s in %s',
+    }
+
+    def __init__(self):
+        self.model_name = None
+        self.species = []
+        self.default_species = None
+        self.parameters = {}
+        self.adjustable_parameters = []
+        self.cell = None
+        self.layers = []
+        self.sites = []
+        self.site_default_species = {}
+        self.processes = []
+
+    @classmethod
+    def from_file(cls, filename):
+        """
+        Parameters:
+        -----------
+        filename: str
+            path of the exported xml file, e.g. Rh111_model_with_lateral_interactions.xml
+
+        Returns:
+        --------
+        model: XMLModel
+        """
+        root = ET.parse(filename).getroot()
+        if root.get('version') != '(0, 3)':
+            raise ValueError(cls.error_messages['version'] % (root.get('version'), filename))
+
+        model = cls()
+        model.model_name = root.find('meta').get('model_name')
+
+        species_list = root.find('species_list')
+        model.default_species = species_list.get('default_species')
+        model.species = [species.get('name') for species in species_list.findall('species')]
+
+        for param in root.find('parameter_list').findall('parameter'):
+            model.parameters[param.get('name')] = param.get('value')
+            if param.get('adjustable') == 'True':
+                model.adjustable_parameters.append(param.get('name'))
+
+        lattice = root.find('lattice')
+        model.cell = np.array([float(x) for x in lattice.get('cell_size').split()]).reshape(3, 3)
+        for layer in lattice.findall('layer'):
+            model.layers.append(layer.get('name'))
+            for site in layer.findall('site'):
+                model.sites.append(site.get('type'))
+                default_species = site.get('default_species')
+                if default_species == 'default_species':
+                    default_species = model.default_species
+                model.site_default_species[site.get('type')] = default_species
+
+        for process in root.find('process_list').findall('process'):
+            tof_count = process.get('tof_count')
+            model.processes.append(XMLProcess(
+                name=process.get('name'),
+                rate_constant=process.get('rate_constant'),
+                condition_list=[cls.read_condition(item) for item in process.findall('condition')],
+                action_list=[cls.read_condition(item) for item in process.findall('action')],
+                bystander_list=[
+                    XMLBystander(
+                        cls.read_coord(item),
+                        item.get('allowed_species').split(),
+                        item.get('flag'),
+                    ) for item in process.findall('bystander')
+                ],
+                otf_rate=process.get('otf_rate'),
+                tof_count=ast.literal_eval(tof_count) if tof_count else {},
+                enabled=process.get('enabled') != 'False',
+            ))
+        return model
+
+    @staticmethod
+    def read_coord(element):
+        return XMLCoord(
+            element.get('coord_name'),
+            tuple(int(x) for x in element.get('coord_offset').split()),
+            element.get('coord_layer'),
+        )
+
+    @classmethod
+    def read_condition(cls, element):
+        return XMLCondition(cls.read_coord(element), element.get('species'))
+
+    @property
+    def tof_names(self):
+        """ sorted names of all tof counts """
+        return sorted(set(name for process in self.processes for name in process.tof_count))